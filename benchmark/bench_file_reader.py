@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Compare events/sec of the memory mapped BinLogFileReader with the former read()+BytesIO path.
+
+Usage: python benchmark/bench_file_reader.py [transactions]
+"""
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymysqlreplication.packet import BinLogPacketWrapper
+from utils.binlogfile2sql_util import BinLogFileReader, StringIOAdvance
+from binlog_generator import BenchTable, BenchConnection, generate_binlog
+
+
+def legacy_events(file_path, connection, allowed_events):
+    """The pre-mmap reader: two read() calls and a BytesIO copy per event"""
+    table_map = {}
+    with open(file_path, 'rb') as f:
+        f.read(4)
+        while True:
+            header = f.read(19)
+            if not header:
+                break
+            event_size = struct.unpack('<IcIIIH', header)[3]
+            body = f.read(event_size - 19)
+            pkt = StringIOAdvance()
+            pkt.write(b'0')
+            pkt.write(header)
+            pkt.write(body)
+            pkt.seek(0)
+            binlog_event = BinLogPacketWrapper(pkt, table_map, connection, False, allowed_events,
+                                               None, None, None, None, False, False)
+            if binlog_event.event is None:
+                continue
+            if binlog_event.event.__class__.__name__ == 'TableMapEvent':
+                table_map[binlog_event.event.table_id] = binlog_event.event.get_table()
+            yield binlog_event.event
+
+
+def consume(events):
+    count = 0
+    for binlog_event in events:
+        rows = getattr(binlog_event, 'rows', None)
+        if rows is not None:
+            len(rows)
+        count += 1
+    return count
+
+
+def run(label, make_events):
+    start = time.perf_counter()
+    count = consume(make_events())
+    elapsed = time.perf_counter() - start
+    print('%-8s %8d events %8.3fs %10.0f events/sec' % (label, count, elapsed, count / elapsed))
+    return count / elapsed
+
+
+def main(transactions=20000):
+    tables = [BenchTable('bench', 't%d' % i, 100 + i, varchar_columns=6, blob_columns=1) for i in range(4)]
+    connection = BenchConnection(tables)
+    fd, file_path = tempfile.mkstemp(prefix='mysql-bin.')
+    os.close(fd)
+    try:
+        generate_binlog(file_path, tables, transactions=transactions)
+        print('binlog size: %.1f MB' % (os.path.getsize(file_path) / 1024 / 1024))
+
+        def mmap_events():
+            stream = BinLogFileReader(file_path, ctl_connection_settings={'host': 'bench'}, log_pos=4,
+                                      pymysql_wrapper=lambda **kwargs: connection)
+            try:
+                for binlog_event in stream:
+                    yield binlog_event
+            finally:
+                stream.close()
+
+        allowed_events = BinLogFileReader(file_path)._allowed_event_list(None, None, True)
+        legacy = run('legacy', lambda: legacy_events(file_path, connection, allowed_events))
+        mapped = run('mmap', mmap_events)
+        print('speedup: %.2fx' % (mapped / legacy))
+    finally:
+        os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
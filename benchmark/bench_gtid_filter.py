@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Compare the time to extract a few transactions by --include-gtids from a binlog, checking the gtid of every
+row with the former string based is_want_gtid, and deciding once per transaction with GtidFilter, which lets
+BinLogFileReader skip the table map and rows events of the other transactions undecoded.
+
+Usage: python benchmark/bench_gtid_filter.py [transactions]   (the compressed case needs: pip install zstandard)
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymysqlreplication.event import GtidEvent
+from utils.binlog2sql_util import get_gtid_set
+from utils.binlogfile2sql_util import BinLogFileReader
+from binlog_generator import BenchTable, BenchConnection, generate_binlog
+
+GTID_SID = uuid.UUID('3e11fa47-71ca-11e1-9e33-c80aa9429562')
+
+
+def legacy_is_want_gtid(include_ranges, gtid):
+    """is_want_gtid before GtidFilter, on {uuid: ['1-10', '20']} of --include-gtids"""
+    uuid_str, txn = gtid.split(':')
+    txn = int(txn)
+    for txn_range in include_ranges.get(uuid_str, []):
+        txn_split = txn_range.split('-')
+        txn_min = int(txn_split[0])
+        txn_max = int(txn_split[1]) if len(txn_split) > 1 else txn_min
+        if txn_min <= txn <= txn_max:
+            return True
+    return False
+
+
+def read_rows(file_path, connection, gtid_filter=None, include_ranges=None):
+    """Number of the rows of the wanted transactions"""
+    count = 0
+    wanted = True
+    stream = BinLogFileReader(file_path, ctl_connection_settings={'host': 'bench'}, log_pos=4,
+                              pymysql_wrapper=lambda **kwargs: connection, gtid_filter=gtid_filter)
+    try:
+        for binlog_event in stream:
+            if isinstance(binlog_event, GtidEvent):
+                gtid = binlog_event.gtid
+                if gtid_filter is not None:
+                    wanted = gtid_filter.is_want_gtid(gtid)
+                continue
+            rows = getattr(binlog_event, 'rows', None)
+            if rows is None or not wanted:
+                continue
+            for _ in rows:
+                if include_ranges is not None and not legacy_is_want_gtid(include_ranges, gtid):
+                    continue
+                count += 1
+    finally:
+        stream.close()
+    return count
+
+
+def run(label, func):
+    start = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - start
+    print('%-24s %8d rows %8.3fs' % (label, count, elapsed))
+    return count, elapsed
+
+
+def main(transactions=20000):
+    tables = [BenchTable('bench', 't%d' % i, 100 + i, varchar_columns=6, blob_columns=1) for i in range(4)]
+    connection = BenchConnection(tables)
+    include_gtids = '%s:7:1000-1009:%d-%d' % (GTID_SID, transactions // 2, transactions // 2 + 4)
+    include_ranges = {str(GTID_SID): include_gtids.split(':')[1:]}
+    gtid_filter = get_gtid_set(include_gtids, '')
+    print('--include-gtids %s of %d transactions' % (include_gtids, transactions))
+
+    for compress in (False, True):
+        fd, file_path = tempfile.mkstemp(prefix='mysql-bin.')
+        os.close(fd)
+        try:
+            generate_binlog(file_path, tables, transactions=transactions, compress=compress, gtid_sid=GTID_SID.bytes)
+            kind = 'compressed' if compress else 'plain'
+            legacy_count, legacy = run('%s per row' % kind, lambda: read_rows(
+                file_path, connection, include_ranges=include_ranges))
+            count, filtered = run('%s per transaction' % kind, lambda: read_rows(
+                file_path, connection, gtid_filter=gtid_filter))
+            if count != legacy_count:
+                print('different rows: %d != %d' % (count, legacy_count))
+                sys.exit(1)
+            print('speedup: %.1fx' % (legacy / filtered))
+        finally:
+            os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Compare values/sec of fix_object on json columns of 1 KB, 10 KB and 100 KB, decoding the nested strings
+with chardet first (the old behaviour) and with ColumnDecoder (utf8, then the charset of the column).
+
+Usage: python benchmark/bench_json_decode.py [seconds per case]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chardet
+from utils.binlog2sql_util import ColumnDecoder, fix_object
+
+SIZES = [('1 KB', 1024), ('10 KB', 10 * 1024), ('100 KB', 100 * 1024)]
+
+
+class ChardetDecoder(ColumnDecoder):
+    """Guess the encoding of every string with chardet, like fix_object_bytes did before ColumnDecoder"""
+
+    def decode(self, value: bytes):
+        try:
+            return value.decode(chardet.detect(value).get('encoding') or 'utf8')
+        except Exception:
+            return None
+
+
+def make_json(size):
+    """A json document like the binlog parser gives it, strings are bytes"""
+    doc, length, i = {}, 2, 0
+    while length < size:
+        key = b'field_%d' % i
+        if i % 3 == 0:
+            value = [b'tag %d' % i, i, '标签 %d' % i]
+            value[2] = value[2].encode('utf8')
+        elif i % 3 == 1:
+            value = {b'name': ('用户 %d' % i).encode('utf8'), b'age': i % 90, b'note': b'plain ascii text %d' % i}
+        else:
+            value = b'a longer string value of the document, number %d' % i
+        doc[key] = value
+        length += len(key) + len(repr(value))
+        i += 1
+    return doc
+
+
+def run(decoder, doc, seconds):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        fix_object(doc, decoder=decoder)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main(seconds=2.0):
+    print('%-8s %14s %14s %9s' % ('json', 'chardet v/s', 'decoder v/s', 'speedup'))
+    for label, size in SIZES:
+        doc = make_json(size)
+        old = run(ChardetDecoder(), doc, seconds)
+        new = run(ColumnDecoder('utf8mb4'), doc, seconds)
+        print('%-8s %14.1f %14.1f %8.1fx' % (label, old, new, new / old))
+
+
+if __name__ == '__main__':
+    main(*map(float, sys.argv[1:]))
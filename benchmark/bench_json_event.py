@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Compare rows/sec of making the output of rows with the sql generator (concat_sql_from_binlog_event) and with the
+change events of --format jsonl (concat_json_from_binlog_event), which skips rendering sql.
+
+Usage: python benchmark/bench_json_event.py [rows] [columns]
+"""
+import copy
+import datetime
+import decimal
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+from utils.binlog2sql_util import concat_sql_from_binlog_event
+from utils.json_event import concat_json_from_binlog_event
+
+EVENTS = [('insert', WriteRowsEvent), ('update', UpdateRowsEvent), ('delete', DeleteRowsEvent)]
+
+
+def make_event(event_class):
+    binlog_event = event_class.__new__(event_class)
+    binlog_event.schema, binlog_event.table, binlog_event.primary_key = 'bench', 'wide', 'id'
+    binlog_event.timestamp = 1700000000
+    binlog_event.packet = types.SimpleNamespace(log_pos=4)
+    return binlog_event
+
+
+def make_values(i, columns):
+    values = {'id': i, 'amount': decimal.Decimal('%d.25' % i), 'created': datetime.datetime(2023, 1, 1, 12, 0, i % 60)}
+    values.update(('c%d' % c, None if c % 7 == 0 else 'value %d %d' % (i, c)) for c in range(columns - 3))
+    return values
+
+
+def make_rows(event_class, rows, columns):
+    if event_class is UpdateRowsEvent:
+        return [{'before_values': make_values(i, columns), 'after_values': dict(make_values(i, columns), c1='new')}
+                for i in range(rows)]
+    return [{'values': make_values(i, columns)} for i in range(rows)]
+
+
+def run(concat, event_class, sample, repeat=3):
+    """Best rows/sec of a few runs, the generators change the rows so every run gets a copy"""
+    binlog_event = make_event(event_class)
+    best = 0
+    for _ in range(repeat):
+        rows = copy.deepcopy(sample)
+        start = time.perf_counter()
+        for row in rows:
+            concat(binlog_event, row)
+        best = max(best, len(rows) / (time.perf_counter() - start))
+    return best
+
+
+def concat_sql(binlog_event, row):
+    return concat_sql_from_binlog_event(binlog_event, row=row, e_start_pos=4, binlog_gtid='uuid:1',
+                                        only_return_sql=False)
+
+
+def concat_json(binlog_event, row):
+    return concat_json_from_binlog_event(binlog_event, row=row, binlog_file='mysql-bin.000001', e_start_pos=4,
+                                         binlog_gtid='uuid:1')
+
+
+def main(rows=20000, columns=30):
+    print('%d rows of %d columns' % (rows, columns))
+    print('%-10s %14s %14s %8s' % ('event', 'sql rows/s', 'jsonl rows/s', 'speedup'))
+    for name, event_class in EVENTS:
+        sample = make_rows(event_class, rows, columns)
+        sql = run(concat_sql, event_class, sample)
+        jsonl = run(concat_json, event_class, sample)
+        print('%-10s %14.0f %14.0f %7.1fx' % (name, sql, jsonl, jsonl / sql))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
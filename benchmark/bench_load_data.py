@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Compare rows/sec of making the output of inserted rows with the sql generator (concat_sql_from_binlog_event) and
+with the data files of --format load-data (LoadDataWriter), whose rows are loaded by LOAD DATA instead of replayed
+one INSERT at a time. The gain of loading them is on the server and is not measured here.
+
+Usage: python benchmark/bench_load_data.py [rows] [columns]
+"""
+import copy
+import datetime
+import decimal
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymysqlreplication.row_event import WriteRowsEvent
+from utils.binlog2sql_util import concat_sql_from_binlog_event
+from utils.load_data import LoadDataWriter
+
+
+def make_event():
+    binlog_event = WriteRowsEvent.__new__(WriteRowsEvent)
+    binlog_event.schema, binlog_event.table, binlog_event.primary_key = 'bench', 'wide', 'id'
+    binlog_event.timestamp = 1700000000
+    binlog_event.packet = types.SimpleNamespace(log_pos=4)
+    return binlog_event
+
+
+def make_rows(rows, columns):
+    sample = []
+    for i in range(rows):
+        values = {'id': i, 'amount': decimal.Decimal('%d.25' % i),
+                  'created': datetime.datetime(2023, 1, 1, 12, 0, i % 60), 'data': bytes([i % 256]) * 16}
+        values.update(('c%d' % c, None if c % 7 == 0 else 'value\t%d %d' % (i, c)) for c in range(columns - 4))
+        sample.append({'values': values})
+    return sample
+
+
+def run(write, sample, repeat=3):
+    """Best rows/sec of a few runs, the generators change the rows so every run gets a copy"""
+    binlog_event = make_event()
+    best = 0
+    for _ in range(repeat):
+        rows = copy.deepcopy(sample)
+        data_dir = tempfile.mkdtemp(prefix='bench_load_data_')
+        try:
+            start = time.perf_counter()
+            write(binlog_event, rows, data_dir)
+            best = max(best, len(rows) / (time.perf_counter() - start))
+        finally:
+            shutil.rmtree(data_dir)
+    return best
+
+
+def write_sql(binlog_event, rows, data_dir):
+    with open(os.path.join(data_dir, 'result.sql'), 'w', encoding='utf8') as f:
+        for row in rows:
+            f.write(concat_sql_from_binlog_event(binlog_event, row=row, e_start_pos=4) + '\n')
+
+
+def write_load_data(binlog_event, rows, data_dir):
+    load_data = LoadDataWriter(data_dir)
+    with open(os.path.join(data_dir, 'result.sql'), 'w', encoding='utf8') as f:
+        for row in rows:
+            for sql, _, _ in load_data.add(binlog_event, row, 'mysql-bin.000001', 4):
+                f.write(sql + '\n')
+        for sql, _, _ in load_data.end():
+            f.write(sql + '\n')
+
+
+def main(rows=20000, columns=30):
+    print('%d inserted rows of %d columns' % (rows, columns))
+    sql = run(write_sql, make_rows(rows, columns))
+    load_data = run(write_load_data, make_rows(rows, columns))
+    print('%-12s %14.0f rows/s' % ('sql', sql))
+    print('%-12s %14.0f rows/s' % ('load-data', load_data))
+    print('speedup: %.1fx' % (load_data / sql))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
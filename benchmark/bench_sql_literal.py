@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Check that utils.sql_literal renders the same sql as pymysql cursor.mogrify and compare their rows/sec.
+
+The golden corpus covers every value type the binlog events give, the check runs with and without the
+NO_BACKSLASH_ESCAPES sql_mode and exits with 1 on the first difference.
+
+Usage: python benchmark/bench_sql_literal.py [rows]
+"""
+import datetime
+import decimal
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymysql.connections import Connection
+from pymysql.constants import SERVER_STATUS
+from utils.sql_literal import render_sql
+
+GOLDEN_VALUES = [
+    None, 0, 1, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 64 - 1, True, False,
+    0.0, -1.5, 1e300, 3.141592653589793, float('inf'),
+    decimal.Decimal('0'), decimal.Decimal('-12345.67890'), decimal.Decimal('1E+10'), decimal.Decimal('0.000001'),
+    '', 'plain', "it's", 'say "hi"', 'back\\slash', 'new\nline', 'cr\rlf', 'nul\0byte', 'ctrl-z\x1a', '\t tab',
+    '中文字符', 'emoji \U0001f600', "mix '\\\n\r\0\x1a\" 中", '0x1234', '%s %% %d', '\udcff',
+    b'', b'bytes', b"qu'ote", b'\x00\x01\x7f\x80\xff', b'\\', bytearray(b'array\n'),
+    datetime.datetime(2021, 3, 4, 5, 6, 7), datetime.datetime(2021, 3, 4, 5, 6, 7, 890),
+    datetime.datetime(1, 1, 1), datetime.datetime(9999, 12, 31, 23, 59, 59, 999999),
+    datetime.datetime(2021, 3, 4, 5, 6, 7, tzinfo=datetime.timezone.utc),
+    datetime.date(2021, 3, 4), datetime.date(1, 1, 1),
+    datetime.time(0, 0), datetime.time(23, 59, 59, 1), datetime.time(1, 2, 3, tzinfo=datetime.timezone.utc),
+    datetime.timedelta(0), datetime.timedelta(hours=838, minutes=59, seconds=59),
+    datetime.timedelta(days=-1, seconds=1), datetime.timedelta(seconds=1, microseconds=5),
+    {'a', 'b'}, frozenset(['x']), (1, 'a', None), [1, 2.5, "q'"],
+]
+
+
+class MogrifyConnection(Connection):
+    """A pymysql connection which is never connected, only for cursor.mogrify"""
+
+    def __init__(self, no_backslash_escapes=False):
+        super(MogrifyConnection, self).__init__(charset='utf8mb4', defer_connect=True)
+        self.server_status = SERVER_STATUS.SERVER_STATUS_NO_BACKSLASH_ESCAPES if no_backslash_escapes else 0
+
+
+def check_golden():
+    for no_backslash_escapes in (False, True):
+        cursor = MogrifyConnection(no_backslash_escapes).cursor()
+        for values in [[value] for value in GOLDEN_VALUES] + [GOLDEN_VALUES]:
+            template = 'INSERT INTO `db`.`tb` VALUES (%s);' % ', '.join(['%s'] * len(values))
+            expected = cursor.mogrify(template, values)
+            got = render_sql(template, values, no_backslash_escapes)
+            if got != expected:
+                print('different sql of %r (no_backslash_escapes=%s):\n  mogrify: %r\n  render:  %r' % (
+                    values, no_backslash_escapes, expected, got))
+                sys.exit(1)
+    print('golden corpus: %d values, same sql as cursor.mogrify' % len(GOLDEN_VALUES))
+
+
+def make_rows(rows):
+    now = datetime.datetime(2021, 3, 4, 5, 6, 7)
+    return [[i, 'name %d' % i, "it's row %d" % i, None, decimal.Decimal('%d.25' % i), now, now.date(),
+             i * 1.5, 'a longer text value with some words in it, row %d' % i, None] for i in range(rows)]
+
+
+def main(rows=200000):
+    check_golden()
+    sample = make_rows(rows)
+    template = 'INSERT INTO `db`.`tb`(%s) VALUES (%s);' % (
+        ', '.join('`c%d`' % i for i in range(len(sample[0]))), ', '.join(['%s'] * len(sample[0])))
+    cursor = MogrifyConnection().cursor()
+
+    start = time.perf_counter()
+    for values in sample:
+        cursor.mogrify(template, values)
+    mogrify_rate = rows / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for values in sample:
+        render_sql(template, values)
+    render_rate = rows / (time.perf_counter() - start)
+
+    print('%-16s %12s' % ('renderer', 'rows/s'))
+    print('%-16s %12.0f' % ('cursor.mogrify', mogrify_rate))
+    print('%-16s %12.0f %7.2fx' % ('render_sql', render_rate, render_rate / mogrify_rate))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Compare the time to make and write statements into a pipe whose reader stalls now and then, writing every
+statement on the parsing thread like the former print(sql), and handing chunks of them to the background thread of
+SqlWriter, which keeps parsing while the reader stalls. Without stalls there is little to gain on one cpu.
+
+Usage: python benchmark/bench_sql_writer.py [statements]
+"""
+import io
+import os
+import subprocess
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymysqlreplication.row_event import WriteRowsEvent
+from utils.binlog2sql_util import concat_sql_from_binlog_event
+from utils.sql_writer import SqlWriter
+
+
+def statements(count, columns=16):
+    """The sql of count inserted rows, made by the sql generator like binlog2sql does"""
+    binlog_event = WriteRowsEvent.__new__(WriteRowsEvent)
+    binlog_event.schema, binlog_event.table, binlog_event.primary_key = 'bench', 't1', 'id'
+    binlog_event.timestamp = 1700000000
+    binlog_event.packet = types.SimpleNamespace(log_pos=4)
+    for i in range(count):
+        values = {'id': i}
+        values.update(('c%d' % c, 'value %d %d' % (i, c)) for c in range(columns - 1))
+        yield concat_sql_from_binlog_event(binlog_event, row={'values': values}, e_start_pos=4)
+
+
+def pipe(stall=0.05):
+    """A text stream into a process which stalls for stall seconds after every MB it reads, like binlog2sql ... |
+    mysql waiting for its commits"""
+    reader = subprocess.Popen([sys.executable, '-c', 'import sys, hashlib, time\n'
+                               'h, size = hashlib.md5(), 0\n'
+                               'for data in iter(lambda: sys.stdin.buffer.read(65536), b""):\n'
+                               '    h.update(data)\n'
+                               '    size += len(data)\n'
+                               '    if size >= 1048576:\n'
+                               '        size = 0\n'
+                               '        time.sleep(%s)\n'
+                               'print(h.hexdigest())' % stall], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    return reader, io.TextIOWrapper(reader.stdin, encoding='utf8')
+
+
+def write_inline(f, count):
+    for sql in statements(count):
+        f.write(sql + '\n')
+
+
+def write_background(f, count):
+    with SqlWriter(f) as sql_writer:
+        for sql in statements(count):
+            sql_writer.write(sql)
+
+
+def run(label, func, count):
+    reader, f = pipe()
+    start = time.perf_counter()
+    func(f, count)
+    f.close()
+    digest = reader.stdout.read().strip()
+    reader.wait()
+    elapsed = time.perf_counter() - start
+    print('%-24s %8.3fs' % (label, elapsed))
+    return digest, elapsed
+
+
+def main(count=50000):
+    print('%d statements into a pipe stalling after every MB' % count)
+    inline_digest, inline = run('print per statement', write_inline, count)
+    digest, background = run('background writer', write_background, count)
+    if digest != inline_digest:
+        print('different output')
+        sys.exit(1)
+    print('speedup: %.1fx' % (inline / background))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Compare the time to write the sql of --table-per-file, opening the result file of the table for every
+statement with the former save_result_sql, and keeping the files open in the LRU of TableFileWriter.
+
+Usage: python benchmark/bench_table_per_file.py [statements] [tables] [max open files]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.binlog2sql_util import save_result_sql, dt_now, TableFileWriter, MAX_OPEN_RESULT_FILES
+
+
+def statements(count, tables):
+    for i in range(count):
+        table = 't%d' % (i % tables)
+        yield ('INSERT INTO `bench`.`%s`(`id`, `c`) VALUES (%d, \'value of row %d\');' % (table, i, i),
+               'bench', table)
+
+
+def write_per_statement(result_dir, count, tables):
+    for sql, db, table in statements(count, tables):
+        filename = db + '.' + table + f'.{dt_now()}.sql'
+        save_result_sql(os.path.join(result_dir, filename), sql + '\n')
+
+
+def write_lru(result_dir, count, tables, max_open):
+    writer = TableFileWriter(result_dir, max_open=max_open)
+    try:
+        for sql, db, table in statements(count, tables):
+            writer.write(db + '.' + table, sql + '\n')
+    finally:
+        writer.close()
+
+
+def read_dir(result_dir):
+    result = {}
+    for filename in os.listdir(result_dir):
+        with open(os.path.join(result_dir, filename), 'rb') as f:
+            result[filename] = f.read()
+    return result
+
+
+def run(label, func, result_dir):
+    start = time.perf_counter()
+    func(result_dir)
+    elapsed = time.perf_counter() - start
+    print('%-24s %8.3fs' % (label, elapsed))
+    return elapsed
+
+
+def main(count=200000, tables=16, max_open=MAX_OPEN_RESULT_FILES):
+    print('%d statements into %d tables, at most %d open files' % (count, tables, max_open))
+    root = tempfile.mkdtemp(prefix='bench_table_per_file.')
+    try:
+        legacy_dir, lru_dir = os.path.join(root, 'legacy'), os.path.join(root, 'lru')
+        os.makedirs(legacy_dir)
+        os.makedirs(lru_dir)
+        legacy = run('open per statement', lambda d: write_per_statement(d, count, tables), legacy_dir)
+        lru = run('lru of open files', lambda d: write_lru(d, count, tables, max_open), lru_dir)
+        if read_dir(legacy_dir) != read_dir(lru_dir):
+            print('different result files')
+            sys.exit(1)
+        print('speedup: %.1fx' % (legacy / lru))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
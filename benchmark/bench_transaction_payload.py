@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Compare BinLogFileReader throughput on the same workload written plain and with binlog_transaction_compression.
+
+Usage: python benchmark/bench_transaction_payload.py [transactions]   (needs: pip install zstandard)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.binlogfile2sql_util import BinLogFileReader
+from binlog_generator import BenchTable, BenchConnection, generate_binlog
+
+
+def consume(file_path, connection):
+    count = 0
+    stream = BinLogFileReader(file_path, ctl_connection_settings={'host': 'bench'}, log_pos=4,
+                              pymysql_wrapper=lambda **kwargs: connection)
+    try:
+        for binlog_event in stream:
+            rows = getattr(binlog_event, 'rows', None)
+            if rows is not None:
+                len(rows)
+            count += 1
+    finally:
+        stream.close()
+    return count
+
+
+def run(label, file_path, connection):
+    size = os.path.getsize(file_path) / 1024 / 1024
+    start = time.perf_counter()
+    count = consume(file_path, connection)
+    elapsed = time.perf_counter() - start
+    print('%-12s %7.1f MB %8d events %8.3fs %10.0f events/sec %7.1f MB/sec' % (
+        label, size, count, elapsed, count / elapsed, size / elapsed))
+    return count / elapsed
+
+
+def main(transactions=20000):
+    tables = [BenchTable('bench', 't%d' % i, 100 + i, varchar_columns=6, blob_columns=1) for i in range(4)]
+    connection = BenchConnection(tables)
+    file_paths = []
+    try:
+        for compress in (False, True):
+            fd, file_path = tempfile.mkstemp(prefix='mysql-bin.')
+            os.close(fd)
+            file_paths.append(file_path)
+            generate_binlog(file_path, tables, transactions=transactions, compress=compress)
+
+        plain = run('plain', file_paths[0], connection)
+        compressed = run('compressed', file_paths[1], connection)
+        print('compressed/plain events/sec: %.2fx' % (compressed / plain))
+    finally:
+        for file_path in file_paths:
+            os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
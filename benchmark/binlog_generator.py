@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Write small synthetic binlog files for the benchmarks, no MySQL instance is needed."""
+import struct
+import time
+import uuid
+
+from pymysqlreplication.constants.BINLOG import (
+    FORMAT_DESCRIPTION_EVENT, GTID_LOG_EVENT, QUERY_EVENT, TABLE_MAP_EVENT, WRITE_ROWS_EVENT_V2,
+    UPDATE_ROWS_EVENT_V2, DELETE_ROWS_EVENT_V2, XID_EVENT, ROTATE_EVENT)
+from pymysqlreplication.constants import FIELD_TYPE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TRANSACTION_PAYLOAD_EVENT = 40
+
+SERVER_ID = 1
+
+
+def lenenc_int(value):
+    if value < 251:
+        return struct.pack('<B', value)
+    elif value < 2 ** 16:
+        return b'\xfc' + struct.pack('<H', value)
+    elif value < 2 ** 24:
+        return b'\xfd' + struct.pack('<I', value)[:3]
+    return b'\xfe' + struct.pack('<Q', value)
+
+
+class BenchTable(object):
+    """A table made of one int primary key followed by varchar and blob columns."""
+
+    def __init__(self, schema, table, table_id, varchar_columns=8, blob_columns=0):
+        self.schema = schema
+        self.table = table
+        self.table_id = table_id
+        self.columns = [('id', FIELD_TYPE.LONG)]
+        self.columns += [('c%d' % i, FIELD_TYPE.VARCHAR) for i in range(varchar_columns)]
+        self.columns += [('b%d' % i, FIELD_TYPE.BLOB) for i in range(blob_columns)]
+
+    def column_schemas(self):
+        column_schemas = []
+        for i, (name, column_type) in enumerate(self.columns):
+            if column_type == FIELD_TYPE.LONG:
+                column_schemas.append({
+                    'COLUMN_NAME': name, 'COLLATION_NAME': None, 'CHARACTER_SET_NAME': None,
+                    'COLUMN_COMMENT': '', 'COLUMN_TYPE': 'int(11)', 'COLUMN_KEY': 'PRI', 'ORDINAL_POSITION': i + 1,
+                })
+            elif column_type == FIELD_TYPE.VARCHAR:
+                column_schemas.append({
+                    'COLUMN_NAME': name, 'COLLATION_NAME': 'utf8mb4_general_ci', 'CHARACTER_SET_NAME': 'utf8mb4',
+                    'COLUMN_COMMENT': '', 'COLUMN_TYPE': 'varchar(64)', 'COLUMN_KEY': '', 'ORDINAL_POSITION': i + 1,
+                })
+            else:
+                column_schemas.append({
+                    'COLUMN_NAME': name, 'COLLATION_NAME': None, 'CHARACTER_SET_NAME': None,
+                    'COLUMN_COMMENT': '', 'COLUMN_TYPE': 'blob', 'COLUMN_KEY': '', 'ORDINAL_POSITION': i + 1,
+                })
+        return column_schemas
+
+    def metadata(self):
+        metadata = b''
+        for _, column_type in self.columns:
+            if column_type == FIELD_TYPE.VARCHAR:
+                metadata += struct.pack('<H', 64 * 4)
+            elif column_type == FIELD_TYPE.BLOB:
+                metadata += struct.pack('<B', 2)
+        return metadata
+
+    def row_image(self, row):
+        """row is a sequence of values in column order, None means NULL"""
+        null_bitmap = bytearray((len(self.columns) + 7) // 8)
+        body = b''
+        for i, ((_, column_type), value) in enumerate(zip(self.columns, row)):
+            if value is None:
+                null_bitmap[i // 8] |= 1 << (i % 8)
+            elif column_type == FIELD_TYPE.LONG:
+                body += struct.pack('<i', value)
+            elif column_type == FIELD_TYPE.VARCHAR:
+                value = value.encode('utf8')
+                body += struct.pack('<H', len(value)) + value
+            else:
+                body += struct.pack('<H', len(value)) + value
+        return bytes(null_bitmap) + body
+
+
+class BinlogGenerator(object):
+    def __init__(self, file_path, timestamp=None, gtid_sid=None, compress=False):
+        """compress writes every transaction as a zstd TRANSACTION_PAYLOAD_EVENT, like binlog_transaction_compression"""
+        self.file_path = file_path
+        self.compress = compress
+        self.timestamp = int(timestamp or time.time())
+        self.gtid_sid = gtid_sid or uuid.uuid4().bytes
+        self.gno = 0
+        self.xid = 0
+        self._f = open(file_path, 'wb')
+        self._f.write(b'\xfebin')
+        self.pos = 4
+        self.format_description()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def event_bytes(self, event_type, body, log_pos=None):
+        event_size = 19 + len(body)
+        if log_pos is None:
+            log_pos = self.pos + event_size
+        header = struct.pack('<IBIIIH', self.timestamp, event_type, SERVER_ID, event_size, log_pos, 0)
+        return header + body
+
+    def write_event(self, event_type, body):
+        data = self.event_bytes(event_type, body)
+        self._f.write(data)
+        self.pos += len(data)
+
+    def format_description(self):
+        body = struct.pack('<H', 4) + b'5.7.32-log'.ljust(50, b'\x00') + struct.pack('<I', self.timestamp)
+        body += struct.pack('<B', 19) + bytes(38) + b'\x00'
+        self.write_event(FORMAT_DESCRIPTION_EVENT, body)
+
+    def gtid(self):
+        self.gno += 1
+        self.write_event(GTID_LOG_EVENT, b'\x01' + self.gtid_sid + struct.pack('<Q', self.gno) + bytes(17))
+
+    def query_body(self, query, schema=''):
+        schema = schema.encode('utf8')
+        return struct.pack('<IIBHH', 1, 0, len(schema), 0, 0) + schema + b'\x00' + query.encode('utf8')
+
+    def query(self, query, schema=''):
+        self.write_event(QUERY_EVENT, self.query_body(query, schema))
+
+    def table_map_body(self, table):
+        schema = table.schema.encode('utf8')
+        name = table.table.encode('utf8')
+        metadata = table.metadata()
+        body = struct.pack('<Q', table.table_id)[:6] + struct.pack('<H', 1)
+        body += struct.pack('<B', len(schema)) + schema + b'\x00' + struct.pack('<B', len(name)) + name + b'\x00'
+        body += lenenc_int(len(table.columns)) + bytes(column_type for _, column_type in table.columns)
+        body += lenenc_int(len(metadata)) + metadata + bytes((len(table.columns) + 7) // 8)
+        return body
+
+    def table_map(self, table):
+        self.write_event(TABLE_MAP_EVENT, self.table_map_body(table))
+
+    def rows_body(self, table, rows, update=False):
+        present = b'\xff' * ((len(table.columns) + 7) // 8)
+        body = struct.pack('<Q', table.table_id)[:6] + struct.pack('<HH', 1, 2)
+        body += lenenc_int(len(table.columns)) + present
+        if update:
+            body += present
+        for row in rows:
+            if update:
+                body += table.row_image(row[0]) + table.row_image(row[1])
+            else:
+                body += table.row_image(row)
+        return body
+
+    def write_rows(self, table, rows):
+        self.write_event(WRITE_ROWS_EVENT_V2, self.rows_body(table, rows))
+
+    def update_rows(self, table, rows):
+        self.write_event(UPDATE_ROWS_EVENT_V2, self.rows_body(table, rows, update=True))
+
+    def delete_rows(self, table, rows):
+        self.write_event(DELETE_ROWS_EVENT_V2, self.rows_body(table, rows))
+
+    def xid_body(self):
+        self.xid += 1
+        return struct.pack('<Q', self.xid)
+
+    def commit(self):
+        self.write_event(XID_EVENT, self.xid_body())
+
+    def transaction_payload(self, events):
+        """events are (event_type, body) pairs, inner events have no log_pos"""
+        payload = b''.join(self.event_bytes(event_type, body, log_pos=0) for event_type, body in events)
+        uncompressed_size = len(payload)
+        payload = zstandard.ZstdCompressor().compress(payload)
+        header = b''
+        # compression type 0 is zstd
+        for field_type, value in ((2, 0), (3, uncompressed_size), (1, len(payload))):
+            value = lenenc_int(value)
+            header += lenenc_int(field_type) + lenenc_int(len(value)) + value
+        self.write_event(TRANSACTION_PAYLOAD_EVENT, header + b'\x00' + payload)
+
+    def rotate(self, next_binlog):
+        self.write_event(ROTATE_EVENT, struct.pack('<Q', 4) + next_binlog.encode('utf8'))
+
+    def transaction(self, table, rows, kind='insert'):
+        self.gtid()
+        if kind == 'insert':
+            rows_event = (WRITE_ROWS_EVENT_V2, self.rows_body(table, rows))
+        elif kind == 'update':
+            rows_event = (UPDATE_ROWS_EVENT_V2, self.rows_body(table, rows, update=True))
+        else:
+            rows_event = (DELETE_ROWS_EVENT_V2, self.rows_body(table, rows))
+        events = [(QUERY_EVENT, self.query_body('BEGIN')), (TABLE_MAP_EVENT, self.table_map_body(table)), rows_event,
+                  (XID_EVENT, self.xid_body())]
+        if self.compress:
+            self.transaction_payload(events)
+        else:
+            for event_type, body in events:
+                self.write_event(event_type, body)
+
+
+def sample_row(table, i):
+    row = [i]
+    for name, column_type in table.columns[1:]:
+        if column_type == FIELD_TYPE.VARCHAR:
+            row.append('%s-value-%d' % (name, i))
+        else:
+            row.append(bytes([i % 256]) * 32)
+    return row
+
+
+def generate_binlog(file_path, tables, transactions=10000, rows_per_transaction=5, timestamp=None, compress=False,
+                    gtid_sid=None):
+    """Round robin insert/update/delete transactions over tables, returns the number of events written"""
+    events = 2
+    with BinlogGenerator(file_path, timestamp=timestamp, gtid_sid=gtid_sid, compress=compress) as generator:
+        for i in range(transactions):
+            table = tables[i % len(tables)]
+            base = i * rows_per_transaction
+            rows = [sample_row(table, base + j) for j in range(rows_per_transaction)]
+            kind = ('insert', 'update', 'delete')[i % 3]
+            if kind == 'update':
+                rows = [(row, sample_row(table, row[0] + 1)) for row in rows]
+            generator.transaction(table, rows, kind)
+            events += 5
+        generator.rotate('mysql-bin.999999')
+    return events
+
+
+class BenchConnection(object):
+    """Answers the few calls BinLogFileReader makes on its control connection"""
+    charset = 'utf8mb4'
+
+    def __init__(self, tables):
+        self.tables = {(t.schema, t.table): t.column_schemas() for t in tables}
+
+    @property
+    def _get_table_information(self):
+        return self.get_table_information
+
+    @_get_table_information.setter
+    def _get_table_information(self, value):
+        # the reader installs its own information_schema lookup here, keep answering from memory
+        pass
+
+    def get_table_information(self, schema, table):
+        return self.tables.get((schema, table), [])
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        return 0
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        pass
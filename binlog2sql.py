@@ -5,12 +5,17 @@ import sys
 import datetime
 import pymysql
 import os
-from pymysqlreplication import BinLogStreamReader
-from pymysqlreplication.event import QueryEvent, RotateEvent, FormatDescriptionEvent, GtidEvent
+from pymysqlreplication.event import QueryEvent, RotateEvent, FormatDescriptionEvent, GtidEvent, XidEvent
 from utils.binlog2sql_util import command_line_args, concat_sql_from_binlog_event, is_dml_event, event_type, \
-    get_gtid_set, is_want_gtid, save_result_sql, dt_now, handle_rollback_sql, get_max_gtid, \
-    remove_max_gtid, connect2sync_mysql
+    get_gtid_set, handle_rollback_sql, TableFileWriter, get_max_gtid, \
+    remove_max_gtid, connect2sync_mysql, preload_table_information, is_no_backslash_escapes
 from utils.other_utils import create_unique_file, temp_open, split_condition, merge_rename_args, logger
+from utils.transaction_payload import PayloadBinLogStreamReader
+from utils.sql_batch import SqlBatch, DEFAULT_EXTENDED_INSERT_SIZE
+from utils.net_changes import NetChanges, DEFAULT_COMPACT_MEMORY_ROWS
+from utils.sql_writer import SqlWriter
+from utils.json_event import concat_json_from_binlog_event
+from utils.load_data import LoadDataWriter
 
 
 # noinspection PyUnresolvedReferences
@@ -23,7 +28,10 @@ class Binlog2sql(object):
                  ignore_columns=None, replace=False, insert_ignore=False, remove_not_update_col=False,
                  result_file=None, result_dir=None, table_per_file=False, date_prefix=False,
                  include_gtids=None, exclude_gtids=None, update_to_replace=False, keep_not_update_col: list = None,
-                 chunk_size=1000, tmp_dir='tmp', no_date=False, where=None, args=None):
+                 chunk_size=1000, tmp_dir='tmp', no_date=False, where=None, preload_schema=False, detect_charset=False,
+                 extended_insert=False, extended_insert_size=DEFAULT_EXTENDED_INSERT_SIZE, merge_transactions=False,
+                 batch_delete=False, compact=False, compact_memory_rows=DEFAULT_COMPACT_MEMORY_ROWS,
+                 wrap_transaction=False, output_format='sql', args=None):
         """
         conn_setting: {'host': 127.0.0.1, 'port': 3306, 'user': user, 'passwd': passwd, 'charset': 'utf8'}
         """
@@ -68,15 +76,18 @@ class Binlog2sql(object):
         self.table_per_file = table_per_file
         self.date_prefix = date_prefix
         self.gtid_set = get_gtid_set(include_gtids, exclude_gtids)
-        self.gtid_max_dict = get_max_gtid(self.gtid_set.get('include', {}))
+        self.gtid_max_dict = get_max_gtid(self.gtid_set.include)
         self.update_to_replace = update_to_replace
         self.keep_not_update_col = keep_not_update_col if keep_not_update_col is not None else []
         self.no_date = no_date
         self.f_result_sql_file = ''
         self.chunk_size = chunk_size
         self.tmp_dir = tmp_dir
+        self.preload_schema = preload_schema
+        self.detect_charset = detect_charset
         if not os.path.exists(tmp_dir):
             os.makedirs(tmp_dir, exist_ok=True)
+        self.net_changes = NetChanges(tmp_dir, compact_memory_rows) if compact else None
 
         self.filter_conditions = split_condition(where) if where is not None else []
         if remove_not_update_col and self.filter_conditions:
@@ -117,12 +128,29 @@ class Binlog2sql(object):
             self.server_id = cursor.fetchone()[0]
             if not self.server_id:
                 raise ValueError('missing server_id in %s:%s' % (self.conn_setting['host'], self.conn_setting['port']))
+        self.no_backslash_escapes = is_no_backslash_escapes(self.connection)
+        self.sql_batch = SqlBatch(extended_insert_size, merge_transactions, reverse=flashback,
+                                  extended_insert=extended_insert, batch_delete=batch_delete) \
+            if extended_insert or batch_delete else None
+        # --wrap-transaction, in_transaction is set from the BEGIN to the COMMIT of a transaction of the binlog,
+        # begin_written once BEGIN; of it is written
+        self.wrap_transaction = wrap_transaction
+        self.in_transaction = self.begin_written = False
+        # sql, jsonl: a json line of every row change instead of its sql, see utils.json_event, or load-data: the
+        # inserted rows go to data files loaded by LOAD DATA, see utils.load_data
+        self.output_format = output_format
 
     def process_binlog(self):
-        stream = BinLogStreamReader(connection_settings=self.conn_setting, server_id=self.server_id,
-                                    log_file=self.start_file, log_pos=self.start_pos, only_schemas=self.only_schemas,
-                                    only_tables=self.only_tables, resume_stream=True, blocking=True,
-                                    ignored_schemas=self.ignore_databases, ignored_tables=self.ignore_tables)
+        preloaded_tables = preload_table_information(
+            self.connection, self.only_schemas, self.only_tables, self.ignore_databases, self.ignore_tables
+        ) if self.preload_schema else None
+        # the values are escaped locally, the connection is not needed while parsing
+        self.connection.close()
+        stream = PayloadBinLogStreamReader(connection_settings=self.conn_setting, server_id=self.server_id,
+                                           log_file=self.start_file, log_pos=self.start_pos,
+                                           only_schemas=self.only_schemas, only_tables=self.only_tables,
+                                           resume_stream=True, blocking=True, ignored_schemas=self.ignore_databases,
+                                           ignored_tables=self.ignore_tables, preloaded_tables=preloaded_tables)
         mode = 'w'
         if self.result_file:
             result_sql_file = self.result_file
@@ -130,21 +158,36 @@ class Binlog2sql(object):
             self.f_result_sql_file = open(result_sql_file, mode)
         elif self.table_per_file:
             logger.info(f'Saving table per file into dir: [{self.result_dir}]')
+        self.table_file_writer = TableFileWriter(self.result_dir, self.date_prefix, self.no_date) \
+            if self.table_per_file else None
+        self.load_data = LoadDataWriter(
+            self.result_dir, flashback=self.flashback, no_pk=self.no_pk, replace=self.replace,
+            insert_ignore=self.insert_ignore, rename_db_dict=self.rename_db_dict, rename_tb_dict=self.rename_tb_dict,
+            ignore_columns=self.ignore_columns, filter_conditions=self.filter_conditions,
+            detect_charset=self.detect_charset, no_backslash_escapes=self.no_backslash_escapes,
+        ) if self.output_format == 'load-data' else None
+        # the sql of stdout and the result file is written on a background thread
+        self.sql_writer = SqlWriter(self.f_result_sql_file or sys.stdout)
 
         binlog_gtid = ''
         gtid_set = True if self.gtid_set else False
+        # whether the rows of the current transaction are wanted by the gtid filter, decided at its gtid event
+        gtid_wanted = True
         flag_last_event = False
         e_start_pos, last_pos = stream.log_pos, stream.log_pos
         tmp_file = create_unique_file('%s.%s' % (self.conn_setting['host'], self.conn_setting['port']))
         tmp_file = os.path.join(self.tmp_dir, tmp_file)
-        flashback_warn_flag = 1
+        self.flashback_warn_flag = 1
 
         sync_conn = ''
         sync_cursor = ''
-        with temp_open(tmp_file, "w") as f_tmp, self.connection as cursor:
+        with temp_open(tmp_file, "w") as f_tmp, self.sql_writer:
             if self.args and self.args.sync:
                 sync_conn = connect2sync_mysql(self.args)
                 sync_cursor = sync_conn.cursor()
+                if self.sql_batch:
+                    sync_cursor.execute('SELECT @@max_allowed_packet')
+                    self.sql_batch.fit_packet(sync_cursor.fetchone()[0])
             for binlog_event in stream:
                 # 返回的 EVENT 顺序
                 # RotateEvent
@@ -161,6 +204,9 @@ class Binlog2sql(object):
                 # XidEvent
                 # GtidEvent
                 # ...
+                if self.table_file_writer is not None and isinstance(binlog_event, RotateEvent):
+                    # flush the result files at every binlog file, and take the date of their names again
+                    self.table_file_writer.rotate()
                 if not self.stop_never:
                     try:
                         event_time = datetime.datetime.fromtimestamp(binlog_event.timestamp)
@@ -184,9 +230,12 @@ class Binlog2sql(object):
 
                 if isinstance(binlog_event, QueryEvent) and binlog_event.query == 'BEGIN':
                     e_start_pos = last_pos
+                    self.in_transaction = True
 
                 if isinstance(binlog_event, GtidEvent):
                     binlog_gtid = str(binlog_event.gtid)
+                    self.in_transaction = False
+                    gtid_wanted = not gtid_set or self.gtid_set.is_want_gtid(binlog_gtid)
                     if self.gtid_max_dict:
                         remove_max_gtid(self.gtid_max_dict, binlog_gtid)
                         if not self.gtid_max_dict:
@@ -194,124 +243,87 @@ class Binlog2sql(object):
                                         'value, or may be you give a invalid gtid sets to args --include-gtid')
                             break
 
+                if self.load_data is not None and isinstance(binlog_event, QueryEvent) and \
+                        binlog_event.query not in ('BEGIN', 'COMMIT'):
+                    # a ddl may change the columns of the tables, the rows loaded so far go first
+                    self.save_statements(self.load_data.end(), f_tmp)
+
+                if self.net_changes is not None and isinstance(binlog_event, QueryEvent) and \
+                        binlog_event.query not in ('BEGIN', 'COMMIT'):
+                    # rows are not merged across a ddl, the columns of the table may have changed
+                    if not self.save_net_changes(f_tmp, sync_conn, sync_cursor):
+                        logger.error(f'Exit at binlog file {stream.log_file} end pos {binlog_event.packet.log_pos}')
+                        break
+
                 if isinstance(binlog_event, QueryEvent) and not self.only_dml:
-                    if binlog_gtid and gtid_set and not is_want_gtid(self.gtid_set, binlog_gtid):
+                    if not gtid_wanted:
                         continue
 
-                    sql, db, table = concat_sql_from_binlog_event(
-                        cursor=cursor, binlog_event=binlog_event, only_return_sql=False,
-                        flashback=self.flashback, no_pk=self.no_pk, rename_db_dict=self.rename_db_dict, only_pk=self.only_pk,
-                        ignore_columns=self.ignore_columns, replace=self.replace, insert_ignore=self.insert_ignore,
-                        remove_not_update_col=self.remove_not_update_col, binlog_gtid=binlog_gtid,
-                        update_to_replace=self.update_to_replace, keep_not_update_col=self.keep_not_update_col,
-                        filter_conditions=self.filter_conditions, rename_tb_dict=self.rename_tb_dict,
-                    )
+                    if self.output_format == 'jsonl':
+                        sql, db, table = self.concat_json(binlog_event, stream.log_file, binlog_gtid=binlog_gtid)
+                    else:
+                        sql, db, table = concat_sql_from_binlog_event(
+                            binlog_event=binlog_event, only_return_sql=False,
+                            flashback=self.flashback, no_pk=self.no_pk, rename_db_dict=self.rename_db_dict,
+                            only_pk=self.only_pk, ignore_columns=self.ignore_columns, replace=self.replace,
+                            insert_ignore=self.insert_ignore,
+                            remove_not_update_col=self.remove_not_update_col, binlog_gtid=binlog_gtid,
+                            update_to_replace=self.update_to_replace, keep_not_update_col=self.keep_not_update_col,
+                            filter_conditions=self.filter_conditions, rename_tb_dict=self.rename_tb_dict,
+                            no_backslash_escapes=self.no_backslash_escapes, detect_charset=self.detect_charset,
+                        )
                     if sql:
-                        if self.need_comment != 1:
-                            sql = re.sub('; #.*', ';', sql)
-
-                        if not self.flashback:
-                            if self.f_result_sql_file:
-                                self.f_result_sql_file.write(sql + '\n')
-                            elif self.table_per_file:
-                                if db and table:
-                                    if self.date_prefix:
-                                        filename = f'{dt_now()}.' + db + '.' + table + '.sql'
-                                    elif self.no_date:
-                                        filename = db + '.' + table + '.sql'
-                                    else:
-                                        filename = db + '.' + table + f'.{dt_now()}.sql'
-                                else:
-                                    if self.date_prefix:
-                                        filename = f'{dt_now()}.others.sql'
-                                    elif self.no_date:
-                                        filename = f'others.sql'
-                                    else:
-                                        filename = f'others.{dt_now()}.sql'
-                                result_sql_file = os.path.join(self.result_dir, filename)
-                                save_result_sql(result_sql_file, sql + '\n')
-                            elif sync_cursor:
-                                sync_conn.ping(reconnect=True)
-                                if re.match('USE .*;\n', sql) is not None:
-                                    sql = re.sub('USE .*;\n', '', sql)
-                                try:
-                                    sync_cursor.execute(sql)
-                                except:
-                                    logger.exception(f'Could not execute sql: {sql}')
-                                    logger.error(
-                                        f'Exit at binlog file {stream.log_file} '
-                                        f'start pos {e_start_pos} end pos {binlog_event.packet.log_pos}'
-                                    )
-                                    break
-                            else:
-                                print(sql)
-                        else:
-                            if flashback_warn_flag == 1:
-                                logger.warning(f'Saving the result into the temp file, please wait until the parsing '
-                                               f'process is done, then reverse the order of results to you.')
-                                flashback_warn_flag = 0
-                            f_tmp.write(sql + '\n')
-                elif is_dml_event(binlog_event) and event_type(binlog_event) in self.sql_type:
+                        statements = self.sql_batch.flush() + [(sql, db, table)] if self.sql_batch else \
+                            [(sql, db, table)]
+                        if not self.save_statements(self.transaction_statements(statements), f_tmp, sync_conn,
+                                                    sync_cursor):
+                            logger.error(
+                                f'Exit at binlog file {stream.log_file} '
+                                f'start pos {e_start_pos} end pos {binlog_event.packet.log_pos}'
+                            )
+                            break
+                elif gtid_wanted and is_dml_event(binlog_event) and event_type(binlog_event) in self.sql_type:
                     exit_flag = 0
+                    self.in_transaction = True
+                    if self.load_data is not None and not self.load_data.is_loaded(binlog_event):
+                        # the rows of the table loaded so far go first
+                        self.save_statements(self.load_data.end(binlog_event.schema, binlog_event.table), f_tmp)
                     for row in binlog_event.rows:
-                        if binlog_gtid and gtid_set and not is_want_gtid(self.gtid_set, binlog_gtid):
+                        if self.net_changes is not None:
+                            self.net_changes.add(binlog_event, row, e_start_pos, binlog_gtid)
+                            continue
+                        if self.load_data is not None and self.load_data.is_loaded(binlog_event):
+                            statements = self.load_data.add(binlog_event, row, stream.log_file, e_start_pos)
+                            self.save_statements(statements, f_tmp)
                             continue
 
-                        sql, db, table = concat_sql_from_binlog_event(
-                            cursor=cursor, binlog_event=binlog_event, no_pk=self.no_pk, row=row,
-                            flashback=self.flashback, e_start_pos=e_start_pos, rename_db_dict=self.rename_db_dict,
-                            only_pk=self.only_pk, ignore_columns=self.ignore_columns, replace=self.replace,
-                            insert_ignore=self.insert_ignore, remove_not_update_col=self.remove_not_update_col,
-                            only_return_sql=False, binlog_gtid=binlog_gtid, update_to_replace=self.update_to_replace,
-                            keep_not_update_col=self.keep_not_update_col, filter_conditions=self.filter_conditions,
-                            rename_tb_dict=self.rename_tb_dict,
-                        )
+                        if self.output_format == 'jsonl':
+                            sql, db, table = self.concat_json(binlog_event, stream.log_file, row=row,
+                                                              e_start_pos=e_start_pos, binlog_gtid=binlog_gtid)
+                        else:
+                            sql, db, table, pattern = concat_sql_from_binlog_event(
+                                binlog_event=binlog_event, no_pk=self.no_pk, row=row,
+                                no_backslash_escapes=self.no_backslash_escapes, detect_charset=self.detect_charset,
+                                flashback=self.flashback, e_start_pos=e_start_pos, rename_db_dict=self.rename_db_dict,
+                                only_pk=self.only_pk, ignore_columns=self.ignore_columns, replace=self.replace,
+                                insert_ignore=self.insert_ignore, remove_not_update_col=self.remove_not_update_col,
+                                only_return_sql=False, return_pattern=True, binlog_gtid=binlog_gtid,
+                                update_to_replace=self.update_to_replace, keep_not_update_col=self.keep_not_update_col,
+                                filter_conditions=self.filter_conditions, rename_tb_dict=self.rename_tb_dict,
+                            )
                         try:
                             if sql:
-                                if self.need_comment != 1:
-                                    sql = re.sub('; #.*', ';', sql)
-
-                                if not self.flashback:
-                                    if self.f_result_sql_file:
-                                        self.f_result_sql_file.write(sql + '\n')
-                                    elif self.table_per_file:
-                                        if db and table:
-                                            if self.date_prefix:
-                                                filename = f'{dt_now()}.' + db + '.' + table + '.sql'
-                                            elif self.no_date:
-                                                filename = db + '.' + table + '.sql'
-                                            else:
-                                                filename = db + '.' + table + f'.{dt_now()}.sql'
-                                        else:
-                                            if self.date_prefix:
-                                                filename = f'{dt_now()}.others.sql'
-                                            elif self.no_date:
-                                                filename = f'others.sql'
-                                            else:
-                                                filename = f'others.{dt_now()}.sql'
-                                        result_sql_file = os.path.join(self.result_dir, filename)
-                                        save_result_sql(result_sql_file, sql + '\n')
-                                    elif sync_cursor:
-                                        sync_conn.ping(reconnect=True)
-                                        try:
-                                            sync_cursor.execute(sql)
-                                        except:
-                                            logger.exception(f'Could not execute sql: {sql}')
-                                            logger.error(
-                                                f'Exit at binlog file {stream.log_file} '
-                                                f'start pos {e_start_pos} end pos {binlog_event.packet.log_pos}'
-                                            )
-                                            exit_flag = 1
-                                            break
-                                    else:
-                                        print(sql)
-                                else:
-                                    if flashback_warn_flag == 1:
-                                        logger.warning(
-                                            f'Saving the result into the temp file, please wait until the parsing '
-                                            f'process is done, then reverse the order of results to you.')
-                                        flashback_warn_flag = 0
-                                    f_tmp.write(sql + '\n')
+                                statements = self.sql_batch.add(sql, db, table, (stream.log_file, e_start_pos),
+                                                                pattern=pattern) \
+                                    if self.sql_batch else [(sql, db, table)]
+                                if not self.save_statements(self.transaction_statements(statements), f_tmp,
+                                                            sync_conn, sync_cursor):
+                                    logger.error(
+                                        f'Exit at binlog file {stream.log_file} '
+                                        f'start pos {e_start_pos} end pos {binlog_event.packet.log_pos}'
+                                    )
+                                    exit_flag = 1
+                                    break
                         except Exception:
                             logger.exception('')
                             logger.error('Error sql: %s' % sql)
@@ -320,15 +332,39 @@ class Binlog2sql(object):
                     if exit_flag == 1:
                         break
 
+                if isinstance(binlog_event, XidEvent) or \
+                        (isinstance(binlog_event, QueryEvent) and binlog_event.query == 'COMMIT'):
+                    # rows of different transactions are not merged, write the last rows when the transaction ends
+                    statements = self.sql_batch.flush() if self.sql_batch and not self.sql_batch.merge_transactions \
+                        else []
+                    if not self.save_statements(self.transaction_statements(statements, end=True), f_tmp, sync_conn,
+                                                sync_cursor):
+                        logger.error(f'Exit at binlog file {stream.log_file} end pos {binlog_event.packet.log_pos}')
+                        break
+                    if self.stop_never:
+                        # the stream may wait long for the next event, do not keep the last transaction back
+                        self.sql_writer.flush()
+
                 if not (isinstance(binlog_event, RotateEvent) or isinstance(binlog_event, FormatDescriptionEvent)):
                     last_pos = binlog_event.packet.log_pos
                 if flag_last_event:
                     break
 
+            if self.net_changes is not None:
+                self.save_net_changes(f_tmp, sync_conn, sync_cursor)
+            if self.load_data is not None:
+                self.save_statements(self.load_data.end(), f_tmp)
+            statements = self.sql_batch.flush() if self.sql_batch else []
+            if self.wrap_transaction and self.in_transaction and (statements or self.begin_written):
+                logger.warning('The last transaction ends after the parsed range, its sql is committed as it is')
+            self.save_statements(self.transaction_statements(statements, end=True), f_tmp, sync_conn, sync_cursor)
             stream.close()
             f_tmp.close()
+            self.sql_writer.close()
             if self.f_result_sql_file:
                 self.f_result_sql_file.close()
+            if self.table_file_writer:
+                self.table_file_writer.close()
 
             if self.flashback:
                 handle_rollback_sql(self.f_result_sql_file, self.table_per_file, self.date_prefix, self.no_date,
@@ -340,6 +376,83 @@ class Binlog2sql(object):
                 sync_conn.close()
         return True
 
+    def save_net_changes(self, f_tmp, sync_conn=None, sync_cursor=None):
+        """Write the sql of the net changes of --compact collected so far, return False like save_statements"""
+        for binlog_event, row, e_start_pos, binlog_gtid in self.net_changes.pop_all():
+            sql, db, table, pattern = concat_sql_from_binlog_event(
+                binlog_event=binlog_event, no_pk=self.no_pk, row=row,
+                no_backslash_escapes=self.no_backslash_escapes, detect_charset=self.detect_charset,
+                flashback=self.flashback, e_start_pos=e_start_pos, rename_db_dict=self.rename_db_dict,
+                only_pk=self.only_pk, ignore_columns=self.ignore_columns, replace=self.replace,
+                insert_ignore=self.insert_ignore, remove_not_update_col=self.remove_not_update_col,
+                only_return_sql=False, binlog_gtid=binlog_gtid, update_to_replace=self.update_to_replace,
+                keep_not_update_col=self.keep_not_update_col, filter_conditions=self.filter_conditions,
+                rename_tb_dict=self.rename_tb_dict, return_pattern=True,
+            )
+            if sql:
+                statements = self.sql_batch.add(sql, db, table, pattern=pattern) \
+                    if self.sql_batch else [(sql, db, table)]
+                if not self.save_statements(statements, f_tmp, sync_conn, sync_cursor):
+                    return False
+        return True
+
+    def concat_json(self, binlog_event, binlog_file, row=None, e_start_pos=None, binlog_gtid=None):
+        """concat_sql_from_binlog_event of --format jsonl"""
+        return concat_json_from_binlog_event(
+            binlog_event, row=row, binlog_file=binlog_file, e_start_pos=e_start_pos, binlog_gtid=binlog_gtid,
+            flashback=self.flashback, no_pk=self.no_pk, rename_db_dict=self.rename_db_dict,
+            rename_tb_dict=self.rename_tb_dict, ignore_columns=self.ignore_columns,
+            filter_conditions=self.filter_conditions, detect_charset=self.detect_charset,
+        )
+
+    def transaction_statements(self, statements, end=False):
+        """With --wrap-transaction, add BEGIN; before the first statement of a transaction and COMMIT; after its
+        last one (end). The flashback temp file is reversed afterwards, so COMMIT; is written first there"""
+        if not self.wrap_transaction:
+            return statements
+        begin, commit = ('COMMIT;', 'BEGIN;') if self.flashback else ('BEGIN;', 'COMMIT;')
+        if statements and self.in_transaction and not self.begin_written:
+            statements = [(begin, None, None)] + statements
+            self.begin_written = True
+        if end:
+            if self.begin_written:
+                statements = statements + [(commit, None, None)]
+            self.in_transaction = self.begin_written = False
+        return statements
+
+    def save_statements(self, statements, f_tmp, sync_conn=None, sync_cursor=None):
+        """Write the result sql, return False if a sql could not be executed on the sync instance"""
+        for sql, db, table in statements:
+            if self.need_comment != 1 and self.output_format == 'sql':
+                sql = re.sub('; #.*', ';', sql)
+
+            if self.flashback:
+                if self.flashback_warn_flag == 1:
+                    logger.warning(f'Saving the result into the temp file, please wait until the parsing '
+                                   f'process is done, then reverse the order of results to you.')
+                    self.flashback_warn_flag = 0
+                f_tmp.write(sql + '\n')
+            elif self.f_result_sql_file:
+                self.sql_writer.write(sql)
+            elif self.table_per_file:
+                self.table_file_writer.write(db + '.' + table if db and table else 'others', sql + '\n')
+            elif sync_cursor:
+                sync_conn.ping(reconnect=True)
+                if re.match('USE .*;\n', sql) is not None:
+                    sql = re.sub('USE .*;\n', '', sql)
+                try:
+                    sync_cursor.execute(sql)
+                except:
+                    logger.exception(f'Could not execute sql: {sql}')
+                    if self.sql_batch:
+                        self.sql_batch.discard()
+                    # the open transaction is rolled back when the connection is closed
+                    self.begin_written = False
+                    return False
+            else:
+                self.sql_writer.write(sql)
+        return True
+
     def __del__(self):
         pass
 
@@ -366,6 +479,10 @@ def main(args):
         result_file=args.result_file, result_dir=args.result_dir, date_prefix=args.date_prefix, args=args,
         include_gtids=args.include_gtids, exclude_gtids=args.exclude_gtids, update_to_replace=args.update_to_replace,
         keep_not_update_col=args.keep_not_update_col, chunk_size=args.chunk, tmp_dir=args.tmp_dir, where=args.where,
+        preload_schema=args.preload_schema, detect_charset=args.detect_charset, extended_insert=args.extended_insert,
+        extended_insert_size=args.extended_insert_size, merge_transactions=args.merge_transactions,
+        batch_delete=args.batch_delete, compact=args.compact, compact_memory_rows=args.compact_memory_rows,
+        wrap_transaction=args.wrap_transaction, output_format=args.output_format,
     )
     binlog2sql.process_binlog()
 
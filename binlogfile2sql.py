@@ -1,19 +1,33 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
 import datetime
+import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
 import time
 import pymysql
 import re
-from utils.binlogfile2sql_util import command_line_args, BinLogFileReader
+from utils.binlogfile2sql_util import command_line_args, BinLogFileReader, split_binlog_file, \
+    FOLLOW_POLL_INTERVAL, FOLLOW_RELIST_INTERVAL
 from utils.binlog2sql_util import concat_sql_from_binlog_event, is_dml_event, event_type, logger, \
-    get_gtid_set, is_want_gtid, save_result_sql, dt_now, handle_rollback_sql, \
-    get_max_gtid, remove_max_gtid, connect2sync_mysql
-from pymysqlreplication.event import QueryEvent, RotateEvent, FormatDescriptionEvent, GtidEvent
+    get_gtid_set, save_result_sql, handle_rollback_sql, TableFileWriter, \
+    get_max_gtid, remove_max_gtid, connect2sync_mysql, get_ignored_rows_events, get_preloaded_tables, \
+    is_no_backslash_escapes
+from pymysqlreplication.event import QueryEvent, RotateEvent, FormatDescriptionEvent, GtidEvent, XidEvent
 from utils.other_utils import create_unique_file, temp_open, get_binlog_file_list, timestamp_to_datetime, \
     save_executed_result, split_condition, merge_rename_args
+from utils.binlog_archive import get_binlog_mtime, is_stream_binlog, get_inner_name
+from utils.schema_cache import get_schema_cache
+from utils.local_schema import get_schema_provider
+from utils.sql_batch import SqlBatch, DEFAULT_EXTENDED_INSERT_SIZE
+from utils.net_changes import NetChanges
+from utils.sql_writer import SqlWriter
+from utils.json_event import concat_json_from_binlog_event
+from utils.load_data import LoadDataWriter
 
 sep = '/' if '/' in sys.argv[0] else os.sep
 
@@ -27,7 +41,12 @@ class BinlogFile2sql(object):
                  ignore_databases=None, ignore_tables=None, ignore_columns=None, replace=False, rename_tb=None,
                  ignore_virtual_columns=False, file_index=0, remove_not_update_col=False, date_prefix=False,
                  include_gtids=None, exclude_gtids=None, update_to_replace=False, no_date=False,
-                 keep_not_update_col: list = None, chunk_size=1000, tmp_dir='tmp', where=None, args=None):
+                 keep_not_update_col: list = None, chunk_size=1000, tmp_dir='tmp', where=None, use_index=False,
+                 index_dir=None, file_range=None, follow=False, stop_following=None, schema_cache=None,
+                 refresh_schema_cache=False, schema_file=None, preload_schema=False, detect_charset=False,
+                 extended_insert=False, extended_insert_size=DEFAULT_EXTENDED_INSERT_SIZE, merge_transactions=False,
+                 batch_delete=False, net_changes=None, flush_net_changes=True, wrap_transaction=False,
+                 output_format='sql', args=None):
         """
         connection_settings: {'host': 127.0.0.1, 'port': 3306, 'user': slave, 'passwd': slave}
         """
@@ -40,6 +59,7 @@ class BinlogFile2sql(object):
         self.end_pos = end_pos
         self.start_time = datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S") if start_time else \
             datetime.datetime.strptime('1970-01-01 00:00:00', "%Y-%m-%d %H:%M:%S")
+        self.start_timestamp = self.start_time.timestamp() if start_time else None
         self.stop_time = datetime.datetime.strptime(stop_time, "%Y-%m-%d %H:%M:%S") if stop_time else \
             datetime.datetime.strptime('2999-12-31 00:00:00', "%Y-%m-%d %H:%M:%S")
 
@@ -51,7 +71,21 @@ class BinlogFile2sql(object):
         self.sql_type = [t.upper() for t in sql_type] if sql_type else []
 
         self.binlog_file_list = []
-        self.connection = pymysql.connect(**self.connection_settings)
+        # with a schema file no mysql is needed, the values are always escaped locally
+        self.schema_provider = get_schema_provider(schema_file) if schema_file else None
+        self.no_backslash_escapes = False
+        self.preloaded_tables = None
+        if not self.schema_provider:
+            connection = pymysql.connect(**self.connection_settings)
+            try:
+                self.no_backslash_escapes = is_no_backslash_escapes(connection)
+                if preload_schema:
+                    self.preloaded_tables = get_preloaded_tables(
+                        connection, self.only_schemas, self.only_tables, ignore_databases, ignore_tables,
+                        ignore_virtual_columns
+                    )
+            finally:
+                connection.close()
 
         self.result_dir = result_dir
         self.need_comment = need_comment
@@ -70,15 +104,39 @@ class BinlogFile2sql(object):
         self.file_index = file_index
         self.remove_not_update_col = remove_not_update_col
         self.gtid_set = get_gtid_set(include_gtids, exclude_gtids)
-        self.gtid_max_dict = get_max_gtid(self.gtid_set.get('include', {}))
+        self.gtid_max_dict = get_max_gtid(self.gtid_set.include)
         self.update_to_replace = update_to_replace
         self.keep_not_update_col = keep_not_update_col if keep_not_update_col is not None else []
         self.no_date = no_date
         self.f_result_sql_file = ''
         self.chunk_size = chunk_size
         self.tmp_dir = tmp_dir
+        self.use_index = use_index
+        self.index_dir = index_dir
+        self.file_range = file_range
+        self.follow = follow
+        # called when --follow waits at the end of the file, stop waiting if it returns True
+        self.stop_following = stop_following
+        self.schema_cache = schema_cache
+        self.refresh_schema_cache = refresh_schema_cache
+        self.detect_charset = detect_charset
+        self.sql_batch = SqlBatch(extended_insert_size, merge_transactions, reverse=flashback,
+                                  extended_insert=extended_insert, batch_delete=batch_delete) \
+            if extended_insert or batch_delete else None
+        # --wrap-transaction, in_transaction is set from the BEGIN to the COMMIT of a transaction of the binlog,
+        # begin_written once BEGIN; of it is written
+        self.wrap_transaction = wrap_transaction
+        self.in_transaction = self.begin_written = False
+        # sql, jsonl: a json line of every row change instead of its sql, see utils.json_event, or load-data: the
+        # inserted rows go to data files loaded by LOAD DATA, see utils.load_data
+        self.output_format = output_format
+        # set if the parse stopped before the end of the file, by --stop-datetime, --stop-position or gtid
+        self.stopped_early = False
         if not os.path.exists(tmp_dir):
             os.makedirs(tmp_dir, exist_ok=True)
+        # the NetChanges of --compact, shared by the binlog files of the parse, saved after the last one
+        self.net_changes = net_changes
+        self.flush_net_changes = flush_net_changes
 
         self.filter_conditions = split_condition(where) if where is not None else []
         if remove_not_update_col and self.filter_conditions:
@@ -99,7 +157,13 @@ class BinlogFile2sql(object):
         stream = BinLogFileReader(self.file_path, ctl_connection_settings=self.connection_settings,
                                   log_pos=self.start_pos, only_schemas=self.only_schemas, stop_pos=self.end_pos,
                                   only_tables=self.only_tables, ignored_schemas=self.ignore_databases,
-                                  ignored_tables=self.ignore_tables, ignore_virtual_columns=self.ignore_virtual_columns)
+                                  ignored_tables=self.ignore_tables, ignore_virtual_columns=self.ignore_virtual_columns,
+                                  use_index=self.use_index, index_dir=self.index_dir,
+                                  start_timestamp=self.start_timestamp, gtid_filter=self.gtid_set,
+                                  file_range=self.file_range, ignored_events=get_ignored_rows_events(self.sql_type),
+                                  blocking=self.follow, idle_callback=self.on_idle if self.follow else None,
+                                  schema_cache=self.get_schema_cache(), schema_provider=self.schema_provider,
+                                  preloaded_tables=self.preloaded_tables)
         result_sql_file = ''
         if self.stop_never and not self.table_per_file:
             result_sql_file = self.file_path.split(sep)[-1].replace('.', '_').replace('-', '_') + '.sql'
@@ -116,22 +180,46 @@ class BinlogFile2sql(object):
 
         if self.table_per_file:
             logger.info(f'Saving table per file into dir: [{self.result_dir}]')
-
-        flashback_warn_flag = 1
+        self.table_file_writer = TableFileWriter(self.result_dir, self.date_prefix, self.no_date) \
+            if self.table_per_file else None
+        self.load_data = LoadDataWriter(
+            self.result_dir, flashback=self.flashback, no_pk=self.no_pk, replace=self.replace,
+            insert_ignore=self.insert_ignore, rename_db_dict=self.rename_db_dict, rename_tb_dict=self.rename_tb_dict,
+            ignore_columns=self.ignore_columns, ignore_virtual_columns=self.ignore_virtual_columns,
+            filter_conditions=self.filter_conditions, detect_charset=self.detect_charset,
+            no_backslash_escapes=self.no_backslash_escapes,
+        ) if self.output_format == 'load-data' else None
+        # the sql of stdout and the result file is written on a background thread
+        self.sql_writer = SqlWriter(self.f_result_sql_file or sys.stdout)
+
+        self.flashback_warn_flag = 1
         binlog_gtid = ''
+        # the binlog file of the change events of --format jsonl
+        binlog_file_name = os.path.basename(get_inner_name(self.file_path))
         gtid_set = True if self.gtid_set else False
+        # whether the rows of the current transaction are wanted by the gtid filter, decided at its gtid event
+        gtid_wanted = True
         flag_last_event = False
         e_start_pos, last_pos = stream.log_pos, stream.log_pos
+        if self.file_range:
+            # the event before the range start ends at the range start
+            e_start_pos = last_pos = max(last_pos, self.file_range[0])
         tmp_file = create_unique_file('%s.%s' % (self.connection_settings['host'], self.connection_settings['port']))
         tmp_file = os.path.join(self.tmp_dir, tmp_file)
 
         sync_conn = ''
         sync_cursor = ''
-        with temp_open(tmp_file, "w") as f_tmp, self.connection as cursor:
+        with temp_open(tmp_file, "w") as f_tmp, self.sql_writer:
             if self.args and self.args.sync:
                 sync_conn = connect2sync_mysql(self.args)
                 sync_cursor = sync_conn.cursor()
+                if self.sql_batch:
+                    sync_cursor.execute('SELECT @@max_allowed_packet')
+                    self.sql_batch.fit_packet(sync_cursor.fetchone()[0])
             for binlog_event in stream:
+                if self.table_file_writer is not None and isinstance(binlog_event, RotateEvent):
+                    # flush the result files at every binlog file, and take the date of their names again
+                    self.table_file_writer.rotate()
                 if not self.stop_never:
                     try:
                         event_time = datetime.datetime.fromtimestamp(binlog_event.timestamp)
@@ -144,157 +232,142 @@ class BinlogFile2sql(object):
                         continue
                     elif (self.end_pos and stream.log_pos > self.end_pos) or \
                             (event_time >= self.stop_time):
+                        self.stopped_early = True
                         break
                     # else:
                     #     raise ValueError('unknown binlog file or position')
 
                 if isinstance(binlog_event, QueryEvent) and binlog_event.query == 'BEGIN':
                     e_start_pos = last_pos
+                    self.in_transaction = True
 
                 if isinstance(binlog_event, GtidEvent):
                     binlog_gtid = str(binlog_event.gtid)
+                    self.in_transaction = False
+                    gtid_wanted = not gtid_set or self.gtid_set.is_want_gtid(binlog_gtid)
                     if self.gtid_max_dict:
                         remove_max_gtid(self.gtid_max_dict, binlog_gtid)
                         if not self.gtid_max_dict:
                             logger.info('The parse process exited because the gtid condition reached the maximum '
                                         'value, or may be you give a invalid gtid sets to args --include-gtid')
+                            self.stopped_early = True
                             break
 
+                if self.load_data is not None and isinstance(binlog_event, QueryEvent) and \
+                        binlog_event.query not in ('BEGIN', 'COMMIT'):
+                    # a ddl may change the columns of the tables, the rows loaded so far go first
+                    self.save_statements(self.load_data.end(), f_tmp)
+
+                if self.net_changes is not None and isinstance(binlog_event, QueryEvent) and \
+                        binlog_event.query not in ('BEGIN', 'COMMIT'):
+                    # rows are not merged across a ddl, the columns of the table may have changed
+                    if not self.save_net_changes(f_tmp, sync_conn, sync_cursor):
+                        logger.error(f'Exit at binlog file {stream.log_file} end pos {binlog_event.packet.log_pos}')
+                        break
+
                 if isinstance(binlog_event, QueryEvent) and not self.only_dml:
-                    if binlog_gtid and gtid_set and not is_want_gtid(self.gtid_set, binlog_gtid):
+                    if not gtid_wanted:
                         continue
 
-                    sql, db, table = concat_sql_from_binlog_event(
-                        cursor=cursor, binlog_event=binlog_event, flashback=self.flashback, no_pk=self.no_pk,
-                        rename_db_dict=self.rename_db_dict, only_pk=self.only_pk, only_return_sql=False,
-                        ignore_columns=self.ignore_columns, replace=self.replace, insert_ignore=self.insert_ignore,
-                        ignore_virtual_columns=self.ignore_virtual_columns, binlog_gtid=binlog_gtid,
-                        remove_not_update_col=self.remove_not_update_col, update_to_replace=self.update_to_replace,
-                        keep_not_update_col=self.keep_not_update_col, filter_conditions=self.filter_conditions,
-                        rename_tb_dict=self.rename_tb_dict,
-                    )
+                    if self.output_format == 'jsonl':
+                        sql, db, table = self.concat_json(binlog_event, binlog_file_name, binlog_gtid=binlog_gtid)
+                    else:
+                        sql, db, table = concat_sql_from_binlog_event(
+                            binlog_event=binlog_event, flashback=self.flashback, no_pk=self.no_pk,
+                            rename_db_dict=self.rename_db_dict, only_pk=self.only_pk, only_return_sql=False,
+                            ignore_columns=self.ignore_columns, replace=self.replace, insert_ignore=self.insert_ignore,
+                            ignore_virtual_columns=self.ignore_virtual_columns, binlog_gtid=binlog_gtid,
+                            remove_not_update_col=self.remove_not_update_col, update_to_replace=self.update_to_replace,
+                            keep_not_update_col=self.keep_not_update_col, filter_conditions=self.filter_conditions,
+                            rename_tb_dict=self.rename_tb_dict, no_backslash_escapes=self.no_backslash_escapes,
+                            detect_charset=self.detect_charset,
+                        )
                     if sql:
-                        if self.need_comment != 1:
-                            sql = re.sub('; #.*', ';', sql)
-
-                        if not self.flashback:
-                            if self.f_result_sql_file:
-                                self.f_result_sql_file.write(sql + '\n')
-                            elif self.table_per_file and db and table:
-                                if self.date_prefix:
-                                    filename = f'{dt_now()}.' + db + '.' + table + '.sql'
-                                elif self.no_date:
-                                    filename = db + '.' + table + '.sql'
-                                else:
-                                    filename = db + '.' + table + f'.{dt_now()}.sql'
-                                result_sql_file = os.path.join(self.result_dir, filename)
-                                save_result_sql(result_sql_file, sql + '\n')
-                            elif self.table_per_file:
-                                if self.date_prefix:
-                                    filename = f'{dt_now()}.others.sql'
-                                elif self.no_date:
-                                    filename = f'others.sql'
-                                else:
-                                    filename = f'others.{dt_now()}.sql'
-                                result_sql_file = os.path.join(self.result_dir, filename)
-                                save_result_sql(result_sql_file, sql + '\n')
-                            elif sync_cursor:
-                                sync_conn.ping(reconnect=True)
-                                if re.match('USE .*;\n', sql) is not None:
-                                    sql = re.sub('USE .*;\n', '', sql)
-                                try:
-                                    sync_cursor.execute(sql)
-                                except:
-                                    logger.exception(f'Could not execute sql: {sql}')
-                                    logger.error(
-                                        f'Exit at binlog file {stream.log_file} '
-                                        f'start pos {e_start_pos} end pos {binlog_event.packet.log_pos}'
-                                    )
-                                    break
-                            else:
-                                print(sql)
-                        else:
-                            if flashback_warn_flag == 1:
-                                logger.warning(
-                                    f'Saving the result into the temp file, please wait until the parsing '
-                                    f'process is done, then reverse the order of results to you.')
-                                flashback_warn_flag = 0
-                            f_tmp.write(sql + '\n')
-                elif is_dml_event(binlog_event) and event_type(binlog_event) in self.sql_type:
+                        statements = self.sql_batch.flush() + [(sql, db, table)] if self.sql_batch else \
+                            [(sql, db, table)]
+                        if not self.save_statements(self.transaction_statements(statements), f_tmp, sync_conn,
+                                                    sync_cursor):
+                            logger.error(
+                                f'Exit at binlog file {stream.log_file} '
+                                f'start pos {e_start_pos} end pos {binlog_event.packet.log_pos}'
+                            )
+                            break
+                elif gtid_wanted and is_dml_event(binlog_event) and event_type(binlog_event) in self.sql_type:
                     exit_flag = 0
+                    self.in_transaction = True
+                    if self.load_data is not None and not self.load_data.is_loaded(binlog_event):
+                        # the rows of the table loaded so far go first
+                        self.save_statements(self.load_data.end(binlog_event.schema, binlog_event.table), f_tmp)
                     for row in binlog_event.rows:
-                        if binlog_gtid and gtid_set and not is_want_gtid(self.gtid_set, binlog_gtid):
+                        if self.net_changes is not None:
+                            self.net_changes.add(binlog_event, row, e_start_pos, binlog_gtid)
+                            continue
+                        if self.load_data is not None and self.load_data.is_loaded(binlog_event):
+                            statements = self.load_data.add(binlog_event, row, binlog_file_name, e_start_pos)
+                            self.save_statements(statements, f_tmp)
                             continue
 
-                        sql, db, table = concat_sql_from_binlog_event(
-                            cursor=cursor, binlog_event=binlog_event, row=row, flashback=self.flashback,
-                            e_start_pos=e_start_pos, rename_db_dict=self.rename_db_dict, only_pk=self.only_pk,
-                            only_return_sql=False, ignore_columns=self.ignore_columns, replace=self.replace,
-                            insert_ignore=self.insert_ignore, ignore_virtual_columns=self.ignore_virtual_columns,
-                            remove_not_update_col=self.remove_not_update_col, binlog_gtid=binlog_gtid,
-                            update_to_replace=self.update_to_replace, keep_not_update_col=self.keep_not_update_col,
-                            filter_conditions=self.filter_conditions, no_pk=self.no_pk,
-                            rename_tb_dict=self.rename_tb_dict,
-                        )
+                        if self.output_format == 'jsonl':
+                            sql, db, table = self.concat_json(binlog_event, binlog_file_name, row=row,
+                                                              e_start_pos=e_start_pos, binlog_gtid=binlog_gtid)
+                        else:
+                            sql, db, table, pattern = concat_sql_from_binlog_event(
+                                binlog_event=binlog_event, row=row, flashback=self.flashback,
+                                e_start_pos=e_start_pos, rename_db_dict=self.rename_db_dict, only_pk=self.only_pk,
+                                only_return_sql=False, ignore_columns=self.ignore_columns, replace=self.replace,
+                                insert_ignore=self.insert_ignore, ignore_virtual_columns=self.ignore_virtual_columns,
+                                remove_not_update_col=self.remove_not_update_col, binlog_gtid=binlog_gtid,
+                                update_to_replace=self.update_to_replace, keep_not_update_col=self.keep_not_update_col,
+                                filter_conditions=self.filter_conditions, no_pk=self.no_pk,
+                                rename_tb_dict=self.rename_tb_dict, no_backslash_escapes=self.no_backslash_escapes,
+                                detect_charset=self.detect_charset, return_pattern=True,
+                            )
                         if sql:
-                            if self.need_comment != 1:
-                                sql = re.sub('; #.*', ';', sql)
-
-                            if not self.flashback:
-                                if self.f_result_sql_file:
-                                    self.f_result_sql_file.write(sql + '\n')
-                                elif self.table_per_file and db and table:
-                                    if self.date_prefix:
-                                        filename = f'{dt_now()}.' + db + '.' + table + '.sql'
-                                    elif self.no_date:
-                                        filename = db + '.' + table + '.sql'
-                                    else:
-                                        filename = db + '.' + table + f'.{dt_now()}.sql'
-                                    result_sql_file = os.path.join(self.result_dir, filename)
-                                    save_result_sql(result_sql_file, sql + '\n')
-                                elif self.table_per_file:
-                                    if self.date_prefix:
-                                        filename = f'{dt_now()}.others.sql'
-                                    elif self.no_date:
-                                        filename = f'others.sql'
-                                    else:
-                                        filename = f'others.{dt_now()}.sql'
-                                    result_sql_file = os.path.join(self.result_dir, filename)
-                                    save_result_sql(result_sql_file, sql + '\n')
-                                elif sync_cursor:
-                                    sync_conn.ping(reconnect=True)
-                                    try:
-                                        sync_cursor.execute(sql)
-                                    except:
-                                        logger.exception(f'Could not execute sql: {sql}')
-                                        logger.error(
-                                            f'Exit at binlog file {stream.log_file} '
-                                            f'start pos {e_start_pos} end pos {binlog_event.packet.log_pos}'
-                                        )
-                                        exit_flag = 1
-                                        break
-                                else:
-                                    print(sql)
-                            else:
-                                if flashback_warn_flag == 1:
-                                    logger.warning(
-                                        f'Saving the result into the temp file, please wait until the parsing '
-                                        f'process is done, then reverse the order of results to you.')
-                                    flashback_warn_flag = 0
-                                f_tmp.write(sql + '\n')
+                            statements = self.sql_batch.add(sql, db, table, (stream.log_file, e_start_pos),
+                                                            pattern=pattern) \
+                                if self.sql_batch else [(sql, db, table)]
+                            if not self.save_statements(self.transaction_statements(statements), f_tmp, sync_conn,
+                                                        sync_cursor):
+                                logger.error(
+                                    f'Exit at binlog file {stream.log_file} '
+                                    f'start pos {e_start_pos} end pos {binlog_event.packet.log_pos}'
+                                )
+                                exit_flag = 1
+                                break
 
                     if exit_flag == 1:
                         break
 
+                if isinstance(binlog_event, XidEvent) or \
+                        (isinstance(binlog_event, QueryEvent) and binlog_event.query == 'COMMIT'):
+                    # rows of different transactions are not merged, write the last rows when the transaction ends
+                    statements = self.sql_batch.flush() if self.sql_batch and not self.sql_batch.merge_transactions \
+                        else []
+                    if not self.save_statements(self.transaction_statements(statements, end=True), f_tmp, sync_conn,
+                                                sync_cursor):
+                        logger.error(f'Exit at binlog file {stream.log_file} end pos {binlog_event.packet.log_pos}')
+                        break
+
                 if not (isinstance(binlog_event, RotateEvent) or isinstance(binlog_event, FormatDescriptionEvent)):
                     last_pos = binlog_event.packet.log_pos
                 if flag_last_event:
                     break
 
+            if self.net_changes is not None and self.flush_net_changes:
+                self.save_net_changes(f_tmp, sync_conn, sync_cursor)
+            if self.load_data is not None:
+                self.save_statements(self.load_data.end(), f_tmp)
+            statements = self.sql_batch.flush() if self.sql_batch else []
+            if self.wrap_transaction and self.in_transaction and (statements or self.begin_written):
+                logger.warning('The last transaction ends after the parsed range, its sql is committed as it is')
+            self.save_statements(self.transaction_statements(statements, end=True), f_tmp, sync_conn, sync_cursor)
             stream.close()
             f_tmp.close()
+            self.sql_writer.close()
             if self.f_result_sql_file:
                 self.f_result_sql_file.close()
+            if self.table_file_writer:
+                self.table_file_writer.close()
 
             if self.flashback:
                 handle_rollback_sql(self.f_result_sql_file, self.table_per_file, self.date_prefix, self.no_date,
@@ -306,10 +379,335 @@ class BinlogFile2sql(object):
                 sync_conn.close()
         return True
 
+    def save_net_changes(self, f_tmp, sync_conn=None, sync_cursor=None):
+        """Write the sql of the net changes of --compact collected so far, return False like save_statements"""
+        for binlog_event, row, e_start_pos, binlog_gtid in self.net_changes.pop_all():
+            sql, db, table, pattern = concat_sql_from_binlog_event(
+                binlog_event=binlog_event, row=row, flashback=self.flashback,
+                e_start_pos=e_start_pos, rename_db_dict=self.rename_db_dict, only_pk=self.only_pk,
+                only_return_sql=False, ignore_columns=self.ignore_columns, replace=self.replace,
+                insert_ignore=self.insert_ignore, ignore_virtual_columns=self.ignore_virtual_columns,
+                remove_not_update_col=self.remove_not_update_col, binlog_gtid=binlog_gtid,
+                update_to_replace=self.update_to_replace, keep_not_update_col=self.keep_not_update_col,
+                filter_conditions=self.filter_conditions, no_pk=self.no_pk,
+                rename_tb_dict=self.rename_tb_dict, no_backslash_escapes=self.no_backslash_escapes,
+                detect_charset=self.detect_charset, return_pattern=True,
+            )
+            if sql:
+                statements = self.sql_batch.add(sql, db, table, pattern=pattern) \
+                    if self.sql_batch else [(sql, db, table)]
+                if not self.save_statements(statements, f_tmp, sync_conn, sync_cursor):
+                    return False
+        return True
+
+    def concat_json(self, binlog_event, binlog_file, row=None, e_start_pos=None, binlog_gtid=None):
+        """concat_sql_from_binlog_event of --format jsonl"""
+        return concat_json_from_binlog_event(
+            binlog_event, row=row, binlog_file=binlog_file, e_start_pos=e_start_pos, binlog_gtid=binlog_gtid,
+            flashback=self.flashback, no_pk=self.no_pk, rename_db_dict=self.rename_db_dict,
+            rename_tb_dict=self.rename_tb_dict, ignore_columns=self.ignore_columns,
+            ignore_virtual_columns=self.ignore_virtual_columns, filter_conditions=self.filter_conditions,
+            detect_charset=self.detect_charset,
+        )
+
+    def transaction_statements(self, statements, end=False):
+        """With --wrap-transaction, add BEGIN; before the first statement of a transaction and COMMIT; after its
+        last one (end). The flashback temp file is reversed afterwards, so COMMIT; is written first there"""
+        if not self.wrap_transaction:
+            return statements
+        begin, commit = ('COMMIT;', 'BEGIN;') if self.flashback else ('BEGIN;', 'COMMIT;')
+        if statements and self.in_transaction and not self.begin_written:
+            statements = [(begin, None, None)] + statements
+            self.begin_written = True
+        if end:
+            if self.begin_written:
+                statements = statements + [(commit, None, None)]
+            self.in_transaction = self.begin_written = False
+        return statements
+
+    def save_statements(self, statements, f_tmp, sync_conn=None, sync_cursor=None):
+        """Write the result sql, return False if a sql could not be executed on the sync instance"""
+        for sql, db, table in statements:
+            if self.need_comment != 1 and self.output_format == 'sql':
+                sql = re.sub('; #.*', ';', sql)
+
+            if self.flashback:
+                if self.flashback_warn_flag == 1:
+                    logger.warning(f'Saving the result into the temp file, please wait until the parsing '
+                                   f'process is done, then reverse the order of results to you.')
+                    self.flashback_warn_flag = 0
+                f_tmp.write(sql + '\n')
+            elif self.f_result_sql_file:
+                self.sql_writer.write(sql)
+            elif self.table_per_file:
+                self.table_file_writer.write(db + '.' + table if db and table else 'others', sql + '\n')
+            elif sync_cursor:
+                sync_conn.ping(reconnect=True)
+                if re.match('USE .*;\n', sql) is not None:
+                    sql = re.sub('USE .*;\n', '', sql)
+                try:
+                    sync_cursor.execute(sql)
+                except:
+                    logger.exception(f'Could not execute sql: {sql}')
+                    if self.sql_batch:
+                        self.sql_batch.discard()
+                    # the open transaction is rolled back when the connection is closed
+                    self.begin_written = False
+                    return False
+            else:
+                self.sql_writer.write(sql)
+        return True
+
+    def get_schema_cache(self):
+        if not self.schema_cache:
+            return None
+        server = '%s:%s' % (self.connection_settings['host'], self.connection_settings['port'])
+        return get_schema_cache(self.schema_cache, server, self.refresh_schema_cache)
+
+    def on_idle(self):
+        """Flush the results parsed so far while waiting for new events of the followed file"""
+        self.sql_writer.flush(wait=True)
+        if self.f_result_sql_file:
+            self.f_result_sql_file.flush()
+        sys.stdout.flush()
+        return self.stop_following is not None and self.stop_following()
+
     def __del__(self):
         pass
 
 
+def new_binlog_file2sql(binlog_file, file_index, connection_settings, args, file_range=None, stop_following=None,
+                        net_changes=None, flush_net_changes=True):
+    return BinlogFile2sql(
+        file_path=binlog_file, connection_settings=connection_settings, start_pos=args.start_pos,
+        end_pos=args.end_pos, start_time=args.start_time, stop_time=args.stop_time,
+        only_schemas=args.databases, result_dir=args.result_dir, only_tables=args.tables, no_pk=args.no_pk,
+        flashback=args.flashback, only_dml=args.only_dml, sql_type=args.sql_type, file_index=file_index,
+        stop_never=args.stop_never, need_comment=args.need_comment, rename_db=args.rename_db,
+        only_pk=args.only_pk, result_file=args.result_file, table_per_file=args.table_per_file,
+        ignore_databases=args.ignore_databases, ignore_tables=args.ignore_tables, rename_tb=args.rename_tb,
+        ignore_columns=args.ignore_columns, replace=args.replace, insert_ignore=args.insert_ignore,
+        ignore_virtual_columns=args.ignore_virtual_columns, date_prefix=args.date_prefix,
+        remove_not_update_col=args.remove_not_update_col, no_date=args.no_date,
+        include_gtids=args.include_gtids, exclude_gtids=args.exclude_gtids, tmp_dir=args.tmp_dir,
+        update_to_replace=args.update_to_replace, keep_not_update_col=args.keep_not_update_col,
+        where=args.where, use_index=args.use_index, index_dir=args.index_dir, file_range=file_range,
+        follow=getattr(args, 'follow', False), stop_following=stop_following,
+        schema_cache=getattr(args, 'schema_cache', ''),
+        refresh_schema_cache=getattr(args, 'refresh_schema_cache', False),
+        schema_file=getattr(args, 'schema_file', ''), preload_schema=getattr(args, 'preload_schema', False),
+        detect_charset=getattr(args, 'detect_charset', False), extended_insert=getattr(args, 'extended_insert', False),
+        extended_insert_size=getattr(args, 'extended_insert_size', DEFAULT_EXTENDED_INSERT_SIZE),
+        merge_transactions=getattr(args, 'merge_transactions', False),
+        batch_delete=getattr(args, 'batch_delete', False), net_changes=net_changes,
+        flush_net_changes=flush_net_changes, wrap_transaction=getattr(args, 'wrap_transaction', False),
+        output_format=getattr(args, 'output_format', 'sql'), args=args,
+    )
+
+
+def parse_binlog_file_to_spool(job):
+    """Worker of --workers, parse one binlog file or a range of it into its own spool dir instead of the real sinks"""
+    i, binlog_file, file_range, last_part, start_pos, end_pos, connection_settings, spool_dir, args = job
+    args = copy.copy(args)
+    args.start_pos, args.end_pos = start_pos, end_pos
+    args.result_dir = os.path.join(spool_dir, 'out')
+    args.tmp_dir = os.path.join(spool_dir, 'tmp')
+    args.sync = False
+    # stdout and --sync results are spooled into a result file too, and replayed line by line by the merger
+    args.result_file = '' if args.table_per_file else os.path.join(spool_dir, 'result.sql')
+    os.makedirs(args.result_dir, exist_ok=True)
+
+    if file_range:
+        logger.info('parsing binlog file: %s [%s] from position %s to %s' % (
+            binlog_file, timestamp_to_datetime(get_binlog_mtime(binlog_file)), file_range[0], file_range[1] or 'end'))
+    else:
+        logger.info('parsing binlog file: %s [%s]' % (
+            binlog_file, timestamp_to_datetime(get_binlog_mtime(binlog_file))))
+    bin2sql = new_binlog_file2sql(binlog_file, 0, connection_settings, args, file_range)
+    bin2sql.process_binlog()
+    return i, binlog_file, spool_dir, last_part, bin2sql.stopped_early
+
+
+def yield_spool_lines(spool_files, encoding=None):
+    for spool_file in spool_files:
+        with open(spool_file, encoding=encoding, newline='') as f:
+            for line in f:
+                yield line
+
+
+def merge_spools(i, binlog_file, spool_dirs, args, sync_conn=None, sync_cursor=None):
+    """Output the spools of the i-th binlog file exactly like the sequential parse would"""
+    # every range reversed its own rollback sql, so the ranges are reversed too
+    if args.flashback:
+        spool_dirs = spool_dirs[::-1]
+
+    if args.table_per_file:
+        for spool_dir in spool_dirs:
+            out_dir = os.path.join(spool_dir, 'out')
+            for filename in sorted(os.listdir(out_dir)):
+                with open(os.path.join(out_dir, filename), 'rb') as f_src, \
+                        open(os.path.join(args.result_dir, filename), 'ab') as f_dst:
+                    shutil.copyfileobj(f_src, f_dst)
+        return
+
+    spool_files = [os.path.join(spool_dir, 'result.sql') for spool_dir in spool_dirs]
+    if args.result_file:
+        # flashback rewrites the result file for every binlog file which has any result
+        if args.flashback and i != 0 and not any(os.path.getsize(spool_file) for spool_file in spool_files):
+            return
+        with open(args.result_file, 'wb' if args.flashback or i == 0 else 'ab') as f_dst:
+            for spool_file in spool_files:
+                with open(spool_file, 'rb') as f_src:
+                    shutil.copyfileobj(f_src, f_dst)
+        return
+
+    encoding = args.encoding if args.flashback else None
+    if not sync_cursor:
+        for spool_file in spool_files:
+            with open(spool_file, encoding=encoding, newline='') as f:
+                shutil.copyfileobj(f, sys.stdout)
+        return
+
+    for line in yield_spool_lines(spool_files, encoding):
+        sync_conn.ping(reconnect=True)
+        if re.match('USE .*;\n', line) is not None:
+            line = re.sub('USE .*;\n', '', line)
+        try:
+            sync_cursor.execute(line)
+        except:
+            logger.exception(f'Could not execute sql: {line}')
+            if args.flashback:
+                sys.exit(1)
+            logger.error(f'Exit at binlog file {binlog_file}')
+            break
+
+
+def parse_binlog_files_parallel(binlog_file_list, connection_settings, args):
+    """Parse binlog files in a process pool, then merge the spools in binlog file order.
+
+    Binlog files bigger than --split-size are cut at transaction boundaries, and the ranges are parsed in parallel
+    too. When the parse of a range stops early, like the sequential parse, the rest of the file is dropped.
+    """
+    if args.sync and not args.only_dml and not args.flashback:
+        logger.error('args --workers only work with DML SQL when use --sync. Please add --only-dml args.')
+        sys.exit(1)
+    if not binlog_file_list:
+        return
+
+    if not os.path.exists(args.tmp_dir):
+        os.makedirs(args.tmp_dir, exist_ok=True)
+    spool_root = tempfile.mkdtemp(prefix='spool_', dir=args.tmp_dir)
+
+    split_size = args.split_size * 1024 * 1024
+    if args.include_gtids and split_size:
+        # the parse of a file stops once every max gtid of --include-gtids is seen, which needs the whole file
+        logger.warning('Could not cut binlog files into ranges when use --include-gtids, parse them as a whole.')
+        split_size = 0
+
+    jobs = []
+    start_pos, end_pos = args.start_pos, args.end_pos
+    for i, binlog_file in enumerate(binlog_file_list):
+        # same as the sequential parse, positions only work until the first file which is not --start-file
+        if not i == 0 and not binlog_file == args.start_file:
+            start_pos, end_pos = None, None
+        # compressed binlogs can only be read from the start
+        if split_size and not is_stream_binlog(binlog_file) and os.path.getsize(binlog_file) > split_size:
+            file_ranges = split_binlog_file(binlog_file, split_size, args.index_dir, args.use_index)
+        else:
+            file_ranges = [None]
+        for k, file_range in enumerate(file_ranges):
+            spool_dir = os.path.join(spool_root, '%s.%s' % (i, k))
+            jobs.append((i, binlog_file, file_range, k == len(file_ranges) - 1, start_pos, end_pos,
+                         connection_settings, spool_dir, args))
+
+    if args.result_file:
+        logger.info(f'Saving result into file: [{args.result_file}]')
+    elif args.table_per_file:
+        logger.info(f'Saving table per file into dir: [{args.result_dir}]')
+
+    sync_conn = ''
+    sync_cursor = ''
+    try:
+        if args.sync:
+            sync_conn = connect2sync_mysql(args)
+            sync_cursor = sync_conn.cursor()
+        spool_dirs = []
+        stopped_file_index = None
+        with multiprocessing.Pool(min(args.workers, len(jobs))) as pool:
+            for i, binlog_file, spool_dir, last_part, stopped_early in pool.imap(parse_binlog_file_to_spool, jobs):
+                if i == stopped_file_index:
+                    shutil.rmtree(spool_dir, ignore_errors=True)
+                    continue
+                spool_dirs.append(spool_dir)
+                if stopped_early and not last_part:
+                    stopped_file_index = i
+                if last_part or stopped_early:
+                    merge_spools(i, binlog_file, spool_dirs, args, sync_conn, sync_cursor)
+                    for spool_dir in spool_dirs:
+                        shutil.rmtree(spool_dir, ignore_errors=True)
+                    spool_dirs = []
+    finally:
+        shutil.rmtree(spool_root, ignore_errors=True)
+        if sync_cursor:
+            sync_cursor.close()
+            sync_conn.close()
+
+
+class FollowedFileList(object):
+    """Binlog files of --file-dir while following them. get_binlog_file_list lists and filters the whole dir and
+    opens every tar archive, so it runs again only when the dir has changed, at most every FOLLOW_RELIST_INTERVAL
+    seconds, instead of on every poll"""
+
+    def __init__(self, args):
+        self.args = args
+        self.binlog_file_list = []
+        self.dir_mtime = None
+        self.listed_at = None
+
+    def get(self):
+        dir_mtime = os.stat(self.args.file_dir).st_mtime_ns
+        now = time.monotonic()
+        if dir_mtime != self.dir_mtime and (self.listed_at is None or now - self.listed_at >= FOLLOW_RELIST_INTERVAL):
+            self.binlog_file_list, _ = get_binlog_file_list(self.args)
+            self.dir_mtime, self.listed_at = dir_mtime, now
+        return self.binlog_file_list
+
+    def has_newer_binlog_file(self, binlog_file):
+        binlog_file_list = self.get()
+        return binlog_file in binlog_file_list and binlog_file != binlog_file_list[-1]
+
+
+def follow_binlog_files(binlog_file_list, connection_settings, args):
+    """Parse the binlog files one by one, wait for new events at the end of the last one until a newer file shows up"""
+    file_index = 0
+    followed_file_list = FollowedFileList(args)
+    while True:
+        for binlog_file in binlog_file_list:
+            if not file_index == 0 and not binlog_file == args.start_file:
+                args.start_pos = None
+                args.end_pos = None
+            logger.info('following binlog file: %s [%s]' %
+                        (binlog_file, timestamp_to_datetime(get_binlog_mtime(binlog_file))))
+            bin2sql = new_binlog_file2sql(binlog_file, file_index, connection_settings, args,
+                                          stop_following=lambda f=binlog_file:
+                                          followed_file_list.has_newer_binlog_file(f))
+            bin2sql.process_binlog()
+            file_index += 1
+            if bin2sql.stopped_early or (args.stop_file and get_inner_name(binlog_file) == args.stop_file):
+                return
+
+        # only parse the files after the last parsed one
+        last_file = binlog_file_list[-1] if binlog_file_list else None
+        while True:
+            new_file_list = followed_file_list.get()
+            if last_file in new_file_list:
+                new_file_list = new_file_list[new_file_list.index(last_file) + 1:]
+            if new_file_list:
+                binlog_file_list = new_file_list
+                break
+            time.sleep(FOLLOW_POLL_INTERVAL)
+
+
 # noinspection PyTypeChecker
 def main(args):
     connection_settings = {'host': args.host, 'port': args.port, 'user': args.user, 'passwd': args.password}
@@ -334,28 +732,25 @@ def main(args):
         if choice in ['y', '']:
             args.only_dml = True
 
+    if args.workers > 1:
+        parse_binlog_files_parallel(binlog_file_list, connection_settings, args)
+        return
+
+    if args.follow:
+        follow_binlog_files(binlog_file_list, connection_settings, args)
+        return
+
+    # the net changes of all the binlog files, saved with the last one
+    net_changes = NetChanges(args.tmp_dir, args.compact_memory_rows) if args.compact else None
     while True:
         for i, binlog_file in enumerate(binlog_file_list):
             if not i == 0 and not binlog_file == args.start_file:
                 args.start_pos = None
                 args.end_pos = None
             logger.info('parsing binlog file: %s [%s]' %
-                        (binlog_file, timestamp_to_datetime(os.stat(binlog_file).st_mtime)))
-            bin2sql = BinlogFile2sql(
-                file_path=binlog_file, connection_settings=connection_settings, start_pos=args.start_pos,
-                end_pos=args.end_pos, start_time=args.start_time, stop_time=args.stop_time,
-                only_schemas=args.databases, result_dir=args.result_dir, only_tables=args.tables, no_pk=args.no_pk,
-                flashback=args.flashback, only_dml=args.only_dml, sql_type=args.sql_type, file_index=i,
-                stop_never=args.stop_never, need_comment=args.need_comment, rename_db=args.rename_db,
-                only_pk=args.only_pk, result_file=args.result_file, table_per_file=args.table_per_file,
-                ignore_databases=args.ignore_databases, ignore_tables=args.ignore_tables, rename_tb=args.rename_tb,
-                ignore_columns=args.ignore_columns, replace=args.replace, insert_ignore=args.insert_ignore,
-                ignore_virtual_columns=args.ignore_virtual_columns, date_prefix=args.date_prefix,
-                remove_not_update_col=args.remove_not_update_col, no_date=args.no_date,
-                include_gtids=args.include_gtids, exclude_gtids=args.exclude_gtids, tmp_dir=args.tmp_dir,
-                update_to_replace=args.update_to_replace, keep_not_update_col=args.keep_not_update_col,
-                where=args.where, args=args,
-            )
+                        (binlog_file, timestamp_to_datetime(get_binlog_mtime(binlog_file))))
+            bin2sql = new_binlog_file2sql(binlog_file, i, connection_settings, args, net_changes=net_changes,
+                                          flush_net_changes=i == len(binlog_file_list) - 1)
             r = bin2sql.process_binlog()
             if not args.stop_never:
                 continue
@@ -9,8 +9,14 @@ import datetime
 import getpass
 import json
 import chardet
+import decimal
+import operator
 import pymysql
-from functools import partial
+from pymysql.charset import charset_by_name
+from pymysql.constants import SERVER_STATUS
+from collections import OrderedDict
+from itertools import repeat
+from pymysqlreplication.constants import FIELD_TYPE
 from pymysqlreplication.event import QueryEvent
 from pymysqlreplication.row_event import (
     WriteRowsEvent,
@@ -18,6 +24,8 @@ from pymysqlreplication.row_event import (
     DeleteRowsEvent,
 )
 from .other_utils import is_valid_datetime, logger
+from .gtid_set import GtidSet, GtidFilter
+from .sql_literal import render_literals
 from .sort_binlog2sql_result_utils import reversed_seq, yield_file
 
 if sys.version > '3':
@@ -25,6 +33,57 @@ if sys.version > '3':
 else:
     PY3PLUS = False
 
+# the tables preloaded in this process, see get_preloaded_tables
+_preloaded_tables = {}
+
+SQL_PLAN_CACHE_SIZE = 10000
+
+
+class PlanCache(OrderedDict):
+    """Plans by key, at most SQL_PLAN_CACHE_SIZE of them.
+
+    When it is full, the oldest plan is evicted unless it was used since it was saved or last passed over, then it
+    gets a second chance at the end (clock). A hit only marks the entry of the plan: moving it to the end would
+    hash the key again, which costs as much as the lookup for the long column tuples of the SQL templates.
+    """
+
+    def get_plan(self, key):
+        entry = self.get(key)
+        if entry is None:
+            return None
+        entry[1] = True
+        return entry[0]
+
+    def save_plan(self, key, plan):
+        if SQL_PLAN_CACHE_SIZE:
+            while len(self) >= SQL_PLAN_CACHE_SIZE:
+                old_key, entry = self.popitem(last=False)
+                if entry[1]:
+                    entry[1] = False
+                    self[old_key] = entry
+            self[key] = [plan, False]
+        return plan
+
+
+# SQL templates, rename targets and dropped columns of tables, see generate_sql_pattern
+_sql_plans = PlanCache()
+_sql_plan_options = None
+# result files of --table-per-file open at the same time, and the write buffer of each of them
+MAX_OPEN_RESULT_FILES = 128
+RESULT_FILE_BUFFER_SIZE = 64 * 1024
+# bytes of a statement merged by utils.sql_batch, the same as net_buffer_length of mysqldump
+DEFAULT_EXTENDED_INSERT_SIZE = 1024 * 1024
+# rows --compact keeps in memory before it spills them to a sqlite file in --tmp-dir
+DEFAULT_COMPACT_MEMORY_ROWS = 100000
+# values render_sql escapes as they are, binary values are rendered as hex literals
+PLAIN_TYPES = frozenset([type(None), int, float, str, bool, bytes, decimal.Decimal, datetime.datetime, datetime.date,
+                         datetime.time, datetime.timedelta])
+# bytes of the column types of a fixed size, to find the narrowest unique key, see get_where_key
+FIXED_COLUMN_WIDTHS = {FIELD_TYPE.TINY: 1, FIELD_TYPE.SHORT: 2, FIELD_TYPE.INT24: 3, FIELD_TYPE.LONG: 4,
+                       FIELD_TYPE.LONGLONG: 8, FIELD_TYPE.YEAR: 1, FIELD_TYPE.DATE: 3, FIELD_TYPE.NEWDATE: 3,
+                       FIELD_TYPE.TIME: 3, FIELD_TYPE.TIME2: 3, FIELD_TYPE.TIMESTAMP: 4, FIELD_TYPE.TIMESTAMP2: 4,
+                       FIELD_TYPE.DATETIME: 8, FIELD_TYPE.DATETIME2: 5}
+
 
 def parse_args():
     """parse args for binlog2sql"""
@@ -60,6 +119,9 @@ def extend_parser(parser, is_binlog_file=False):
                         help='tables you want to ignore', default='')
     schema.add_argument('-ic', '--ignore-columns', dest='ignore_columns', type=str, nargs='*',
                         help='columns you want to ignore', default='')
+    schema.add_argument('--preload-schema', dest='preload_schema', action='store_true', default=False,
+                        help='Read the columns of all tables matching the schema filter with one information_schema '
+                             'query at startup, instead of one query per table when it first shows up')
     if is_binlog_file:
         schema.add_argument('--ignore-virtual-columns', dest='ignore_virtual_columns', action='store_true',
                             help='Ignore virtual columns', default=False)
@@ -104,7 +166,8 @@ def extend_parser(parser, is_binlog_file=False):
     event.add_argument('-K', '--no-primary-key', dest='no_pk', action='store_true',
                        help='Generate insert sql without primary key if exists', default=False)
     event.add_argument('-KK', '--only-primary-key', dest='only_pk', action='store_true', default=False,
-                       help='Only key primary key condition when sql type is UPDATE and DELETE')
+                       help='Only key primary key condition when sql type is UPDATE and DELETE, tables without '
+                            'primary key use their narrowest unique key of NOT NULL columns')
     event.add_argument('-B', '--flashback', dest='flashback', action='store_true',
                        help='Flashback data to start_position of start_file', default=False)
     event.add_argument('--replace', dest='replace', action='store_true',
@@ -149,6 +212,40 @@ def extend_parser(parser, is_binlog_file=False):
                              'default: ${db}.${tb}_${date}.sql')
     result.add_argument('--where', dest='where', type=str, nargs='*',
                         help='filter result by specify conditions.')
+    result.add_argument('--extended-insert', dest='extended_insert', action='store_true', default=False,
+                        help='Merge the INSERT of consecutive rows of the same table and transaction into one '
+                             'extended INSERT, also with --replace, --insert-ignore and for DELETE rows of --flashback')
+    result.add_argument('--extended-insert-size', dest='extended_insert_size', type=int,
+                        default=DEFAULT_EXTENDED_INSERT_SIZE,
+                        help='Max bytes of an extended INSERT or a batched DELETE, keep it below max_allowed_packet '
+                             'of the instance the sql is executed on (with --sync the smaller max_allowed_packet of it '
+                             'is used). default: %(default)s')
+    result.add_argument('--batch-delete', dest='batch_delete', action='store_true', default=False,
+                        help='With --only-primary-key, merge the DELETE of consecutive rows of the same table and '
+                             'transaction into one DELETE ... WHERE pk IN (...), also for INSERT rows of --flashback')
+    result.add_argument('--merge-transactions', dest='merge_transactions', action='store_true', default=False,
+                        help='With --extended-insert or --batch-delete, also merge rows of different transactions')
+    result.add_argument('--compact', dest='compact', action='store_true', default=False,
+                        help='Only output the net change of every row of the parsed range, by primary key (or unique '
+                             'key): insert and updates become one insert, insert and delete become nothing, updates '
+                             'become one update. Also with --flashback')
+    result.add_argument('--compact-memory-rows', dest='compact_memory_rows', type=int,
+                        default=DEFAULT_COMPACT_MEMORY_ROWS,
+                        help='Rows --compact keeps in memory, more are spilled to a sqlite file in --tmp-dir. '
+                             'default: %(default)s')
+    result.add_argument('--wrap-transaction', dest='wrap_transaction', action='store_true', default=False,
+                        help='Write BEGIN; and COMMIT; around the sql of every transaction, so it is replayed (and '
+                             'executed by --sync) atomically like on the source')
+    result.add_argument('--format', dest='output_format', type=str, choices=['sql', 'jsonl', 'load-data'],
+                        default='sql',
+                        help='sql, or jsonl: one json object per row change with its before and after images, primary '
+                             'key, binlog position, time and gtid, for loaders which would parse the sql, or '
+                             'load-data: the INSERT rows (DELETE rows of --flashback) are written to tab separated '
+                             'files in --result-dir, and the sql output loads them with LOAD DATA LOCAL INFILE '
+                             'between the other sql, in the order of the binlog. default: %(default)s')
+    result.add_argument('--detect-charset', dest='detect_charset', action='store_true', default=False,
+                        help='Guess the charset of strings in json and array values with chardet when they are '
+                             'neither utf8 nor the charset of the column, default: write them as hex')
 
     sync_connect_setting = parser.add_argument_group('sync connect setting')
     sync_connect_setting.add_argument('--sync', dest='sync', action='store_true', default=False,
@@ -199,6 +296,41 @@ def command_line_args(args):
     else:
         args.password = args.password[0]
 
+    try:
+        get_gtid_set(args.include_gtids, args.exclude_gtids)
+    except ValueError as e:
+        logger.error(f'Args --include-gtids or --exclude-gtids: {e}')
+        sys.exit(1)
+    if args.batch_delete and not args.only_pk:
+        logger.error('Args --batch-delete only work with --only-primary-key.')
+        sys.exit(1)
+    if args.merge_transactions and not (args.extended_insert or args.batch_delete):
+        logger.error('Args --merge-transactions only work with --extended-insert or --batch-delete.')
+        sys.exit(1)
+    if args.extended_insert_size <= 0:
+        logger.error('Args --extended-insert-size must be greater than 0.')
+        sys.exit(1)
+    if args.compact and args.stop_never:
+        logger.error('Could not use --compact and --stop-never at the same time.')
+        sys.exit(1)
+    if args.compact_memory_rows <= 0:
+        logger.error('Args --compact-memory-rows must be greater than 0.')
+        sys.exit(1)
+    if args.wrap_transaction and (args.merge_transactions or args.compact or args.table_per_file):
+        logger.error('Could not use --wrap-transaction with --merge-transactions, --compact or --table-per-file.')
+        sys.exit(1)
+    if args.output_format == 'jsonl' and (args.sync or args.table_per_file or args.extended_insert or
+                                          args.batch_delete or args.compact or args.wrap_transaction):
+        logger.error('Could not use --format jsonl with --sync, --table-per-file, --extended-insert, --batch-delete, '
+                     '--compact or --wrap-transaction.')
+        sys.exit(1)
+    if args.output_format == 'load-data' and (args.sync or args.table_per_file or args.extended_insert or
+                                              args.batch_delete or args.compact or args.wrap_transaction or
+                                              args.stop_never):
+        logger.error('Could not use --format load-data with --sync, --table-per-file, --extended-insert, '
+                     '--batch-delete, --compact, --wrap-transaction or --stop-never.')
+        sys.exit(1)
+
     if args.sync:
         if not args.sync_password:
             args.sync_password = getpass.getpass('Sync Password: ')
@@ -213,67 +345,102 @@ def command_line_args(args):
     return args
 
 
-def compare_items(items):
-    # caution: if v is NULL, may need to process
-    (k, v) = items
-    if v is None:
-        return '`%s` IS %%s' % k
-    else:
-        return '`%s`=%%s' % k
+class ColumnDecoder(object):
+    """Decode the strings nested in the json and array values of a column.
+
+    utf8 is tried first, then the charset of the column. chardet is slow and only guesses, so it only runs with
+    --detect-charset, and the encoding it finds is kept for the next strings of the column.
+    """
+
+    def __init__(self, charset=None, detect_charset=False):
+        self.encodings = ['utf8']
+        if charset:
+            encoding = charset_by_name(charset).encoding if charset_by_name(charset) else charset
+            if encoding not in self.encodings:
+                self.encodings.append(encoding)
+        self.detect_charset = detect_charset
+
+    def decode(self, value: bytes):
+        for encoding in self.encodings:
+            try:
+                return value.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
+                continue
+
+        if self.detect_charset:
+            encoding = chardet.detect(value).get('encoding')
+            if encoding:
+                try:
+                    text = value.decode(encoding)
+                except (UnicodeDecodeError, LookupError):
+                    return None
+                self.encodings.append(encoding)
+                return text
+        return None
+
+
+# decodes the nested strings of values without a known column
+DEFAULT_DECODER = ColumnDecoder()
+
 
+def get_column_decoder(binlog_event, column, detect_charset=False):
+    key = ('DECODER', binlog_event.schema, binlog_event.table, column, detect_charset)
+    decoder = _sql_plans.get_plan(key)
+    if decoder is None:
+        charset = next((c.character_set_name for c in getattr(binlog_event, 'columns', None) or ()
+                        if c.name == column), None)
+        decoder = save_sql_plan(key, ColumnDecoder(charset, detect_charset))
+    return decoder
 
-def fix_object_bytes(value: bytes, is_bytes_column: bool = True):
+
+def fix_object_bytes(value: bytes, is_bytes_column: bool = True, decoder: ColumnDecoder = None):
     if is_bytes_column:
         value = '0x' + value.hex().upper()
         return value
 
-    try:
-        encoding = chardet.detect(value).get('encoding', '')
-        if not encoding:
-            encoding = 'utf8'
-        return value.decode(encoding)
-    except Exception:
-        value = '0x' + value.hex().upper()
-        return value
+    text = (decoder or DEFAULT_DECODER).decode(value)
+    if text is None:
+        return '0x' + value.hex().upper()
+    return text
 
 
-def fix_object_array(value: list):
+def fix_object_array(value: list, decoder: ColumnDecoder = None):
     new_list = []
     for v in value:
         # list里可能同时存在string、bytes(划重点)、array、json
         if isinstance(v, bytes):
-            v = fix_object_bytes(v, False)
+            v = fix_object_bytes(v, False, decoder)
         elif isinstance(v, list):
-            v = fix_object_array(v)
+            v = fix_object_array(v, decoder)
         elif isinstance(v, dict):
-            v = fix_object_json(v)
+            v = fix_object_json(v, decoder)
 
         # string直接原封不动存储
         new_list.append(v)
     return new_list
 
 
-def fix_object_json(value: dict):
+def fix_object_json(value: dict, decoder: ColumnDecoder = None):
     new_dict = {}
     for k, v in value.items():
         # json内部 key 可能是字符串或bytes，如果是bytes，则跳转到bytes解析
         if isinstance(k, bytes):
-            k = fix_object_bytes(k, False)
+            k = fix_object_bytes(k, False, decoder)
 
         # json内部的 value 则多种多样，可能为字符串、bytes(划重点)、array、json
         if isinstance(v, bytes):
-            v = fix_object_bytes(v, False)
+            v = fix_object_bytes(v, False, decoder)
         elif isinstance(v, list):
-            v = fix_object_array(v)
+            v = fix_object_array(v, decoder)
         elif isinstance(v, dict):
-            v = fix_object_json(v)
+            v = fix_object_json(v, decoder)
 
         # 字符串直接赋值即可
         new_dict[k] = v
     return new_dict
 
 
-def fix_object(value, is_return_type: bool = False):
+def fix_object(value, is_return_type: bool = False, decoder: ColumnDecoder = None):
     """Fixes python objects so that they can be properly inserted into SQL queries"""
     if is_return_type:
         return type(value)
@@ -284,10 +451,10 @@ def fix_object(value, is_return_type: bool = False):
         return fix_object_bytes(value)
     # 添加json数据解析
     elif PY3PLUS and isinstance(value, dict):
-        return fix_object_json(value)
+        return fix_object_json(value, decoder)
     # json里的数组解析
     elif PY3PLUS and isinstance(value, list):
-        return fix_object_array(value)
+        return fix_object_array(value, decoder)
     # python2 unicode
     elif not PY3PLUS and isinstance(value, unicode):
         return value.encode('utf-8')
@@ -313,6 +480,87 @@ def event_type(event):
     return t
 
 
+def get_ignored_rows_events(sql_type):
+    """Rows event classes not wanted by --sql-type, the reader can drop them before decoding"""
+    rows_events = {'INSERT': WriteRowsEvent, 'UPDATE': UpdateRowsEvent, 'DELETE': DeleteRowsEvent}
+    return [rows_event for t, rows_event in rows_events.items() if t not in sql_type]
+
+
+def preload_table_information(connection, only_schemas=None, only_tables=None, ignored_schemas=None,
+                              ignored_tables=None, ignore_virtual_columns=False):
+    """Columns of all tables matching the filters with one information_schema query, {(schema, table): columns}"""
+    conditions, values = [], []
+    for column, names, comparison in (('TABLE_SCHEMA', only_schemas, 'IN'), ('TABLE_NAME', only_tables, 'IN'),
+                                      ('TABLE_SCHEMA', ignored_schemas, 'NOT IN'),
+                                      ('TABLE_NAME', ignored_tables, 'NOT IN')):
+        if names:
+            conditions.append(f'{column} {comparison} %s')
+            values.append(tuple(names))
+    if ignore_virtual_columns:
+        conditions.append("EXTRA != 'VIRTUAL GENERATED'")
+
+    sql = """
+        SELECT
+            TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, COLLATION_NAME, CHARACTER_SET_NAME,
+            COLUMN_COMMENT, COLUMN_TYPE, COLUMN_KEY, ORDINAL_POSITION
+        FROM
+            information_schema.columns
+    """
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION'
+
+    tables = {}
+    with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute(sql, values)
+        for row in cursor.fetchall():
+            key = (row.pop('TABLE_SCHEMA'), row.pop('TABLE_NAME'))
+            tables.setdefault(key, []).append(row)
+    logger.info(f'Preloaded the columns of {len(tables)} tables.')
+    return tables
+
+
+def is_no_backslash_escapes(connection):
+    """Whether the sql_mode of the server has NO_BACKSLASH_ESCAPES, strings are escaped by doubling the quotes then"""
+    return bool(connection.server_status & SERVER_STATUS.SERVER_STATUS_NO_BACKSLASH_ESCAPES)
+
+
+def get_preloaded_tables(connection, only_schemas=None, only_tables=None, ignored_schemas=None, ignored_tables=None,
+                         ignore_virtual_columns=False):
+    """preload_table_information once per process, the binlog files parsed in it share the result"""
+    key = (connection.host, connection.port, tuple(only_schemas or ()), tuple(only_tables or ()),
+           tuple(ignored_schemas or ()), tuple(ignored_tables or ()), ignore_virtual_columns)
+    if key not in _preloaded_tables:
+        _preloaded_tables[key] = preload_table_information(
+            connection, only_schemas, only_tables, ignored_schemas, ignored_tables, ignore_virtual_columns)
+    return _preloaded_tables[key]
+
+
+def query_unique_keys(connection, schema, table):
+    """Unique keys of a table from information_schema.statistics, [{'columns': (...), 'nullable': .., 'prefix': ..}]
+
+    prefix is set for keys on a prefix of a column or on an expression, they are not unique on the column values.
+    """
+    sql = """
+        SELECT
+            INDEX_NAME, COLUMN_NAME, NULLABLE, SUB_PART
+        FROM
+            information_schema.statistics
+        WHERE
+            NON_UNIQUE = 0 AND TABLE_SCHEMA = %s AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """
+    keys = {}
+    with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute(sql, (schema, table))
+        for row in cursor.fetchall():
+            key = keys.setdefault(row['INDEX_NAME'], {'columns': (), 'nullable': False, 'prefix': False})
+            key['columns'] += (row['COLUMN_NAME'], )
+            key['nullable'] = key['nullable'] or row['NULLABLE'] == 'YES'
+            key['prefix'] = key['prefix'] or row['SUB_PART'] is not None or row['COLUMN_NAME'] is None
+    return list(keys.values())
+
+
 def handle_list(value: list):
     new_list = []
     for v in value:
@@ -327,41 +575,18 @@ def handle_list(value: list):
     return new_list
 
 
-def fix_hex_values(sql: str, values: list, types: list):
-    begin = 0
-    new_sql = ''
-    quote_end_idx = 0
-    while sql.find("'0x", begin) > 0:
-        # 拿第1个引号的下标
-        quote_begin_idx = sql.find("'0x", begin)
-        # 拿第2个引号的下标
-        quote_end_idx = sql.find("'", quote_begin_idx + 1)
-        # 获取 0x 开头的值
-        quote_value = sql[quote_begin_idx + 1:quote_end_idx]
-
-        # 确认 0x 开头的值是十六进制的值，还是字符串
-        quote_value_idx = values.index(quote_value)
-        quote_value_type = types[quote_value_idx]
-        if quote_value_type == str:
-            # 保留原样
-            new_sql += sql[begin:quote_end_idx + 1]
-        else:
-            # 去除 十六进制值 前后的引号
-            new_sql += sql[begin:quote_begin_idx] + sql[quote_begin_idx + 1:quote_end_idx]
-
-        begin = quote_end_idx + 1
-
-    if new_sql:
-        new_sql += sql[quote_end_idx + 1:]
-
-    return new_sql
-
-
-def concat_sql_from_binlog_event(cursor, binlog_event, row=None, e_start_pos=None, flashback=False, no_pk=False,
+def concat_sql_from_binlog_event(binlog_event, row=None, e_start_pos=None, flashback=False, no_pk=False,
                                  rename_db_dict=None, rename_tb_dict=None, only_pk=False, only_return_sql=True,
                                  ignore_columns=None, replace=False, insert_ignore=False, ignore_virtual_columns=False,
                                  remove_not_update_col=False, binlog_gtid=None, update_to_replace=False,
-                                 keep_not_update_col: list = None, filter_conditions: list = None):
+                                 keep_not_update_col: list = None, filter_conditions: list = None,
+                                 no_backslash_escapes=False, detect_charset=False, return_pattern=False):
+    """sql, or (sql, db, table) unless only_return_sql, of a row of a rows event or of a ddl.
+
+    With return_pattern the pattern of the row is returned after them, with the escaped values as literals and the
+    start, end and rest of the comment, so utils.sql_batch can merge rows without parsing the sql. It is None for
+    a ddl and for a row --where does not match.
+    """
     if flashback and no_pk:
         raise ValueError('only one of flashback or no_pk can be True')
     if not (isinstance(binlog_event, WriteRowsEvent) or isinstance(binlog_event, UpdateRowsEvent)
@@ -371,30 +596,34 @@ def concat_sql_from_binlog_event(cursor, binlog_event, row=None, e_start_pos=Non
     sql = ''
     db = ''
     table = ''
+    pattern = None
     if isinstance(binlog_event, WriteRowsEvent) or isinstance(binlog_event, UpdateRowsEvent) \
             or isinstance(binlog_event, DeleteRowsEvent):
         # 会调用 fix_object 函数生成sql
-        (pattern, db, table), types = generate_sql_pattern(
+        pattern, db, table = generate_sql_pattern(
             binlog_event, row=row, flashback=flashback, no_pk=no_pk, rename_db_dict=rename_db_dict, only_pk=only_pk,
-            ignore_columns=ignore_columns, replace=replace, insert_ignore=insert_ignore, return_type=True,
+            ignore_columns=ignore_columns, replace=replace, insert_ignore=insert_ignore,
             ignore_virtual_columns=ignore_virtual_columns, remove_not_update_col=remove_not_update_col,
             update_to_replace=update_to_replace, keep_not_update_col=keep_not_update_col,
-            filter_conditions=filter_conditions, rename_tb_dict=rename_tb_dict,
+            filter_conditions=filter_conditions, rename_tb_dict=rename_tb_dict, detect_charset=detect_charset,
         )
 
         if pattern['values']:
-            # cursor.mogrify 处理 value 时，会返回一个字符串，如果 value 里包含 dict，则会报错
+            # render_literals 处理 value 时，会返回一个字符串，如果 value 里包含 dict，则会报错
             if isinstance(pattern['values'], list):
                 pattern_values = handle_list(pattern['values'])
             else:
                 pattern_values = pattern['values']
-            sql = cursor.mogrify(pattern['template'], pattern_values)
-            if "'0x" in str(sql):
-                sql = fix_hex_values(sql, pattern_values, types)
-            time = datetime.datetime.fromtimestamp(binlog_event.timestamp)
-            sql += ' #start %s end %s time %s' % (e_start_pos, binlog_event.packet.log_pos, time)
+            # bytes 类型的值（二进制字段）直接输出为不带引号的十六进制
+            literals = render_literals(pattern_values, no_backslash_escapes, hex_bytes=True)
+            rest = ' time %s' % datetime.datetime.fromtimestamp(binlog_event.timestamp)
             if binlog_gtid:
-                sql += ' gtid %s' % binlog_gtid
+                rest += ' gtid %s' % binlog_gtid
+            sql = pattern['template'] % tuple(literals)
+            sql += ' #start %s end %s%s' % (e_start_pos, binlog_event.packet.log_pos, rest)
+            pattern.update(literals=literals, start=e_start_pos, end=binlog_event.packet.log_pos, rest=rest)
+        else:
+            pattern = None
     elif flashback is False and isinstance(binlog_event, QueryEvent) and binlog_event.query != 'BEGIN' \
             and binlog_event.query != 'COMMIT':
         sql = '{0};'.format(fix_object(binlog_event.query))
@@ -408,10 +637,11 @@ def concat_sql_from_binlog_event(cursor, binlog_event, row=None, e_start_pos=Non
             if re.match('CREATE DATABASE', sql.upper()) is not None:
                 sql += '\nUSE {0};'.format(schema)
 
-    if not only_return_sql:
-        return sql, db, table
-    else:
+    if only_return_sql:
         return sql
+    if return_pattern:
+        return sql, db, table, pattern
+    return sql, db, table
 
 
 def check_condition_match_row(filter_conditions, values, check_match_flag):
@@ -468,19 +698,141 @@ def check_condition_match_row(filter_conditions, values, check_match_flag):
     return check_match_flag
 
 
+def get_column_width(column):
+    """Bytes of the values of a column, from the metadata of the table map event"""
+    for attr in ('max_length', 'size', 'bytes'):
+        width = getattr(column, attr, None)
+        if width:
+            return width
+    if column.type == FIELD_TYPE.NEWDECIMAL:
+        return column.precision // 2 + 1
+    return FIXED_COLUMN_WIDTHS.get(column.type, 255)
+
+
+def get_where_key(binlog_event):
+    """Columns the WHERE clause of --only-primary-key matches on.
+
+    The primary key, else the narrowest unique key of NOT NULL columns, else () to match on all columns.
+    """
+    primary_key = binlog_event.primary_key
+    if primary_key:
+        return primary_key if isinstance(primary_key, tuple) else (primary_key, )
+
+    key = ('WHERE KEY', binlog_event.schema, binlog_event.table, getattr(binlog_event, 'table_id', None))
+    where_key = _sql_plans.get_plan(key)
+    if where_key is None:
+        # the readers look up the unique keys with the connection they read the columns of tables with
+        get_unique_keys = getattr(getattr(binlog_event, '_ctl_connection', None), '_get_unique_keys', None)
+        unique_keys = get_unique_keys(binlog_event.schema, binlog_event.table) if get_unique_keys else []
+        widths = {column.name: get_column_width(column) for column in getattr(binlog_event, 'columns', None) or ()}
+        candidates = [unique_key['columns'] for unique_key in unique_keys
+                      if not unique_key['nullable'] and not unique_key['prefix'] and
+                      all(c in widths for c in unique_key['columns'])]
+        where_key = min(candidates, key=lambda columns: (sum(widths[c] for c in columns), len(columns)), default=())
+        if where_key:
+            logger.info(f'Table {binlog_event.schema}.{binlog_event.table} has no primary key, '
+                        f'use unique key ({", ".join(where_key)}) for the WHERE clause.')
+        save_sql_plan(key, where_key)
+    return where_key
+
+
 def get_pk_item(binlog_event, values):
-    primary_keys = binlog_event.primary_key
-    if not isinstance(primary_keys, tuple):
-        primary_keys = (primary_keys, )
+    """Values of the columns of get_where_key, all values if the table has no key to match on"""
+    where_key = get_where_key(binlog_event)
+    if not where_key:
+        return values
     return {
-        i: values.get(i) for i in primary_keys
+        i: values.get(i) for i in where_key
     }
 
 
+def check_sql_plan_options(rename_db_dict, rename_tb_dict, ignore_columns, ignore_virtual_columns):
+    """The cached plans are only valid for the same options, forget them when the options change"""
+    global _sql_plan_options
+    plan_options = (rename_db_dict, rename_tb_dict, ignore_columns, ignore_virtual_columns)
+    if plan_options != _sql_plan_options:
+        _sql_plans.clear()
+        _sql_plan_options = plan_options
+
+
+def save_sql_plan(key, plan):
+    return _sql_plans.save_plan(key, plan)
+
+
+def get_sql_template(shape, db, tb, set_keys, where_keys, where_nulls):
+    """(SQL template, head) of a row, built once per table, column list and NULL columns of the WHERE clause.
+
+    The head is the template up to the values of an INSERT or up to the WHERE clause of a DELETE, which utils.sql_batch
+    merges rows behind, None for the other shapes.
+    """
+    key = (shape, db, tb, set_keys, where_keys, where_nulls)
+    plan = _sql_plans.get_plan(key)
+    if plan is not None:
+        return plan
+
+    if where_keys is not None:
+        if where_nulls is None:
+            where = ' AND '.join('`%s`=%%s' % k for k in where_keys)
+        else:
+            where = ' AND '.join('`%s` IS %%s' % k if is_null else '`%s`=%%s' % k
+                                 for k, is_null in zip(where_keys, where_nulls))
+    head = None
+    if shape == 'DELETE':
+        head = 'DELETE FROM `{0}`.`{1}` WHERE '.format(db, tb)
+        template = head + where + ' LIMIT 1;'
+    elif shape == 'UPDATE':
+        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} LIMIT 1;'.format(
+            db, tb, ', '.join(['`%s`=%%s' % k for k in set_keys]), where)
+    elif shape == 'REPLACE SET':
+        template = 'REPLACE INTO `{0}`.`{1}` SET {2};'.format(db, tb, ', '.join(['`%s`=%%s' % k for k in set_keys]))
+    else:
+        # INSERT INTO, INSERT IGNORE INTO or REPLACE INTO
+        head = '{0} `{1}`.`{2}`({3}) VALUES '.format(shape, db, tb, ', '.join(map(lambda k: '`%s`' % k, set_keys)))
+        template = head + '({0});'.format(', '.join(['%s'] * len(set_keys)))
+
+    return save_sql_plan(key, (template, head))
+
+
+def get_rename_target(schema, table, rename_db_dict, rename_tb_dict):
+    key = ('RENAME', schema, table)
+    target = _sql_plans.get_plan(key)
+    if target is None:
+        specified_rename_db = rename_db_dict.get(schema) if rename_db_dict else ''
+        default_rename_db = rename_db_dict.get('*') if rename_db_dict and '*' in rename_db_dict else schema
+        specified_rename_tb = rename_tb_dict.get(table) if rename_tb_dict else ''
+        default_rename_tb = rename_tb_dict.get('*') if rename_tb_dict and '*' in rename_tb_dict else table
+        target = save_sql_plan(key, (specified_rename_db if specified_rename_db else default_rename_db,
+                                     specified_rename_tb if specified_rename_tb else default_rename_tb))
+    return target
+
+
+def get_dropped_columns(keys, ignore_columns, ignore_virtual_columns):
+    """Columns of a row image removed by --ignore-columns, or the dropped columns of --ignore-virtual-columns"""
+    key = ('DROP', keys)
+    dropped = _sql_plans.get_plan(key)
+    if dropped is None:
+        if ignore_columns:
+            dropped = tuple(k for k in keys if k in ignore_columns)
+        else:
+            dropped = tuple(k for k in keys if re.search(r'__dropped_col_\d+__', k) is not None)
+        save_sql_plan(key, dropped)
+    return dropped
+
+
+def drop_columns(values, ignore_columns, ignore_virtual_columns):
+    for k in get_dropped_columns(tuple(values), ignore_columns, ignore_virtual_columns):
+        values.pop(k)
+
+
+def get_where_nulls(where_values):
+    return tuple(map(operator.is_, where_values, repeat(None))) if None in where_values else None
+
+
 def generate_sql_pattern(binlog_event, row=None, flashback=False, no_pk=False, rename_db_dict=None, rename_tb_dict=None,
                          only_pk=False, ignore_columns=None, replace=False, insert_ignore=False,
                          ignore_virtual_columns=False, remove_not_update_col=False, return_type=False,
-                         update_to_replace=False, keep_not_update_col: list = None, filter_conditions: list = None):
+                         update_to_replace=False, keep_not_update_col: list = None, filter_conditions: list = None,
+                         detect_charset=False):
     # 检查是否有符合条件的数据：-1 表示默认值，0 表示不符合，1 表示符合
     check_match_flag = -1
 
@@ -491,205 +843,105 @@ def generate_sql_pattern(binlog_event, row=None, flashback=False, no_pk=False, r
         elif isinstance(binlog_event, UpdateRowsEvent):
             check_match_flag = check_condition_match_row(filter_conditions, row['before_values'], check_match_flag)
 
-    if ignore_columns and is_dml_event(binlog_event):
-        if isinstance(binlog_event, WriteRowsEvent) or isinstance(binlog_event, DeleteRowsEvent):
-            for k in row['values'].copy():
-                if k in ignore_columns:
-                    row['values'].pop(k)
-        else:
-            for k in row['before_values'].copy():
-                if k in ignore_columns:
-                    row['before_values'].pop(k)
-            for k in row['after_values'].copy():
-                if k in ignore_columns:
-                    row['after_values'].pop(k)
-    elif ignore_virtual_columns and is_dml_event(binlog_event):
+    check_sql_plan_options(rename_db_dict, rename_tb_dict, ignore_columns, ignore_virtual_columns)
+
+    if (ignore_columns or ignore_virtual_columns) and is_dml_event(binlog_event):
         if isinstance(binlog_event, WriteRowsEvent) or isinstance(binlog_event, DeleteRowsEvent):
-            for k in row['values'].copy():
-                if re.search(r'__dropped_col_\d+__', k) is not None:
-                    row['values'].pop(k)
+            drop_columns(row['values'], ignore_columns, ignore_virtual_columns)
         else:
-            for k in row['before_values'].copy():
-                if re.search(r'__dropped_col_\d+__', k) is not None:
-                    row['before_values'].pop(k)
-            for k in row['after_values'].copy():
-                if re.search(r'__dropped_col_\d+__', k) is not None:
-                    row['after_values'].pop(k)
+            drop_columns(row['before_values'], ignore_columns, ignore_virtual_columns)
+            drop_columns(row['after_values'], ignore_columns, ignore_virtual_columns)
 
     if remove_not_update_col and isinstance(binlog_event, UpdateRowsEvent):
-        for k, old_v in row['before_values'].copy().items():
-            new_v = row['after_values'].copy().get(k)
+        before_values, after_values = row['before_values'], row['after_values']
+        where_key = get_where_key(binlog_event)
+        for k, old_v in list(before_values.items()):
+            new_v = after_values.get(k)
             if old_v == new_v:
-                if k == binlog_event.primary_key:
-                    row['after_values'].pop(k)
-                elif isinstance(binlog_event.primary_key, tuple) and k in binlog_event.primary_key:
-                    row['after_values'].pop(k)
+                if k in where_key:
+                    after_values.pop(k)
                 elif keep_not_update_col and k in keep_not_update_col:
-                    # row['after_values'].pop(k)
                     continue
                 else:
-                    row['before_values'].pop(k)
-                    row['after_values'].pop(k)
+                    before_values.pop(k)
+                    after_values.pop(k)
 
     template = ''
     values = []
     types = []
+    shape = head = key_columns = None
     db = binlog_event.schema
     table = binlog_event.table
-    fix_object_new = partial(fix_object, is_return_type=True)
 
     if check_match_flag in [-1, 1]:
-        specified_rename_db = rename_db_dict.get(binlog_event.schema) if rename_db_dict else ''
-        default_rename_db = rename_db_dict.get('*') if rename_db_dict and '*' in rename_db_dict else binlog_event.schema
-        db = specified_rename_db if specified_rename_db else default_rename_db
-
-        specified_rename_tb = rename_tb_dict.get(binlog_event.table) if rename_tb_dict else ''
-        default_rename_tb = rename_tb_dict.get('*') if rename_tb_dict and '*' in rename_tb_dict else binlog_event.table
-        tb = specified_rename_tb if specified_rename_tb else default_rename_tb
+        db, tb = get_rename_target(binlog_event.schema, binlog_event.table, rename_db_dict, rename_tb_dict)
+        insert_shape = 'REPLACE INTO' if replace else 'INSERT IGNORE INTO' if insert_ignore else 'INSERT INTO'
 
+        # the columns of SET or VALUES, the columns of WHERE, and the values the types are returned of
+        set_values = where_values = type_values = None
         if flashback is True:
             if isinstance(binlog_event, WriteRowsEvent):
-                if not only_pk:
-                    template = 'DELETE FROM `{0}`.`{1}` WHERE {2} LIMIT 1;'.format(
-                        db, tb,
-                        ' AND '.join(map(compare_items, row['values'].items()))
-                    )
-                    values = map(fix_object, row['values'].values())
-                    types = map(fix_object_new, row['values'].values())
-                else:
-                    pk_item = get_pk_item(binlog_event, row["values"])
-                    template = 'DELETE FROM `{0}`.`{1}` WHERE {2} LIMIT 1;'.format(
-                        db, tb,
-                        ' AND '.join(map(compare_items, pk_item.items()))
-                    )
-                    values = map(fix_object, pk_item.values())
-                    types = map(fix_object_new, row['values'].values())
+                shape = 'DELETE'
+                where_values = get_pk_item(binlog_event, row['values']) if only_pk else row['values']
+                type_values = row['values'].values()
             elif isinstance(binlog_event, DeleteRowsEvent):
-                if replace:
-                    template = 'REPLACE INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
-                        db, tb,
-                        ', '.join(map(lambda key: '`%s`' % key, row['values'].keys())),
-                        ', '.join(['%s'] * len(row['values']))
-                    )
-                elif insert_ignore:
-                    template = 'INSERT IGNORE INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
-                        db, tb,
-                        ', '.join(map(lambda key: '`%s`' % key, row['values'].keys())),
-                        ', '.join(['%s'] * len(row['values']))
-                    )
-                else:
-                    template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
-                        db, tb,
-                        ', '.join(map(lambda key: '`%s`' % key, row['values'].keys())),
-                        ', '.join(['%s'] * len(row['values']))
-                    )
-                values = map(fix_object, row['values'].values())
-                types = map(fix_object_new, row['values'].values())
-            elif isinstance(binlog_event, UpdateRowsEvent):
-                if not update_to_replace:
-                    if not only_pk:
-                        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} LIMIT 1;'.format(
-                            db, tb,
-                            ', '.join(['`%s`=%%s' % x for x in row['before_values'].keys()]),
-                            ' AND '.join(map(compare_items, row['after_values'].items())))
-                        values = map(fix_object,
-                                     list(row['before_values'].values()) + list(row['after_values'].values()))
-                        types = map(
-                            fix_object_new, list(row['before_values'].values()) + list(row['after_values'].values())
-                        )
-                    else:
-                        pk_item = get_pk_item(binlog_event, row["after_values"])
-                        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} LIMIT 1;'.format(
-                            db, tb,
-                            ', '.join(['`%s`=%%s' % x for x in row['before_values'].keys()]),
-                            ' AND '.join(map(compare_items, pk_item.items())))
-                        values = map(fix_object, list(row['before_values'].values()) + list(pk_item.values()))
-                        types = map(fix_object_new, list(row['before_values'].values()) + list(pk_item.values()))
-                else:
-                    template = 'REPLACE INTO `{0}`.`{1}` SET {2};'.format(
-                        db, tb,
-                        ', '.join(['`%s`=%%s' % x for x in row['before_values'].keys()]))
-                    values = map(fix_object, list(row['before_values'].values()))
-                    types = map(fix_object_new, list(row['before_values'].values()))
+                shape = insert_shape
+                set_values = row['values']
+            elif update_to_replace:
+                shape = 'REPLACE SET'
+                set_values = row['before_values']
+            else:
+                shape = 'UPDATE'
+                set_values = row['before_values']
+                where_values = get_pk_item(binlog_event, row['after_values']) if only_pk else row['after_values']
         else:
             if isinstance(binlog_event, WriteRowsEvent):
-                if no_pk:
-                    if binlog_event.primary_key:
-                        if isinstance(binlog_event.primary_key, tuple):
-                            for key in binlog_event.primary_key:
-                                row['values'].pop(key)
-                        else:
-                            row['values'].pop(binlog_event.primary_key)
-
-                if replace:
-                    template = 'REPLACE INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
-                        db, tb,
-                        ', '.join(map(lambda key: '`%s`' % key, row['values'].keys())),
-                        ', '.join(['%s'] * len(row['values']))
-                    )
-
-                elif insert_ignore:
-                    template = 'INSERT IGNORE INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
-                        db, tb,
-                        ', '.join(map(lambda key: '`%s`' % key, row['values'].keys())),
-                        ', '.join(['%s'] * len(row['values']))
-                    )
-                else:
-                    template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
-                        db, tb,
-                        ', '.join(map(lambda key: '`%s`' % key, row['values'].keys())),
-                        ', '.join(['%s'] * len(row['values']))
-                    )
-                values = map(fix_object, row['values'].values())
-                types = map(fix_object_new, row['values'].values())
-            elif isinstance(binlog_event, DeleteRowsEvent):
-                if not only_pk:
-                    template = 'DELETE FROM `{0}`.`{1}` WHERE {2} LIMIT 1;'.format(
-                        db, tb, ' AND '.join(map(compare_items, row['values'].items())))
-                    values = map(fix_object, row['values'].values())
-                    types = map(fix_object_new, row['values'].values())
-                else:
-                    pk_item = get_pk_item(binlog_event, row["values"])
-                    template = 'DELETE FROM `{0}`.`{1}` WHERE {2} LIMIT 1;'.format(
-                        db, tb, ' AND '.join(map(compare_items, pk_item.items())))
-                    values = map(fix_object, pk_item.values())
-                    types = map(fix_object_new, pk_item.values())
-            elif isinstance(binlog_event, UpdateRowsEvent):
-                if not update_to_replace:
-                    if not only_pk:
-                        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} LIMIT 1;'.format(
-                            db, tb,
-                            ', '.join(['`%s`=%%s' % k for k in row['after_values'].keys()]),
-                            ' AND '.join(map(compare_items, row['before_values'].items()))
-                        )
-                        values = map(fix_object,
-                                     list(row['after_values'].values()) + list(row['before_values'].values()))
-                        types = map(fix_object_new,
-                                    list(row['after_values'].values()) + list(row['before_values'].values()))
+                if no_pk and binlog_event.primary_key:
+                    if isinstance(binlog_event.primary_key, tuple):
+                        for key in binlog_event.primary_key:
+                            row['values'].pop(key)
                     else:
-                        pk_item = get_pk_item(binlog_event, row["before_values"])
-                        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} LIMIT 1;'.format(
-                            db, tb,
-                            ', '.join(['`%s`=%%s' % k for k in row['after_values'].keys()]),
-                            ' AND '.join(map(compare_items, pk_item.items()))
-                        )
-                        values = map(fix_object, list(row['after_values'].values()) + list(pk_item.values()))
-                        types = map(fix_object_new, list(row['after_values'].values()) + list(pk_item.values()))
-                else:
-                    template = 'REPLACE INTO `{0}`.`{1}` SET {2};'.format(
-                        db, tb,
-                        ', '.join(['`%s`=%%s' % k for k in row['after_values'].keys()])
-                    )
-                    values = map(fix_object, list(row['after_values'].values()))
-                    types = map(fix_object_new, list(row['after_values'].values()))
+                        row['values'].pop(binlog_event.primary_key)
+                shape = insert_shape
+                set_values = row['values']
+            elif isinstance(binlog_event, DeleteRowsEvent):
+                shape = 'DELETE'
+                where_values = get_pk_item(binlog_event, row['values']) if only_pk else row['values']
+            elif update_to_replace:
+                shape = 'REPLACE SET'
+                set_values = row['after_values']
+            else:
+                shape = 'UPDATE'
+                set_values = row['after_values']
+                where_values = get_pk_item(binlog_event, row['before_values']) if only_pk else row['before_values']
+
+        values = list(set_values.values()) if set_values is not None else []
+        if where_values is not None:
+            values += where_values.values()
+        template, head = get_sql_template(
+            shape, db, tb, tuple(set_values) if set_values is not None else None,
+            tuple(where_values) if where_values is not None else None,
+            get_where_nulls(values[-len(where_values):]) if where_values else None
+        )
+        if shape == 'DELETE' and only_pk and get_where_key(binlog_event):
+            # the row is deleted by its key, the only values of the WHERE clause
+            key_columns = tuple(where_values)
+        value_types = list(map(type, values))
+        types = list(map(type, type_values)) if type_values is not None else value_types
+        # only sets, json and arrays need fix_object
+        if not PLAIN_TYPES.issuperset(value_types):
+            keys = list(set_values or ()) + list(where_values or ())
+            values = [v if t in PLAIN_TYPES else
+                      fix_object(v, decoder=get_column_decoder(binlog_event, k, detect_charset))
+                      for k, v, t in zip(keys, values, value_types)]
 
     result = (
-        {'template': template, 'values': list(values)},
+        {'template': template, 'values': values, 'shape': shape, 'head': head, 'key_columns': key_columns},
         db,
         table,
     )
     if return_type:
-        return result, list(types)
+        return result, types
     return result
 
 
@@ -699,72 +951,12 @@ def get_gtid_set(include_gtids, exclude_gtids):
     # 6ea67fc8-c260-11eb-8c17-00163e0ef40e:1-99954068,
     # b1f3ee7b-b46d-11eb-9806-00163e0ef40e:4790-196015:196017-2588749,
     # fcb79f76-b484-11eb-9d4c-00163e047dcb:7273871-7277930
-    gtid_set = {}
-    if include_gtids:
-        gtid_set['include'] = {}
-        gtids = include_gtids.split(',')
-        for gtid in gtids:
-            gtid_splited = gtid.split(':')
-            uuid = gtid_splited[0]
-            if uuid not in gtid_set:
-                gtid_set['include'][uuid] = []
-            txn_range = gtid_splited[1:]
-            gtid_set['include'][uuid].extend(txn_range)
-
-    if exclude_gtids:
-        gtid_set['exclude'] = {}
-        gtids = exclude_gtids.split(',')
-        for gtid in gtids:
-            gtid_splited = gtid.split(':')
-            uuid = gtid_splited[0]
-            if uuid not in gtid_set:
-                gtid_set['exclude'][uuid] = []
-            txn_range = gtid_splited[1:]
-            gtid_set['exclude'][uuid].extend(txn_range)
-
-    return gtid_set
-
-
-def is_want_gtid(gtid_set, gtid):
-    gtid_split = gtid.split(':')
-    uuid = gtid_split[0]
-    txn = int(gtid_split[1])
-    if 'include' in gtid_set and uuid in gtid_set['include']:
-        txn_ranges = gtid_set['include'][uuid]
-        for txn_range in txn_ranges:
-            txn_split = txn_range.split('-')
-            txn_min = int(txn_split[0])
-            txn_max = int(txn_split[1]) if len(txn_split) > 1 else txn_min
-            if txn_min <= txn <= txn_max:
-                return True
-        else:
-            return False
-    elif 'exclude' in gtid_set and uuid in gtid_set['exclude']:
-        txn_ranges = gtid_set['exclude'][uuid]
-        for txn_range in txn_ranges:
-            txn_split = txn_range.split('-')
-            txn_min = int(txn_split[0])
-            txn_max = int(txn_split[1]) if len(txn_split) > 1 else txn_min
-            if txn_min <= txn <= txn_max:
-                return False
-        else:
-            return True
+    return GtidFilter(GtidSet.parse(include_gtids) if include_gtids else None,
+                      GtidSet.parse(exclude_gtids) if exclude_gtids else None)
 
 
 def get_max_gtid(include_gtid_set):
-    gtid_max_dict = {}
-    for uuid, txn_ranges in include_gtid_set.items():
-        for txn_range in txn_ranges:
-            txn_split = txn_range.split('-')
-            txn_min = int(txn_split[0])
-            txn_max = int(txn_split[1]) if len(txn_split) > 1 else txn_min
-            if uuid in gtid_max_dict:
-                gtid_max = gtid_max_dict[uuid]
-                if txn_max > gtid_max:
-                    gtid_max_dict[uuid] = txn_max
-            else:
-                gtid_max_dict[uuid] = txn_max
-    return gtid_max_dict
+    return include_gtid_set.max_gnos() if include_gtid_set is not None else {}
 
 
 def remove_max_gtid(gtid_max_dict, gtid):
@@ -791,6 +983,55 @@ def dt_now(datetime_format: str = None) -> str:
     return datetime.datetime.now().strftime(datetime_format)
 
 
+class TableFileWriter(object):
+    """Append the sql of --table-per-file to the result file of its table.
+
+    The files are kept open and buffered, the least recently used one is closed when max_open files are open.
+    The date in the file names is taken once, and again by rotate.
+    """
+
+    def __init__(self, result_dir, date_prefix=False, no_date=False, max_open=MAX_OPEN_RESULT_FILES, encoding='utf8'):
+        self.result_dir = result_dir
+        self.date_prefix = date_prefix
+        self.no_date = no_date
+        self.max_open = max_open
+        self.encoding = encoding
+        # name -> open file, in the order of their last write
+        self.files = OrderedDict()
+        self.date = dt_now()
+
+    def get_filename(self, name):
+        if self.date_prefix:
+            filename = f'{self.date}.{name}.sql'
+        elif self.no_date:
+            filename = f'{name}.sql'
+        else:
+            filename = f'{name}.{self.date}.sql'
+        return os.path.join(self.result_dir, filename)
+
+    def write(self, name, msg):
+        """Append msg to the result file of name, db.table or others"""
+        f = self.files.get(name)
+        if f is None:
+            if len(self.files) >= self.max_open:
+                self.files.popitem(last=False)[1].close()
+            f = self.files[name] = open(self.get_filename(name), 'a', encoding=self.encoding,
+                                        buffering=RESULT_FILE_BUFFER_SIZE)
+        else:
+            self.files.move_to_end(name)
+        f.write(msg)
+
+    def rotate(self):
+        """Close the files and take the date of the file names again"""
+        self.close()
+        self.date = dt_now()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+
 def get_table_name(sql):
     table_name = ''
     if sql.strip().upper().startswith('DELETE'):
@@ -815,29 +1056,14 @@ def handle_rollback_sql(f_result_sql_file, table_per_file, date_prefix, no_date,
         reversed_seq(src_file, chunk_size, tmp_dir, result_file, encoding=encoding)
     else:
         tmp_file = src_file + '_tmp'
+        table_file_writer = TableFileWriter(result_dir, date_prefix, no_date) if table_per_file else None
         try:
             reversed_seq(src_file, chunk_size, tmp_dir, tmp_file, encoding=encoding)
             if os.path.exists(tmp_file):
                 logger.info('handling...')
                 for line in yield_file(tmp_file, chunk_size=1, encoding=encoding):
                     if table_per_file:
-                        table_name = get_table_name(line)
-                        if table_name:
-                            if date_prefix:
-                                filename = f'{dt_now()}.{table_name}.sql'
-                            elif no_date:
-                                filename = f'{table_name}.sql'
-                            else:
-                                filename = f'{table_name}.{dt_now()}.sql'
-                        else:
-                            if date_prefix:
-                                filename = f'{dt_now()}.others.sql'
-                            elif no_date:
-                                filename = f'others.sql'
-                            else:
-                                filename = f'others.{dt_now()}.sql'
-                        result_sql_file = os.path.join(result_dir, filename)
-                        save_result_sql(result_sql_file, line)
+                        table_file_writer.write(get_table_name(line) or 'others', line)
                     elif sync_cursor:
                         sync_conn.ping(reconnect=True)
                         if re.match('USE .*;\n', line) is not None:
@@ -852,6 +1078,8 @@ def handle_rollback_sql(f_result_sql_file, table_per_file, date_prefix, no_date,
             else:
                 logger.error('binlog 解析无结果')
         finally:
+            if table_file_writer:
+                table_file_writer.close()
             if os.path.exists(tmp_file):
                 os.remove(tmp_file)
     return
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import os
+import bz2
+import gzip
+import lzma
+import tarfile
+
+# a binlog inside a tar archive is given as <archive path>::<member name>
+MEMBER_SEP = '::'
+
+BINLOG_MAGIC = b'\xfebin'
+COMPRESSION_MAGICS = [
+    ('gz', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+]
+COMPRESSION_OPENERS = {
+    'gz': gzip.open,
+    'bz2': bz2.open,
+    'xz': lzma.open,
+}
+
+
+def split_member_path(binlog_file):
+    """Return (archive path, member name), member name is None if binlog_file is not in a tar archive"""
+    if MEMBER_SEP in binlog_file:
+        archive, member = binlog_file.split(MEMBER_SEP, 1)
+        return archive, member
+    return binlog_file, None
+
+
+def get_compression(file_path):
+    """Compression of the file by its magic bytes: gz, bz2, xz, or None"""
+    with open(file_path, 'rb') as f:
+        magic = f.read(6)
+    for compression, compression_magic in COMPRESSION_MAGICS:
+        if magic.startswith(compression_magic):
+            return compression
+    return None
+
+
+def is_tar_archive(file_path):
+    """A raw binlog is never read as a tar archive, tar archives may be compressed too"""
+    with open(file_path, 'rb') as f:
+        if f.read(4) == BINLOG_MAGIC:
+            return False
+    try:
+        return tarfile.is_tarfile(file_path)
+    except (OSError, EOFError, tarfile.TarError, lzma.LZMAError):
+        return False
+
+
+def list_archive_members(archive):
+    """Names of the regular files in a tar archive, in archive order"""
+    with tarfile.open(archive, 'r:*') as tar:
+        return [member.name for member in tar.getmembers() if member.isfile()]
+
+
+def get_inner_name(file_name):
+    """Name of a binlog file without the compression suffix, or the base name of a tar member"""
+    _, member = split_member_path(file_name)
+    if member is not None:
+        return os.path.basename(member)
+    for compression in COMPRESSION_OPENERS:
+        if file_name.endswith('.' + compression):
+            return file_name[:-len(compression) - 1]
+    return file_name
+
+
+def is_stream_binlog(binlog_file):
+    """True if the binlog can only be read as a stream: a tar member or a compressed file"""
+    archive, member = split_member_path(binlog_file)
+    return member is not None or get_compression(archive) is not None
+
+
+def get_binlog_mtime(binlog_file):
+    return os.stat(split_member_path(binlog_file)[0]).st_mtime
+
+
+class TarMemberFile(object):
+    """Read one member of a tar archive, close the archive together with the member"""
+
+    def __init__(self, archive, member):
+        self._tar = tarfile.open(archive, 'r:*')
+        try:
+            self._f = self._tar.extractfile(member)
+        except KeyError:
+            self._tar.close()
+            raise FileNotFoundError(f'No member {member} in tar archive {archive}')
+        if self._f is None:
+            self._tar.close()
+            raise IsADirectoryError(f'Member {member} of tar archive {archive} is not a regular file')
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+    def close(self):
+        self._f.close()
+        self._tar.close()
+
+
+def open_binlog_stream(binlog_file):
+    """Open a tar member or compressed binlog as a decompressed stream, return None for a raw binlog file"""
+    archive, member = split_member_path(binlog_file)
+    if member is not None:
+        return TarMemberFile(archive, member)
+    compression = get_compression(binlog_file)
+    if compression is not None:
+        return COMPRESSION_OPENERS[compression](binlog_file, 'rb')
+    return None
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+import os
+import mmap
+import struct
+from bisect import bisect_left
+from pymysqlreplication.constants.BINLOG import (
+    QUERY_EVENT, ROTATE_EVENT, TABLE_MAP_EVENT, GTID_LOG_EVENT, ANONYMOUS_GTID_LOG_EVENT)
+from .other_utils import logger
+
+INDEX_SUFFIX = '.b2s.idx'
+
+# magic, indexed size, first event timestamp, max event timestamp so far, type of the last event,
+# sid and gno of the current transaction
+_HEADER = struct.Struct('<8sQIIB16sQ')
+_HEADER_MAGIC = b'B2SIDX01'
+# offset, timestamp, max timestamp of all events before this one, type, flags, gtid sid, gtid gno, table_id
+_ENTRY = struct.Struct('<IIIBB16sQQ')
+_EMPTY_SID = b'\x00' * 16
+
+ENTRY_TRANSACTION_START = 0x01
+
+
+def get_index_file(binlog_file, index_dir=None):
+    binlog_dir, binlog_name = os.path.split(binlog_file)
+    return os.path.join(index_dir if index_dir else binlog_dir, binlog_name + INDEX_SUFFIX)
+
+
+def format_uuid(sid):
+    nibbles = sid.hex()
+    return '%s-%s-%s-%s-%s' % (nibbles[:8], nibbles[8:12], nibbles[12:16], nibbles[16:20], nibbles[20:])
+
+
+class BinlogIndex(object):
+    """Sidecar index of a binlog file.
+
+    One entry per transaction start (GTID event, or BEGIN without a GTID), table map and rotate event,
+    so --start-pos, --start-datetime and --include-gtids can be answered with a binary search instead
+    of decoding the file from position 4. The index is extended incrementally when the binlog grows,
+    and kept in memory only if persist is False or the index file can not be written.
+    """
+
+    def __init__(self, binlog_file, index_dir=None, persist=True):
+        self.binlog_file = binlog_file
+        self.index_file = get_index_file(binlog_file, index_dir)
+
+        self.offsets = []
+        self.timestamps = []
+        self.max_ts_before = []
+        self.event_types = []
+        self.flags = []
+        self.gtids = []
+        self.table_ids = []
+
+        # the transaction starts, for the seeks by time and gtid without a scan of all entries
+        self.transaction_offsets = []
+        self.transaction_max_ts_before = []
+        # gtid sid -> [(gno, offset)] of its transactions, sids whose gnos are not in order
+        self.gno_lists = {}
+        self.unordered_sids = set()
+        self.first_anonymous = None
+
+        self.indexed_size = 4
+        self._first_ts = 0
+        self._max_ts = 0
+        self._last_type = 0
+        self._sid = _EMPTY_SID
+        self._gno = 0
+        self._persist = persist
+
+        self.__load()
+
+    def __load(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'rb') as f:
+                data = f.read()
+            magic, indexed_size, first_ts, max_ts, last_type, sid, gno = _HEADER.unpack_from(data, 0)
+        except (OSError, struct.error):
+            logger.warning(f'Ignore unreadable binlog index file: [{self.index_file}]')
+            return
+
+        if magic != _HEADER_MAGIC or indexed_size > os.path.getsize(self.binlog_file) or \
+                first_ts != self.__read_first_ts():
+            # the binlog has been replaced by another file with the same name
+            logger.warning(f'Rebuild stale binlog index file: [{self.index_file}]')
+            return
+
+        count = (len(data) - _HEADER.size) // _ENTRY.size
+        for entry in _ENTRY.iter_unpack(data[_HEADER.size:_HEADER.size + count * _ENTRY.size]):
+            self.__append(*entry)
+        self.indexed_size = indexed_size
+        self._first_ts, self._max_ts, self._last_type, self._sid, self._gno = first_ts, max_ts, last_type, sid, gno
+
+    def __read_first_ts(self):
+        with open(self.binlog_file, 'rb') as f:
+            f.seek(4)
+            header = f.read(4)
+        return struct.unpack('<I', header)[0] if len(header) == 4 else 0
+
+    def __append(self, offset, timestamp, max_ts_before, event_type, flags, sid, gno, table_id):
+        self.offsets.append(offset)
+        self.timestamps.append(timestamp)
+        self.max_ts_before.append(max_ts_before)
+        self.event_types.append(event_type)
+        self.flags.append(flags)
+        self.gtids.append((sid, gno))
+        self.table_ids.append(table_id)
+        if not flags & ENTRY_TRANSACTION_START:
+            return
+
+        self.transaction_offsets.append(offset)
+        self.transaction_max_ts_before.append(max_ts_before)
+        if sid == _EMPTY_SID:
+            if self.first_anonymous is None:
+                self.first_anonymous = offset
+            return
+        gno_list = self.gno_lists.get(sid)
+        if gno_list is None:
+            gno_list = self.gno_lists[sid] = []
+        elif gno_list[-1][0] > gno:
+            self.unordered_sids.add(sid)
+        gno_list.append((gno, offset))
+
+    def update(self):
+        """Index the complete events appended to the binlog since the last update"""
+        size = os.path.getsize(self.binlog_file)
+        if size <= self.indexed_size:
+            return self
+
+        new_entries = []
+        with open(self.binlog_file, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                pos = self.indexed_size
+                if pos == 4 and size >= 23:
+                    self._first_ts = struct.unpack_from('<I', buf, 4)[0]
+                while pos + 19 <= size:
+                    timestamp, event_type, _, event_size, _, _ = struct.unpack_from('<IBIIIH', buf, pos)
+                    if event_size < 19 or pos + event_size > size:
+                        # partial event at the end of a growing binlog
+                        break
+
+                    indexed = True
+                    if event_type == GTID_LOG_EVENT:
+                        self._sid = buf[pos + 20:pos + 36]
+                        self._gno = struct.unpack_from('<Q', buf, pos + 36)[0]
+                    elif event_type == ANONYMOUS_GTID_LOG_EVENT:
+                        self._sid, self._gno = _EMPTY_SID, 0
+                    elif event_type == QUERY_EVENT and \
+                            self._last_type not in (GTID_LOG_EVENT, ANONYMOUS_GTID_LOG_EVENT) and \
+                            self.__is_begin(buf, pos, event_size):
+                        # transaction without any gtid event, binlog written by mysql 5.6 or earlier
+                        self._sid, self._gno = _EMPTY_SID, 0
+                    elif event_type not in (TABLE_MAP_EVENT, ROTATE_EVENT):
+                        indexed = False
+
+                    if indexed:
+                        flags = 0 if event_type in (TABLE_MAP_EVENT, ROTATE_EVENT) else ENTRY_TRANSACTION_START
+                        table_id = 0
+                        if event_type == TABLE_MAP_EVENT:
+                            table_id = struct.unpack_from('<Q', buf[pos + 19:pos + 25] + b'\x00\x00')[0]
+                        entry = (pos, timestamp, self._max_ts, event_type, flags, self._sid, self._gno, table_id)
+                        self.__append(*entry)
+                        new_entries.append(entry)
+
+                    self._max_ts = max(self._max_ts, timestamp)
+                    self._last_type = event_type
+                    pos += event_size
+            finally:
+                buf.close()
+
+        if pos > self.indexed_size:
+            self.indexed_size = pos
+            self.__save(new_entries)
+        return self
+
+    @staticmethod
+    def __is_begin(buf, pos, event_size):
+        schema_length = buf[pos + 19 + 8]
+        status_vars_length = struct.unpack_from('<H', buf, pos + 19 + 11)[0]
+        query_pos = pos + 19 + 13 + status_vars_length + schema_length + 1
+        # the query may be followed by a 4 bytes crc32 checksum
+        return buf[query_pos:query_pos + 5] == b'BEGIN' and pos + event_size - query_pos in (5, 9)
+
+    def __save(self, new_entries):
+        if not self._persist:
+            return
+        header = _HEADER.pack(_HEADER_MAGIC, self.indexed_size, self._first_ts, self._max_ts, self._last_type,
+                              self._sid, self._gno)
+        try:
+            appending = os.path.exists(self.index_file) and os.path.getsize(self.index_file) >= _HEADER.size and \
+                len(self.offsets) > len(new_entries)
+            with open(self.index_file, 'r+b' if appending else 'wb') as f:
+                if appending:
+                    # entries are fixed size, drop a half written tail before appending
+                    f.truncate(_HEADER.size + (len(self.offsets) - len(new_entries)) * _ENTRY.size)
+                    f.seek(0, os.SEEK_END)
+                else:
+                    f.write(header)
+                f.write(b''.join(_ENTRY.pack(*entry) for entry in new_entries))
+                f.seek(0)
+                f.write(header)
+        except OSError as e:
+            logger.warning(f'Could not save binlog index file [{self.index_file}], keep it in memory only: {e}')
+            self._persist = False
+
+    def seek_position(self, start_pos=None):
+        """Offset of the last indexed event before start_pos, events ending at start_pos are still read"""
+        if not start_pos:
+            return 4
+        i = bisect_left(self.offsets, start_pos)
+        return self.offsets[i - 1] if i else 4
+
+    def seek_timestamp(self, start_timestamp=None):
+        """Offset of the last transaction before which every event is older than start_timestamp"""
+        if not start_timestamp:
+            return 4
+        if self._max_ts < start_timestamp:
+            # every indexed event is older, continue after them
+            return self.indexed_size
+        # max_ts_before never decreases, so it can be searched even if event timestamps are not ordered
+        i = bisect_left(self.transaction_max_ts_before, start_timestamp)
+        return self.transaction_offsets[i - 1] if i else 4
+
+    def seek_gtid(self, include_gtids=None):
+        """Offset of the first transaction whose gtid is in the GtidSet include_gtids, or which has no gtid at all"""
+        if not include_gtids:
+            return 4
+
+        candidates = [] if self.first_anonymous is None else [self.first_anonymous]
+        for uuid, txn_ranges in include_gtids.items():
+            try:
+                sid = bytes.fromhex(uuid.replace('-', ''))
+            except ValueError:
+                continue
+            gno_list = self.gno_lists.get(sid)
+            if not gno_list:
+                continue
+            ordered = sid not in self.unordered_sids
+            for txn_min, txn_max in txn_ranges:
+                if ordered:
+                    i = bisect_left(gno_list, (txn_min, 0))
+                    if i < len(gno_list) and gno_list[i][0] <= txn_max:
+                        candidates.append(gno_list[i][1])
+                else:
+                    candidates.extend(offset for gno, offset in gno_list if txn_min <= gno <= txn_max)
+
+        if candidates:
+            return min(candidates)
+        # no wanted transaction has been indexed yet
+        return self.indexed_size
+
+    def seek(self, start_pos=None, start_timestamp=None, include_gtids=None):
+        """Every one of the filters is required, so reading can start at the furthest of their offsets"""
+        return max(
+            self.seek_position(start_pos),
+            self.seek_timestamp(start_timestamp),
+            self.seek_gtid(include_gtids),
+        )
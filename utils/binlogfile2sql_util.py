@@ -1,15 +1,25 @@
 # -*- coding: utf-8 -*-
 import os
+import mmap
 import pymysql
 import struct
 import argparse
 import getpass
 import sys
+import time
+import re
 from pymysql.cursors import DictCursor
 from .other_utils import logger, sep
-from .binlog2sql_util import is_valid_datetime, extend_parser
+from .binlog2sql_util import is_valid_datetime, extend_parser, query_unique_keys, get_gtid_set
+from .binlog_index import BinlogIndex, ENTRY_TRANSACTION_START, format_uuid
+from .binlog_archive import open_binlog_stream
+from .transaction_payload import TRANSACTION_PAYLOAD_EVENT, read_payload_header, iter_payload_events, \
+    read_net_field_length
 from pymysqlreplication.packet import BinLogPacketWrapper
-from pymysqlreplication.constants.BINLOG import TABLE_MAP_EVENT, ROTATE_EVENT
+from pymysqlreplication.constants.BINLOG import (
+    TABLE_MAP_EVENT, ROTATE_EVENT, STOP_EVENT, FORMAT_DESCRIPTION_EVENT, WRITE_ROWS_EVENT_V1, UPDATE_ROWS_EVENT_V1,
+    DELETE_ROWS_EVENT_V1, WRITE_ROWS_EVENT_V2, UPDATE_ROWS_EVENT_V2, DELETE_ROWS_EVENT_V2, GTID_LOG_EVENT,
+    ANONYMOUS_GTID_LOG_EVENT)
 from pymysqlreplication.event import (
     QueryEvent, RotateEvent, FormatDescriptionEvent,
     XidEvent, GtidEvent, StopEvent,
@@ -26,12 +36,26 @@ except ImportError:
     COM_BINLOG_DUMP_GTID = 0x1e
 
 from io import BytesIO
-from pymysql.util import byte2int
 
 # 2013 Connection Lost
 # 2006 MySQL server has gone away
 MYSQL_EXPECTED_ERROR_CODES = [2013, 2006]
 
+# bytes read at once from a compressed binlog or tar member
+STREAM_CHUNK_SIZE = 1024 * 1024
+# seconds to wait before checking again whether a followed binlog has grown
+FOLLOW_POLL_INTERVAL = 1
+# seconds between two listings of --file-dir while following, it is listed again only if it has changed
+FOLLOW_RELIST_INTERVAL = 5
+BINLOG_CHECKSUM_ALG_CRC32 = 1
+
+# event type -> event class, which BinLogPacketWrapper keeps private
+EVENT_MAP = BinLogPacketWrapper._BinLogPacketWrapper__event_map
+ROWS_EVENT_TYPES = frozenset([WRITE_ROWS_EVENT_V1, UPDATE_ROWS_EVENT_V1, DELETE_ROWS_EVENT_V1,
+                              WRITE_ROWS_EVENT_V2, UPDATE_ROWS_EVENT_V2, DELETE_ROWS_EVENT_V2])
+# events of a transaction which is not wanted by the gtid filter, they are skipped before decoding
+SKIPPED_TRANSACTION_EVENT_TYPES = ROWS_EVENT_TYPES.union([TABLE_MAP_EVENT, TRANSACTION_PAYLOAD_EVENT])
+
 
 class StringIOAdvance(BytesIO):
     def advance(self, length):
@@ -49,12 +73,19 @@ class BinLogFileReader(object):
                  log_file=None, log_pos=None, filter_non_implemented_events=True, stop_pos=None, ignored_events=None,
                  auto_position=None, only_tables=None, ignored_tables=None, only_schemas=None, ignored_schemas=None,
                  freeze_schema=False, skip_to_timestamp=None, slave_uuid=None, pymysql_wrapper=None,
-                 fail_on_table_metadata_unavailable=False, slave_heartbeat=None, ignore_virtual_columns=False):
+                 fail_on_table_metadata_unavailable=False, slave_heartbeat=None, ignore_virtual_columns=False,
+                 use_index=False, index_dir=None, start_timestamp=None, gtid_filter=None, file_range=None,
+                 idle_callback=None, schema_cache=None, schema_provider=None, preloaded_tables=None):
 
         # open file
         self._file = None
+        # the mapped file, or a window of the decompressed stream which starts at offset _base of the binlog
+        self._buffer = None
+        self._base = 0
+        self._stream = None
         self._file_path = file_path
         self._pos = None
+        self._size = 0
 
         self.__connected_stream = False
         self.__connected_ctl = False
@@ -78,6 +109,10 @@ class BinLogFileReader(object):
         # we need them for handling other operations
         self.__allowed_events_in_packet = frozenset(
             [TableMapEvent, RotateEvent]).union(self.__allowed_events)
+        # the same filter on the event type byte of the header, to skip the event without decoding it
+        self.__skipped_event_types = frozenset(
+            t for t, event_class in EVENT_MAP.items() if event_class not in self.__allowed_events_in_packet)
+        self.__skip_not_implemented_events = NotImplementedEvent not in self.__allowed_events_in_packet
 
         # Store table meta information
         self.table_map = {}
@@ -93,28 +128,72 @@ class BinLogFileReader(object):
         self.slave_heartbeat = slave_heartbeat
         self.ignore_virtual_columns = ignore_virtual_columns
 
+        # seek with the sidecar index instead of decoding everything before the wanted events
+        self.__use_index = use_index
+        self.__index_dir = index_dir
+        self.__start_timestamp = start_timestamp
+        # the GtidFilter of --include-gtids and --exclude-gtids, the table map and rows events of unwanted
+        # transactions are skipped on their header
+        self.__gtid_filter = gtid_filter if gtid_filter else None
+        self.__skip_transaction = False
+
+        # (start offset, stop offset, table map offsets) of a part of the file, see split_binlog_file
+        self.__file_range = file_range
+        self.__table_map_offsets = dict(file_range[2]) if file_range else {}
+
+        # events of the transaction payload event being read
+        self.__payload_events = None
+
+        # with blocking, wait at the end of the binlog for more events until a rotate or stop event is read, or
+        # idle_callback returns True. idle_callback is called every time before waiting
+        self.__idle_callback = idle_callback
+        self.__end_of_binlog = False
+        self.__last_try = False
+
+        # a SchemaCache to look up columns of tables in before querying information_schema
+        self.__schema_cache = schema_cache
+        # column types of the table map event being decoded, the signature of its schema cache entry
+        self.__table_map_column_types = None
+        # a LocalSchemaProvider to read the columns of tables from instead of mysql
+        self.__schema_provider = schema_provider
+        # {(schema, table): columns} read at startup, see preload_table_information
+        self.__preloaded_tables = preloaded_tables
+
         if pymysql_wrapper:
             self.pymysql_wrapper = pymysql_wrapper
         else:
             self.pymysql_wrapper = pymysql.connect
 
-        # checksum with database
-        self.__use_checksum = self.__checksum_enabled()
+        # checksum with database, or from the format description event of the binlog without mysql
+        self.__use_checksum = None if schema_provider else self.__checksum_enabled()
 
     def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._buffer = None
         if self._file:
             self._file.close()
             self._file_path = None
+        if self.__schema_cache is not None:
+            self.__schema_cache.save()
         if self.__connected_ctl:
             self._ctl_connection._get_table_information = None
+            self._ctl_connection._get_unique_keys = None
             self._ctl_connection.close()
             self.__connected_ctl = False
 
     def __connect_to_ctl(self):
+        if self.__schema_provider is not None:
+            self._ctl_connection = self.__schema_provider.connect()
+            self._ctl_connection._get_table_information = self.__get_table_information
+            self._ctl_connection._get_unique_keys = self.__get_unique_keys
+            self.__connected_ctl = True
+            return
         self._ctl_connection_settings["db"] = "information_schema"
         self._ctl_connection_settings["cursorclass"] = DictCursor
         self._ctl_connection = self.pymysql_wrapper(**self._ctl_connection_settings)
         self._ctl_connection._get_table_information = self.__get_table_information
+        self._ctl_connection._get_unique_keys = self.__get_unique_keys
         self.__connected_ctl = True
 
     def __checksum_enabled(self):
@@ -138,9 +217,9 @@ class BinLogFileReader(object):
 
     def __connect_to_stream(self):
         if self._file is None:
-            self._file = open(self._file_path, 'rb+')
-            self._pos = self._file.tell()
-            assert self._pos == 0
+            self._stream = open_binlog_stream(self._file_path)
+            self._file = self._stream if self._stream is not None else open(self._file_path, 'rb')
+            self._pos = 0
         # read magic
         if self._pos == 0:
             magic = self._file.read(4)
@@ -151,45 +230,131 @@ class BinLogFileReader(object):
                 message = messagefmt.format(magic, self._expected_magic)
                 raise BadMagicBytesError(message)
 
+        if self._stream is not None:
+            # compressed binlogs and tar members can only be read forward, without index or file range
+            self._buffer = bytearray(magic)
+            self._size = len(magic)
+            if self.__use_checksum is None:
+                self.__use_checksum = self.__checksum_from_format_description()
+            return
+
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.__use_checksum is None:
+            self.__use_checksum = self.__checksum_from_format_description()
+
+        if self.__file_range:
+            start_offset, stop_offset, _ = self.__file_range
+            self._pos = max(self._pos, start_offset)
+            if stop_offset:
+                self._size = min(self._size, stop_offset)
+
+        if self.__use_index and self._pos == 4:
+            index = BinlogIndex(self._file_path, self.__index_dir).update()
+            seek_pos = index.seek(self.start_pos, self.__start_timestamp,
+                                  self.__gtid_filter.include if self.__gtid_filter else None)
+            if seek_pos > self._pos:
+                logger.info(f'Seek to position {seek_pos} of binlog file {self._file_path} by index')
+                self._pos = seek_pos
+
+    def __checksum_from_format_description(self):
+        """Return True if the server which wrote the binlog used binlog-checksum = CRC32"""
+        if self._size < 4 + 19 and not self.__fill(4 + 19):
+            return False
+        offset = 4 - self._base
+        if self._buffer[offset + 4] != FORMAT_DESCRIPTION_EVENT:
+            return False
+        event_size = struct.unpack_from('<I', self._buffer, offset + 9)[0]
+        if self._size < 4 + event_size and not self.__fill(4 + event_size):
+            return False
+        offset = 4 - self._base
+        # binlog version (2 bytes), server version (50 bytes) ... checksum algorithm (1 byte), checksum (4 bytes)
+        server_version = bytes(self._buffer[offset + 21:offset + 71]).split(b'\x00', 1)[0].decode()
+        version = tuple(int(v) for v in re.findall(r'\d+', server_version)[:3])
+        # the checksum algorithm is written since mysql 5.6.1
+        if version < (5, 6, 1):
+            return False
+        return self._buffer[offset + event_size - 5] == BINLOG_CHECKSUM_ALG_CRC32
+
     def fetchone(self):
         while True:
             if not self._file:
                 self.__connect_to_stream()
 
-            if not self.__connected_ctl and self._ctl_connection_settings:
+            if not self.__connected_ctl and (self._ctl_connection_settings or self.__schema_provider):
                 self.__connect_to_ctl()
 
-            # read pkt
-            pkt = StringIOAdvance()
-            # headerlength 19
-            header = self._file.read(19)
-            if not header:
-                break
+            if self.__payload_events is not None:
+                buf = next(self.__payload_events, None)
+                if buf is None:
+                    self.__payload_events = None
+                    continue
+                offset, event_size, use_checksum = 1, len(buf) - 1, False
+            else:
+                # headerlength 19
+                pos = self._pos
+                if pos + 19 > self._size and not self.__fill(pos + 19):
+                    if self.__wait():
+                        continue
+                    break
+
+                event_size = struct.unpack_from('<I', self._buffer, pos - self._base + 9)[0]
+                if event_size < 19:
+                    raise EventSizeTooSmallError(
+                        'Event size %s at pos %s is smaller than the header' % (event_size, pos))
+                if pos + event_size > self._size and not self.__fill(pos + event_size):
+                    # partial event at the end of a binlog which is being written
+                    if self.__wait():
+                        continue
+                    break
+                self._pos = pos + event_size
+                buf, offset, use_checksum = self._buffer, pos - self._base, self.__use_checksum
+                if buf[offset + 4] in (ROTATE_EVENT, STOP_EVENT):
+                    self.__end_of_binlog = True
+
+                # events ending before --start-pos are dropped below anyway, skip them without decoding
+                if self.start_pos and struct.unpack_from('<I', buf, offset + 13)[0] < self.start_pos:
+                    continue
 
-            unpacked = struct.unpack('<IcIIIH', header)
-            timestamp = unpacked[0]
-            event_type = byte2int(unpacked[1])
-            server_id = unpacked[2]
-            event_size = unpacked[3]
-            log_pos = unpacked[4]
-            flags = unpacked[5]
-
-            body = self._file.read(event_size - 19)
-            pkt.write(b'0')
-            pkt.write(header)
-            pkt.write(body)
-            pkt.seek(0)
-
-            binlog_event = BinLogPacketWrapper(pkt, self.table_map,
-                                               self._ctl_connection,
-                                               self.__use_checksum,
-                                               self.__allowed_events_in_packet,
-                                               self.__only_tables,
-                                               self.__ignored_tables,
-                                               self.__only_schemas,
-                                               self.__ignored_schemas,
-                                               self.__freeze_schema,
-                                               self.__fail_on_table_metadata_unavailable)
+                if self.__gtid_filter is not None:
+                    header_type = buf[offset + 4]
+                    if header_type == GTID_LOG_EVENT:
+                        # flags (1 byte), sid (16 bytes), gno (8 bytes)
+                        gno = struct.unpack_from('<Q', buf, offset + 36)[0]
+                        self.__skip_transaction = not self.__gtid_filter.wanted(
+                            format_uuid(buf[offset + 20:offset + 36]), gno)
+                    elif header_type == ANONYMOUS_GTID_LOG_EVENT:
+                        self.__skip_transaction = False
+                    elif self.__skip_transaction and header_type in SKIPPED_TRANSACTION_EVENT_TYPES:
+                        continue
+
+                if buf[offset + 4] == TRANSACTION_PAYLOAD_EVENT:
+                    # binlog_transaction_compression, read the events of the transaction from the payload
+                    compression_type, payload_start, payload_end = read_payload_header(
+                        buf, offset + 19, offset + event_size - (4 if use_checksum else 0))
+                    log_pos = struct.unpack_from('<I', buf, offset + 13)[0]
+                    self.__payload_events = iter_payload_events(
+                        buf[payload_start:payload_end], compression_type, log_pos)
+                    continue
+
+            # events BinLogPacketWrapper would return without any event are skipped on their header
+            event_type = buf[offset + 4]
+            if event_type in self.__skipped_event_types or \
+                    (self.__skip_not_implemented_events and event_type not in EVENT_MAP):
+                continue
+            if event_type in ROWS_EVENT_TYPES:
+                table_id = struct.unpack_from('<Q', buf[offset + 19:offset + 25] + b'\x00\x00')[0]
+                if self.__table_map_offsets:
+                    self.__replay_table_map(table_id)
+                # the table map event of a filtered table is never added to the table map
+                if table_id not in self.table_map:
+                    continue
+            elif event_type == TABLE_MAP_EVENT:
+                schema, table, self.__table_map_column_types = self.__read_table_map_header(buf, offset)
+                if self.__table_filtered(schema, table):
+                    continue
+
+            binlog_event = self.__read_packet(buf, offset, event_size, use_checksum)
 
             if not binlog_event.event or binlog_event.log_pos < self.start_pos:
                 continue
@@ -252,6 +417,98 @@ class BinLogFileReader(object):
 
             return binlog_event.event
 
+    def __fill(self, end):
+        """Read the stream until the buffer holds the binlog up to end, return False at the end of the stream"""
+        if self._stream is None:
+            return self.__blocking and self.__remap(end)
+        # keep the byte before the current event, it is read as the OK byte
+        consumed = self._pos - 1 - self._base
+        if consumed > 0:
+            del self._buffer[:consumed]
+            self._base += consumed
+        while self._size < end:
+            chunk = self._stream.read(max(end - self._size, STREAM_CHUNK_SIZE))
+            if not chunk:
+                return False
+            self._buffer += chunk
+            self._size += len(chunk)
+        return True
+
+    def __remap(self, end):
+        """Map the binlog again if it has grown, return True if it is mapped up to end now"""
+        size = os.fstat(self._file.fileno()).st_size
+        if size > self._size:
+            self._buffer.close()
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._size = size
+        return end <= self._size
+
+    def __wait(self):
+        """Wait for more events of a growing binlog, return False if there will be none"""
+        if not self.__blocking or self.__end_of_binlog or self._stream is not None:
+            return False
+        if self.__idle_callback is not None and self.__idle_callback():
+            # read once more the events written before the callback gave up
+            if self.__last_try:
+                return False
+            self.__last_try = True
+            return True
+        time.sleep(FOLLOW_POLL_INTERVAL)
+        return True
+
+    def __read_packet(self, buf, offset, event_size, use_checksum):
+        # One slice of the mapped file per event, BytesIO shares the buffer of the bytes object instead of
+        # copying it again. The byte before the event stands in for the OK byte of a network packet.
+        pkt = StringIOAdvance(buf[offset - 1:offset + event_size])
+
+        return BinLogPacketWrapper(pkt, self.table_map,
+                                   self._ctl_connection,
+                                   use_checksum,
+                                   self.__allowed_events_in_packet,
+                                   self.__only_tables,
+                                   self.__ignored_tables,
+                                   self.__only_schemas,
+                                   self.__ignored_schemas,
+                                   self.__freeze_schema,
+                                   self.__fail_on_table_metadata_unavailable)
+
+    @staticmethod
+    def __read_table_map_header(buf, offset):
+        """Return (schema, table, column types) of a raw table map event"""
+        schema_pos = offset + 19 + 8
+        schema_length = buf[schema_pos]
+        table_pos = schema_pos + 1 + schema_length + 1
+        table_length = buf[table_pos]
+        schema = buf[schema_pos + 1:schema_pos + 1 + schema_length].decode()
+        table = buf[table_pos + 1:table_pos + 1 + table_length].decode()
+        column_count, types_pos = read_net_field_length(buf, table_pos + 1 + table_length + 1)
+        return schema, table, bytes(buf[types_pos:types_pos + column_count])
+
+    def __table_filtered(self, schema, table):
+        """Same schema and table filters as TableMapEvent, on the raw event"""
+        if self.__only_tables is not None and table not in self.__only_tables:
+            return True
+        elif self.__ignored_tables is not None and table in self.__ignored_tables:
+            return True
+        if self.__only_schemas is not None and schema not in self.__only_schemas:
+            return True
+        elif self.__ignored_schemas is not None and schema in self.__ignored_schemas:
+            return True
+        return False
+
+    def __replay_table_map(self, table_id):
+        """Decode the table map event written before the start of the file range, when a rows event needs it"""
+        if table_id in self.table_map:
+            return
+        offset = self.__table_map_offsets.pop(table_id, None)
+        if offset is None:
+            return
+        event_size = struct.unpack_from('<I', self._buffer, offset - self._base + 9)[0]
+        _, _, self.__table_map_column_types = self.__read_table_map_header(self._buffer, offset - self._base)
+        binlog_event = self.__read_packet(self._buffer, offset - self._base, event_size, self.__use_checksum)
+        if binlog_event.event is not None:
+            self.table_map[table_id] = binlog_event.event.get_table()
+
     def _allowed_event_list(self, only_events, ignored_events,
                             filter_non_implemented_events):
         if only_events is not None:
@@ -271,6 +528,28 @@ class BinLogFileReader(object):
         return frozenset(events)
 
     def __get_table_information(self, schema, table):
+        if self.__schema_provider is not None:
+            return self.__schema_provider.get_table_information(schema, table, self.ignore_virtual_columns)
+        if self.__preloaded_tables is not None and (schema, table) in self.__preloaded_tables:
+            return self.__preloaded_tables[(schema, table)]
+        if self.__schema_cache is None or self.__table_map_column_types is None:
+            return self.__query_table_information(schema, table)
+
+        signature = self.__table_map_column_types.hex() + (':novirtual' if self.ignore_virtual_columns else '')
+        column_schemas = self.__schema_cache.get(schema, table, signature)
+        if column_schemas is None:
+            column_schemas = self.__query_table_information(schema, table)
+            # a dropped table has no columns, query it again next time
+            if column_schemas:
+                self.__schema_cache.put(schema, table, signature, column_schemas)
+        return column_schemas
+
+    def __get_unique_keys(self, schema, table):
+        if self.__schema_provider is not None:
+            return self.__schema_provider.get_unique_keys(schema, table)
+        return query_unique_keys(self._ctl_connection, schema, table)
+
+    def __query_table_information(self, schema, table):
         for i in range(1, 3):
             try:
                 if not self.__connected_ctl:
@@ -317,6 +596,31 @@ class BinLogFileReader(object):
         return iter(self.fetchone, None)
 
 
+def split_binlog_file(file_path, split_size, index_dir=None, use_index=False):
+    """Cut a binlog file at transaction starts into ranges of about split_size bytes.
+
+    Return a list of (start offset, stop offset, table map offsets) for BinLogFileReader(file_range=...), the stop
+    offset of the last range is None, and table map offsets map every table id in effect at the start of the range
+    to the offset of its table map event.
+    """
+    index = BinlogIndex(file_path, index_dir, persist=use_index).update()
+    ranges = []
+    start_offset = 4
+    table_map_offsets = {}
+    range_table_map_offsets = {}
+    for k, offset in enumerate(index.offsets):
+        if index.flags[k] & ENTRY_TRANSACTION_START and offset - start_offset >= split_size:
+            ranges.append((start_offset, offset, range_table_map_offsets))
+            start_offset, range_table_map_offsets = offset, dict(table_map_offsets)
+
+        if index.event_types[k] == TABLE_MAP_EVENT:
+            table_map_offsets[index.table_ids[k]] = offset
+        elif index.event_types[k] == ROTATE_EVENT:
+            table_map_offsets = {}
+    ranges.append((start_offset, None, range_table_map_offsets))
+    return ranges
+
+
 class BadMagicBytesError(Exception):
     '''The binlog file magic bytes did not match the specification'''
     pass
@@ -359,6 +663,34 @@ def parse_args():
     binlog_file_filter.add_argument('-ma', '--minutes-ago', dest='minutes_ago', type=int, default=3,
                                     help='When you use --stop-never, we only parse specify minutes ago of '
                                          'modify time of file.')
+    binlog_file_filter.add_argument('--use-index', dest='use_index', action='store_true', default=False,
+                                    help='Build or update a sidecar index for every binlog file, and use it to seek '
+                                         'to --start-pos, --start-datetime and --include-gtids directly')
+    binlog_file_filter.add_argument('--index-dir', dest='index_dir', type=str, default='',
+                                    help='Dir to save binlog index files. default: the dir of the binlog file')
+    binlog_file_filter.add_argument('--follow', dest='follow', action='store_true', default=False,
+                                    help='Keep parsing the last binlog file of --file-dir as it is written, then the '
+                                         'binlog files after it. Can not work with --stop-never, --flashback '
+                                         'and --workers')
+
+    table_schema = parser.add_argument_group('table schema')
+    table_schema.add_argument('--schema-file', dest='schema_file', type=str, default='',
+                              help='Read the columns of tables from this `mysqldump --no-data` file or json '
+                                   'snapshot of information_schema.columns, instead of connecting to mysql')
+    table_schema.add_argument('--schema-cache', dest='schema_cache', type=str, default='',
+                              help='Save the columns of tables read from information_schema in this json file, and '
+                                   'use them in later runs while the column types in the binlog are still the same')
+    table_schema.add_argument('--refresh-schema-cache', dest='refresh_schema_cache', action='store_true',
+                              default=False, help='Ignore the saved entries of --schema-cache and query every table '
+                                                  'again, e.g. after renaming columns')
+
+    parallel = parser.add_argument_group('parallel options')
+    parallel.add_argument('--workers', dest='workers', type=int, default=1,
+                          help='Parse binlog files in this many processes, results are still output in binlog file '
+                               'order. Can not work with --stop-never')
+    parallel.add_argument('--split-size', dest='split_size', type=int, default=256,
+                          help='When use --workers, cut binlog files bigger than this size (MB) at transaction '
+                               'boundaries and parse the parts in parallel too. 0 means never cut a binlog file')
 
     return parser
 
@@ -388,7 +720,9 @@ def command_line_args(args):
             args.stop_time and not is_valid_datetime(args.stop_time)):
         raise ValueError('Incorrect datetime argument')
     if not args.check:
-        if not args.password:
+        if args.schema_file:
+            args.password = args.password[0] if args.password else ''
+        elif not args.password:
             args.password = getpass.getpass('Password: ')
         else:
             args.password = args.password[0]
@@ -399,11 +733,77 @@ def command_line_args(args):
             else:
                 args.sync_password = args.sync_password[0]
 
+    if args.workers < 1:
+        logger.error('Args --workers must not lower than 1.')
+        sys.exit(1)
+    if args.workers > 1 and args.stop_never:
+        logger.error('Could not use --workers and --stop-never at the same time.')
+        sys.exit(1)
+    if args.split_size < 0:
+        logger.error('Args --split-size must not lower than 0.')
+        sys.exit(1)
+
+    if args.follow:
+        if not args.file_dir or args.file_path:
+            logger.error('Args --follow only work with --file-dir.')
+            sys.exit(1)
+        if args.stop_never or args.flashback or args.workers > 1:
+            logger.error('Could not use --follow with --stop-never, --flashback or --workers.')
+            sys.exit(1)
+
+    if args.schema_file and not os.path.isfile(args.schema_file):
+        logger.error(f'Schema file {args.schema_file} does not exist.')
+        sys.exit(1)
+    if args.schema_file and args.schema_cache:
+        logger.error('Could not use --schema-file and --schema-cache at the same time.')
+        sys.exit(1)
+    if args.refresh_schema_cache and not args.schema_cache:
+        logger.error('Args --refresh-schema-cache only work with --schema-cache.')
+        sys.exit(1)
+    try:
+        get_gtid_set(args.include_gtids, args.exclude_gtids)
+    except ValueError as e:
+        logger.error(f'Args --include-gtids or --exclude-gtids: {e}')
+        sys.exit(1)
+    if args.batch_delete and not args.only_pk:
+        logger.error('Args --batch-delete only work with --only-primary-key.')
+        sys.exit(1)
+    if args.merge_transactions and not (args.extended_insert or args.batch_delete):
+        logger.error('Args --merge-transactions only work with --extended-insert or --batch-delete.')
+        sys.exit(1)
+    if args.extended_insert_size <= 0:
+        logger.error('Args --extended-insert-size must be greater than 0.')
+        sys.exit(1)
+    if args.compact and (args.stop_never or args.follow or args.workers > 1):
+        logger.error('Could not use --compact with --stop-never, --follow or --workers.')
+        sys.exit(1)
+    if args.compact_memory_rows <= 0:
+        logger.error('Args --compact-memory-rows must be greater than 0.')
+        sys.exit(1)
+    if args.wrap_transaction and (args.merge_transactions or args.compact or args.table_per_file):
+        logger.error('Could not use --wrap-transaction with --merge-transactions, --compact or --table-per-file.')
+        sys.exit(1)
+    if args.output_format == 'jsonl' and (args.sync or args.table_per_file or args.extended_insert or
+                                          args.batch_delete or args.compact or args.wrap_transaction):
+        logger.error('Could not use --format jsonl with --sync, --table-per-file, --extended-insert, --batch-delete, '
+                     '--compact or --wrap-transaction.')
+        sys.exit(1)
+    if args.output_format == 'load-data' and (args.sync or args.table_per_file or args.extended_insert or
+                                              args.batch_delete or args.compact or args.wrap_transaction or
+                                              args.stop_never or args.follow or args.workers > 1):
+        logger.error('Could not use --format load-data with --sync, --table-per-file, --extended-insert, '
+                     '--batch-delete, --compact, --wrap-transaction, --stop-never, --follow or --workers.')
+        sys.exit(1)
+
+    if args.index_dir and not os.path.exists(args.index_dir):
+        os.makedirs(args.index_dir, exist_ok=True)
+
     if args.minutes_ago < 1:
         logger.error('Args --minutes-ago must not lower than 1.')
         sys.exit(1)
 
-    if (args.result_file or args.stop_never or args.table_per_file) and not os.path.exists(args.result_dir):
+    if (args.result_file or args.stop_never or args.table_per_file or args.output_format == 'load-data') and \
+            not os.path.exists(args.result_dir):
         os.makedirs(args.result_dir, exist_ok=True)
     args.result_file = os.path.join(args.result_dir, args.result_file.split(sep)[-1]) \
         if args.result_file and args.result_dir else args.result_file
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Gtid sets of --include-gtids and --exclude-gtids as sorted interval arrays, looked up with bisect.
+
+The text format is the one of gtid_executed: uuid:1-10:20-30,uuid:5, a uuid may appear more than once.
+"""
+from bisect import bisect_right
+
+
+def merge_intervals(intervals):
+    """Sorted, disjoint and not adjacent (start, end) intervals of the union of intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def intersect_intervals(a, b):
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, end = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if start <= end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def subtract_intervals(a, b):
+    result = []
+    j = 0
+    for start, end in a:
+        while j < len(b) and b[j][1] < start:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] <= end:
+            if b[k][0] > start:
+                result.append((start, b[k][0] - 1))
+            start = max(start, b[k][1] + 1)
+            k += 1
+        if start <= end:
+            result.append((start, end))
+    return result
+
+
+class GtidSet(object):
+    """{uuid: (starts, ends)} of the inclusive intervals of transaction numbers"""
+
+    def __init__(self, intervals=None):
+        self.starts = {}
+        self.ends = {}
+        for uuid, uuid_intervals in (intervals or {}).items():
+            merged = merge_intervals(uuid_intervals)
+            if merged:
+                self.starts[uuid] = [start for start, _ in merged]
+                self.ends[uuid] = [end for _, end in merged]
+
+    @classmethod
+    def parse(cls, text):
+        """GtidSet of uuid:1-10:20-30,... raise ValueError if text is not a gtid set"""
+        intervals = {}
+        for gtid in text.split(','):
+            gtid = gtid.strip()
+            if not gtid:
+                continue
+            uuid, *txn_ranges = gtid.split(':')
+            uuid = uuid.strip().lstrip('@').lower()
+            if len(uuid.replace('-', '')) != 32 or not txn_ranges:
+                raise ValueError('Invalid gtid set: %s' % gtid)
+            for txn_range in txn_ranges:
+                txn_split = txn_range.split('-')
+                txn_min = int(txn_split[0])
+                txn_max = int(txn_split[1]) if len(txn_split) > 1 else txn_min
+                if len(txn_split) > 2 or txn_min <= 0 or txn_max < txn_min:
+                    raise ValueError('Invalid gtid set: %s' % gtid)
+                intervals.setdefault(uuid, []).append((txn_min, txn_max))
+        return cls(intervals)
+
+    def intervals(self, uuid):
+        return list(zip(self.starts.get(uuid, []), self.ends.get(uuid, [])))
+
+    def items(self):
+        """(uuid, intervals) of every uuid"""
+        return [(uuid, self.intervals(uuid)) for uuid in self.starts]
+
+    def contains(self, uuid, gno):
+        starts = self.starts.get(uuid)
+        if starts is None:
+            return False
+        i = bisect_right(starts, gno) - 1
+        return i >= 0 and gno <= self.ends[uuid][i]
+
+    def __contains__(self, gtid):
+        uuid, gno = gtid.rsplit(':', 1)
+        return self.contains(uuid.lower(), int(gno))
+
+    def __bool__(self):
+        return bool(self.starts)
+
+    def __eq__(self, other):
+        return isinstance(other, GtidSet) and self.starts == other.starts and self.ends == other.ends
+
+    def __str__(self):
+        return ','.join(uuid + ''.join(':%d' % start if start == end else ':%d-%d' % (start, end)
+                                       for start, end in intervals)
+                        for uuid, intervals in sorted(self.items()))
+
+    def __repr__(self):
+        return '<GtidSet "%s">' % self
+
+    def union(self, other):
+        return GtidSet({uuid: self.intervals(uuid) + other.intervals(uuid)
+                        for uuid in set(self.starts) | set(other.starts)})
+
+    def intersection(self, other):
+        return GtidSet({uuid: intersect_intervals(self.intervals(uuid), other.intervals(uuid))
+                        for uuid in set(self.starts) & set(other.starts)})
+
+    def difference(self, other):
+        return GtidSet({uuid: subtract_intervals(self.intervals(uuid), other.intervals(uuid))
+                        for uuid in self.starts})
+
+    def max_gnos(self):
+        """{uuid: the last transaction number of the set}"""
+        return {uuid: ends[-1] for uuid, ends in self.ends.items()}
+
+
+class GtidFilter(object):
+    """The transactions wanted by --include-gtids (all if not given) minus --exclude-gtids.
+
+    include is already reduced by exclude, a transaction is decided with one bisect.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        self.include = include.difference(exclude) if include is not None and exclude is not None else include
+        self.exclude = exclude
+
+    def wanted(self, uuid, gno):
+        if self.include is not None:
+            return self.include.contains(uuid, gno)
+        return self.exclude is None or not self.exclude.contains(uuid, gno)
+
+    def is_want_gtid(self, gtid):
+        """wanted of a uuid:gno gtid string"""
+        uuid, gno = gtid.rsplit(':', 1)
+        return self.wanted(uuid.lower(), int(gno))
+
+    def __bool__(self):
+        return self.include is not None or self.exclude is not None
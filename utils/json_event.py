@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Change events of --format jsonl: one json object per row change (or ddl), made from the row images without
+rendering sql.
+
+A row change is {"type", "schema", "table", "before", "after", "primary_key", "types", "file", "start", "end",
+"time", "timestamp", "gtid"}. before is null for an insert, after is null for a delete. Values which json has no
+type for are written as strings, and their columns are listed in types: bytes (base64), decimal, datetime, date,
+time and set (a list). json columns are written as json. A ddl is {"type": "query", "schema", "query", "end",
+"file", "time", "timestamp", "gtid"}.
+"""
+import base64
+import datetime
+import decimal
+import json
+from pymysql.converters import escape_timedelta
+from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+from .binlog2sql_util import PlanCache, check_condition_match_row, check_sql_plan_options, drop_columns, \
+    fix_object, get_column_decoder, get_rename_target, get_where_key
+
+# types json has, the other values are written as strings or decoded first
+JSON_TYPES = frozenset([type(None), int, float, str, bool])
+# type names of the values which are written as strings
+VALUE_TYPES = {
+    bytes: 'bytes',
+    decimal.Decimal: 'decimal',
+    datetime.datetime: 'datetime',
+    datetime.date: 'date',
+    datetime.timedelta: 'time',
+    datetime.time: 'time',
+    set: 'set',
+}
+
+
+def encode_value(value):
+    """default of the json encoder, for the values json has no type for"""
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    if isinstance(value, (datetime.date, datetime.time, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, datetime.timedelta):
+        return escape_timedelta(value)[1:-1]
+    if isinstance(value, set):
+        return sorted(value)
+    return str(value)
+
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=encode_value).encode
+_json_plans = PlanCache()
+
+
+def get_json_plan(keys, value_types):
+    """(json and array columns, {column: type name} of the columns written as strings) of a row image, built once
+    per column list and value types"""
+    key = (keys, value_types)
+    plan = _json_plans.get_plan(key)
+    if plan is None:
+        plan = _json_plans.save_plan(key, (
+            tuple(k for k, t in zip(keys, value_types) if t is dict or t is list),
+            {k: VALUE_TYPES[t] for k, t in zip(keys, value_types) if t in VALUE_TYPES},
+        ))
+    return plan
+
+
+def fix_json_values(binlog_event, values, types, detect_charset=False):
+    """Decode the nested strings of the json and array columns of a row image, and add the type names of its
+    columns written as strings to types"""
+    value_types = tuple(map(type, values.values()))
+    if JSON_TYPES.issuperset(value_types):
+        return
+    json_columns, value_type_names = get_json_plan(tuple(values), value_types)
+    for k in json_columns:
+        values[k] = fix_object(values[k], decoder=get_column_decoder(binlog_event, k, detect_charset))
+    types.update(value_type_names)
+
+
+def concat_json_from_binlog_event(binlog_event, row=None, binlog_file=None, e_start_pos=None, binlog_gtid=None,
+                                  flashback=False, no_pk=False, rename_db_dict=None, rename_tb_dict=None,
+                                  ignore_columns=None, ignore_virtual_columns=False, filter_conditions=None,
+                                  detect_charset=False):
+    """(json line, db, table) of a row of a rows event or of a ddl, like concat_sql_from_binlog_event returns sql.
+
+    The line is empty for a row --where does not match, and for BEGIN, COMMIT and ddl of flashback.
+    """
+    db, table = binlog_event.schema, getattr(binlog_event, 'table', None)
+    if isinstance(binlog_event, WriteRowsEvent):
+        change_type, before, after = 'insert', None, row['values']
+    elif isinstance(binlog_event, DeleteRowsEvent):
+        change_type, before, after = 'delete', row['values'], None
+    elif isinstance(binlog_event, UpdateRowsEvent):
+        change_type, before, after = 'update', row['before_values'], row['after_values']
+    else:
+        if flashback or binlog_event.query in ('BEGIN', 'COMMIT'):
+            return '', '', ''
+        schema = db.decode('utf8') if isinstance(db, bytes) else db
+        return _encode({
+            'type': 'query', 'schema': schema or None, 'query': fix_object(binlog_event.query),
+            'end': binlog_event.packet.log_pos, 'file': binlog_file,
+            'time': str(datetime.datetime.fromtimestamp(binlog_event.timestamp)),
+            'timestamp': binlog_event.timestamp, 'gtid': binlog_gtid or None,
+        }), '', ''
+
+    check_sql_plan_options(rename_db_dict, rename_tb_dict, ignore_columns, ignore_virtual_columns)
+    if filter_conditions and check_condition_match_row(filter_conditions, before or after, -1) not in [-1, 1]:
+        return '', db, table
+    where_key = get_where_key(binlog_event)
+    key_values = before if before is not None else after
+    primary_key = {k: key_values.get(k) for k in where_key} if where_key else None
+    if ignore_columns or ignore_virtual_columns:
+        for values in (before, after):
+            if values is not None:
+                drop_columns(values, ignore_columns, ignore_virtual_columns)
+    if no_pk and change_type == 'insert' and binlog_event.primary_key:
+        for key in where_key:
+            after.pop(key, None)
+    if flashback:
+        change_type = {'insert': 'delete', 'delete': 'insert'}.get(change_type, change_type)
+        before, after = after, before
+
+    types = {}
+    for values in (before, after):
+        if values is not None:
+            fix_json_values(binlog_event, values, types, detect_charset)
+
+    db, table = get_rename_target(binlog_event.schema, binlog_event.table, rename_db_dict, rename_tb_dict)
+    line = _encode({
+        'type': change_type, 'schema': db, 'table': table, 'before': before, 'after': after,
+        'primary_key': primary_key, 'types': types, 'file': binlog_file, 'start': e_start_pos,
+        'end': binlog_event.packet.log_pos, 'time': str(datetime.datetime.fromtimestamp(binlog_event.timestamp)),
+        'timestamp': binlog_event.timestamp, 'gtid': binlog_gtid or None,
+    })
+    return line, db, table
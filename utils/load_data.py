@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Data files of --format load-data: the inserted rows (the deleted rows of flashback) of every table are written to
+tab separated files, loaded by a LOAD DATA statement in the sql output, which stays the driver script.
+
+The files use the default format of LOAD DATA: fields terminated by tab, lines by new line, \\N for NULL and
+backslash escapes. Binary values are written as hex and loaded with UNHEX, json as json text, the rest like the
+sql generator writes them. A segment of a table, its rows between two other statements on the table, goes to one
+file; it is ended (its LOAD DATA written) before any other statement on the table, before a ddl and at the end, so
+the script applies the changes of every table in the order of the binlog.
+"""
+import datetime
+import decimal
+import json
+import os
+from collections import OrderedDict
+from pymysql.converters import escape_timedelta
+from pymysqlreplication.row_event import WriteRowsEvent, DeleteRowsEvent
+from .binlog2sql_util import MAX_OPEN_RESULT_FILES, RESULT_FILE_BUFFER_SIZE, PlanCache, \
+    check_condition_match_row, check_sql_plan_options, drop_columns, fix_object, get_column_decoder, get_rename_target
+from .sql_literal import escape_str, escape_str_no_backslash, escape_float
+
+# the escapes of the default ESCAPED BY '\\' of LOAD DATA, a list like sql_literal._escape_table
+_field_escape_table = [chr(x) for x in range(128)]
+_field_escape_table[0] = '\\0'
+_field_escape_table[ord('\\')] = '\\\\'
+_field_escape_table[ord('\t')] = '\\t'
+_field_escape_table[ord('\n')] = '\\n'
+_field_escape_table[ord('\r')] = '\\r'
+_field_escape_table[ord('\032')] = '\\Z'
+
+
+def escape_field(value):
+    return value.translate(_field_escape_table)
+
+
+def json_field(value):
+    return escape_field(json.dumps(value, ensure_ascii=False))
+
+
+# fields of the values by exact type, like sql_literal.ENCODERS
+FIELD_ENCODERS = {
+    str: escape_field,
+    int: str,
+    type(None): lambda value: '\\N',
+    decimal.Decimal: str,
+    datetime.datetime: lambda value: value.isoformat(' '),
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+    datetime.timedelta: lambda value: escape_timedelta(value)[1:-1],
+    float: escape_float,
+    bool: lambda value: str(int(value)),
+    bytes: bytes.hex,
+    set: lambda value: escape_field(','.join(value)),
+    dict: json_field,
+    list: json_field,
+}
+_field_plans = PlanCache()
+
+
+def get_field_plan(value_types):
+    """(encoders, positions of the hex columns) of a row image by the types of its values, built once per value
+    types. The encoder of json, array and unknown values is None, they go the slow way"""
+    plan = _field_plans.get_plan(value_types)
+    if plan is None:
+        plan = _field_plans.save_plan(value_types, (
+            tuple(None if t is dict or t is list else FIELD_ENCODERS.get(t) for t in value_types),
+            tuple(i for i, t in enumerate(value_types) if t is bytes),
+        ))
+    return plan
+
+
+class Segment(object):
+    """Rows of a table with the same columns, written to one data file"""
+
+    def __init__(self, path, db, table, columns, hex_columns):
+        self.path = path
+        self.db = db
+        self.table = table
+        self.columns = columns
+        self.hex_columns = hex_columns
+        self.f = None
+        self.rows = 0
+        self.start = self.end = None
+
+    def accepts(self, columns, hex_columns, values):
+        """True if a row fits the columns of the segment, a NULL fits a hex column too"""
+        return columns == self.columns and (hex_columns == self.hex_columns or (
+            set(hex_columns) <= set(self.hex_columns) and
+            all(values[k] is None or type(values[k]) is bytes for k in self.hex_columns)))
+
+    def load_data_sql(self, modifier='', no_backslash_escapes=False):
+        escape_path = escape_str_no_backslash if no_backslash_escapes else escape_str
+        columns = ', '.join('@`%s`' % c if c in self.hex_columns else '`%s`' % c for c in self.columns)
+        sql = 'LOAD DATA LOCAL INFILE %s %sINTO TABLE `%s`.`%s` CHARACTER SET utf8mb4 (%s)' % (
+            escape_path(os.path.abspath(self.path)), modifier, self.db, self.table, columns)
+        if self.hex_columns:
+            sql += ' SET ' + ', '.join('`%s`=UNHEX(@`%s`)' % (c, c) for c in self.hex_columns)
+        return sql + '; #start %s end %s rows %s' % (self.start, self.end, self.rows)
+
+
+class LoadDataWriter(object):
+    """Write the inserted rows (deleted rows of flashback) of --format load-data to the data files in data_dir.
+
+    add and end return the LOAD DATA statements of the segments they end, as (sql, db, table) like the statements
+    of SqlBatch. At most max_open data files are open, the least recently used one is closed and appended later.
+    """
+
+    def __init__(self, data_dir, flashback=False, no_pk=False, replace=False, insert_ignore=False,
+                 rename_db_dict=None, rename_tb_dict=None, ignore_columns=None, ignore_virtual_columns=False,
+                 filter_conditions=None, detect_charset=False, no_backslash_escapes=False,
+                 max_open=MAX_OPEN_RESULT_FILES):
+        self.data_dir = data_dir
+        self.flashback = flashback
+        self.no_pk = no_pk
+        self.modifier = 'REPLACE ' if replace else 'IGNORE ' if insert_ignore else ''
+        self.rename_db_dict = rename_db_dict
+        self.rename_tb_dict = rename_tb_dict
+        self.ignore_columns = ignore_columns
+        self.ignore_virtual_columns = ignore_virtual_columns
+        self.filter_conditions = filter_conditions
+        self.detect_charset = detect_charset
+        self.no_backslash_escapes = no_backslash_escapes
+        self.max_open = max_open
+        self.loaded_event = DeleteRowsEvent if flashback else WriteRowsEvent
+        # (schema, table) of the binlog -> its open segment
+        self.segments = {}
+        # segments with an open file, in the order of their last write
+        self.open_segments = OrderedDict()
+        self.count = 0
+
+    def is_loaded(self, binlog_event):
+        """True if the rows of the event go to the data files"""
+        return isinstance(binlog_event, self.loaded_event)
+
+    def add(self, binlog_event, row, binlog_file=None, e_start_pos=None):
+        values = row['values']
+        if self.filter_conditions and \
+                check_condition_match_row(self.filter_conditions, values, -1) not in [-1, 1]:
+            return []
+        check_sql_plan_options(self.rename_db_dict, self.rename_tb_dict, self.ignore_columns,
+                               self.ignore_virtual_columns)
+        if self.ignore_columns or self.ignore_virtual_columns:
+            drop_columns(values, self.ignore_columns, self.ignore_virtual_columns)
+        if self.no_pk and not self.flashback and binlog_event.primary_key:
+            primary_key = binlog_event.primary_key
+            for key in primary_key if isinstance(primary_key, tuple) else (primary_key, ):
+                values.pop(key, None)
+
+        columns = tuple(values)
+        encoders, hex_positions = get_field_plan(tuple(map(type, values.values())))
+        hex_columns = tuple(columns[i] for i in hex_positions)
+        key = (binlog_event.schema, binlog_event.table)
+        statements = []
+        segment = self.segments.get(key)
+        if segment is not None and not segment.accepts(columns, hex_columns, values):
+            statements = self.end(*key)
+            segment = None
+        if segment is None:
+            db, table = get_rename_target(binlog_event.schema, binlog_event.table, self.rename_db_dict,
+                                          self.rename_tb_dict)
+            self.count += 1
+            path = os.path.join(self.data_dir, '%s.%06d.%s.%s.tsv' % (binlog_file or 'load', self.count, db, table))
+            segment = self.segments[key] = Segment(path, db, table, columns, hex_columns)
+            segment.start = e_start_pos
+
+        if None in encoders:
+            fields = []
+            for k, v in values.items():
+                if type(v) is dict or type(v) is list:
+                    v = fix_object(v, decoder=get_column_decoder(binlog_event, k, self.detect_charset))
+                encoder = FIELD_ENCODERS.get(type(v))
+                fields.append(encoder(v) if encoder is not None else escape_field(str(v)))
+        else:
+            fields = [encoder(v) for encoder, v in zip(encoders, values.values())]
+        self.get_file(segment).write('\t'.join(fields) + '\n')
+        segment.rows += 1
+        segment.end = binlog_event.packet.log_pos
+        return statements
+
+    def get_file(self, segment):
+        if segment.f is None:
+            if len(self.open_segments) >= self.max_open:
+                _, lru_segment = self.open_segments.popitem(last=False)
+                lru_segment.f.close()
+                lru_segment.f = None
+            segment.f = open(segment.path, 'a' if segment.rows else 'w', encoding='utf8', newline='',
+                             buffering=RESULT_FILE_BUFFER_SIZE)
+            self.open_segments[id(segment)] = segment
+        else:
+            self.open_segments.move_to_end(id(segment))
+        return segment.f
+
+    def end(self, schema=None, table=None):
+        """End the segment of a table of the binlog, or all segments, return their LOAD DATA statements"""
+        keys = [(schema, table)] if schema is not None else list(self.segments)
+        statements = []
+        for key in keys:
+            segment = self.segments.pop(key, None)
+            if segment is None:
+                continue
+            if segment.f is not None:
+                segment.f.close()
+                segment.f = None
+                self.open_segments.pop(id(segment))
+            statements.append((segment.load_data_sql(self.modifier, self.no_backslash_escapes),
+                               segment.db, segment.table))
+        return statements
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+import re
+import json
+from pymysql.connections import Connection
+
+# the columns the reader queries from information_schema.columns
+COLUMN_FIELDS = ('COLUMN_NAME', 'COLLATION_NAME', 'CHARACTER_SET_NAME', 'COLUMN_COMMENT', 'COLUMN_TYPE',
+                 'COLUMN_KEY', 'ORDINAL_POSITION')
+STRING_TYPES = {'char', 'varchar', 'tinytext', 'text', 'mediumtext', 'longtext', 'enum', 'set'}
+INDEX_WORDS = {'PRIMARY', 'UNIQUE', 'KEY', 'INDEX', 'FULLTEXT', 'SPATIAL', 'CONSTRAINT', 'FOREIGN', 'CHECK'}
+DEFAULT_COLLATIONS = {'binary': 'binary', 'utf8mb4': 'utf8mb4_general_ci', 'utf8': 'utf8_general_ci',
+                      'utf8mb3': 'utf8mb3_general_ci', 'latin1': 'latin1_swedish_ci', 'gbk': 'gbk_chinese_ci',
+                      'gb2312': 'gb2312_chinese_ci', 'gb18030': 'gb18030_chinese_ci', 'big5': 'big5_chinese_ci',
+                      'ascii': 'ascii_general_ci'}
+
+# comments are dropped, the content of /*!50100 ... */ comments is kept like mysql does
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+    |(?P<comment>/\*(?!!).*?\*/|--(?:[ \t][^\n]*)?(?=\n|$)|\#[^\n]*)
+    |(?P<vopen>/\*!\d*)
+    |(?P<vclose>\*/)
+    |(?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<ident>`(?:[^`]|``)*`)
+    |(?P<word>[\w$]+)
+    |(?P<punct>.)
+""", re.S | re.X)
+STRING_ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+# the schema files loaded in this process
+_schema_providers = {}
+
+
+def get_schema_provider(schema_file):
+    if schema_file not in _schema_providers:
+        _schema_providers[schema_file] = LocalSchemaProvider(schema_file)
+    return _schema_providers[schema_file]
+
+
+def iter_statements(sql):
+    """Yield the statements of a sql script as lists of (kind, text) tokens"""
+    statement = []
+    for m in TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ('space', 'comment', 'vopen', 'vclose'):
+            continue
+        text = m.group()
+        if kind == 'punct' and text == ';':
+            if statement:
+                yield statement
+            statement = []
+            continue
+        statement.append((kind, text))
+    if statement:
+        yield statement
+
+
+def unquote(kind, text):
+    if kind == 'ident':
+        return text[1:-1].replace('``', '`')
+    if kind == 'string':
+        quote = text[0]
+        return re.sub(r'\\(.)', lambda m: STRING_ESCAPES.get(m.group(1), m.group(1)),
+                      text[1:-1].replace(quote * 2, quote))
+    return text
+
+
+def upper_word(token):
+    return token[1].upper() if token[0] == 'word' else None
+
+
+def split_group(tokens, start):
+    """Split the tokens in the parentheses at start by top-level commas, return (items, end of the group)"""
+    items, item, depth = [], [], 0
+    for i in range(start, len(tokens)):
+        token = tokens[i]
+        if token == ('punct', '('):
+            depth += 1
+            if depth == 1:
+                continue
+        elif token == ('punct', ')'):
+            depth -= 1
+            if depth == 0:
+                items.append(item)
+                return items, i + 1
+        elif token == ('punct', ',') and depth == 1:
+            items.append(item)
+            item = []
+            continue
+        item.append(token)
+    raise ValueError('Unbalanced parentheses in create table statement')
+
+
+def get_charset_option(tokens, i):
+    """Value of a CHARSET/COLLATE option at i, which may be followed by '='"""
+    if i < len(tokens) and tokens[i] == ('punct', '='):
+        i += 1
+    return unquote(*tokens[i]).lower() if i < len(tokens) else None
+
+
+class LocalSchemaProvider(object):
+    """Columns of tables from a `mysqldump --no-data` file or a json snapshot of information_schema.columns.
+
+    The json snapshot is either {schema: {table: [column, ...]}} or a list of columns with TABLE_SCHEMA and
+    TABLE_NAME, columns use the field names of information_schema.columns. Tables of a dump without
+    `USE db` statements are matched by table name in any schema.
+    """
+
+    def __init__(self, schema_file):
+        self.schema_file = schema_file
+        # (schema, table) -> [(column, extra)]
+        self.tables = {}
+        # (schema, table) -> unique keys like query_unique_keys returns, only a dump has them
+        self.unique_keys = {}
+        with open(schema_file, 'r', encoding='utf8') as f:
+            content = f.read()
+        if content.lstrip()[:1] in ('{', '['):
+            self.load_json(json.loads(content))
+        else:
+            self.load_ddl(content)
+
+    def get_table_information(self, schema, table, ignore_virtual_columns=False):
+        columns = self.tables.get((schema, table))
+        if columns is None:
+            columns = self.tables.get((None, table), [])
+        return [dict(column) for column, extra in columns
+                if not (ignore_virtual_columns and extra == 'VIRTUAL GENERATED')]
+
+    def get_unique_keys(self, schema, table):
+        unique_keys = self.unique_keys.get((schema, table))
+        if unique_keys is None:
+            unique_keys = self.unique_keys.get((None, table), [])
+        return [dict(unique_key) for unique_key in unique_keys]
+
+    def load_json(self, snapshot):
+        if isinstance(snapshot, dict):
+            rows = [dict(column, TABLE_SCHEMA=schema, TABLE_NAME=table)
+                    for schema, tables in snapshot.items() for table, columns in tables.items() for column in columns]
+        elif isinstance(snapshot, list):
+            rows = snapshot
+        else:
+            raise ValueError(f'Unknown json schema snapshot in {self.schema_file}')
+
+        tables = {}
+        for row in rows:
+            row = {k.upper(): v for k, v in row.items()}
+            if 'TABLE_NAME' not in row or 'COLUMN_NAME' not in row or 'COLUMN_TYPE' not in row:
+                raise ValueError(f'Columns of json schema snapshot {self.schema_file} need TABLE_NAME, '
+                                 f'COLUMN_NAME and COLUMN_TYPE')
+            tables.setdefault((row.get('TABLE_SCHEMA'), row['TABLE_NAME']), []).append(row)
+
+        for key, rows in tables.items():
+            if all(row.get('ORDINAL_POSITION') is not None for row in rows):
+                rows.sort(key=lambda row: row['ORDINAL_POSITION'])
+            columns = []
+            for i, row in enumerate(rows):
+                column = {field: row.get(field) for field in COLUMN_FIELDS}
+                column['COLUMN_COMMENT'] = column['COLUMN_COMMENT'] or ''
+                column['COLUMN_KEY'] = column['COLUMN_KEY'] or ''
+                if column['ORDINAL_POSITION'] is None:
+                    column['ORDINAL_POSITION'] = i + 1
+                columns.append((column, row.get('EXTRA') or ''))
+            self.tables[key] = columns
+
+    def load_ddl(self, sql):
+        schema = None
+        for tokens in iter_statements(sql):
+            words = [upper_word(token) for token in tokens[:6]]
+            if words[0] == 'USE' and len(tokens) > 1:
+                schema = unquote(*tokens[1])
+            elif words[0] == 'CREATE' and 'TABLE' in words:
+                self.parse_create_table(tokens, words.index('TABLE') + 1, schema)
+
+    def parse_create_table(self, tokens, i, schema):
+        if [upper_word(token) for token in tokens[i:i + 3]] == ['IF', 'NOT', 'EXISTS']:
+            i += 3
+        table = unquote(*tokens[i])
+        i += 1
+        if i < len(tokens) and tokens[i] == ('punct', '.'):
+            schema, table = table, unquote(*tokens[i + 1])
+            i += 2
+        # CREATE TABLE ... LIKE / AS SELECT
+        if i >= len(tokens) or tokens[i] != ('punct', '('):
+            return
+        items, i = split_group(tokens, i)
+
+        table_charset = table_collation = None
+        for j in range(i, len(tokens)):
+            word = upper_word(tokens[j])
+            if word == 'CHARSET' or (word == 'SET' and upper_word(tokens[j - 1]) == 'CHARACTER'):
+                table_charset = get_charset_option(tokens, j + 1)
+            elif word == 'COLLATE':
+                table_collation = get_charset_option(tokens, j + 1)
+
+        columns, not_null = [], set()
+        primary_key, unique_keys, keys = [], [], []
+        for item in items:
+            if not item:
+                continue
+            if upper_word(item[0]) in INDEX_WORDS:
+                self.parse_index(item, primary_key, unique_keys, keys)
+                continue
+            column, extra, flags = self.parse_column(item, table_charset, table_collation)
+            column['ORDINAL_POSITION'] = len(columns) + 1
+            columns.append((column, extra))
+            if 'NOT NULL' in flags:
+                not_null.add(column['COLUMN_NAME'])
+            if 'PRIMARY' in flags:
+                primary_key.append(column['COLUMN_NAME'])
+            elif 'UNIQUE' in flags:
+                unique_keys.append(([column['COLUMN_NAME']], False))
+
+        # like mysql, the first unique key of not null columns is the primary key of a table without one
+        if not primary_key:
+            for key_columns, has_prefix in unique_keys:
+                if not has_prefix and all(c in not_null for c in key_columns):
+                    primary_key = key_columns
+                    break
+        multiple = {key_columns[0] for key_columns in keys if key_columns}
+        multiple.update(key_columns[0] for key_columns, _ in unique_keys if len(key_columns) > 1)
+        unique = {key_columns[0] for key_columns, _ in unique_keys if len(key_columns) == 1}
+        for column, _ in columns:
+            name = column['COLUMN_NAME']
+            column['COLUMN_KEY'] = 'PRI' if name in primary_key else 'UNI' if name in unique else \
+                'MUL' if name in multiple else ''
+        self.tables[(schema, table)] = columns
+        self.unique_keys[(schema, table)] = [
+            {'columns': tuple(key_columns), 'nullable': not all(c in not_null for c in key_columns),
+             'prefix': has_prefix} for key_columns, has_prefix in unique_keys if key_columns]
+
+    @staticmethod
+    def parse_index(item, primary_key, unique_keys, keys):
+        words = [upper_word(token) for token in item]
+        if words[0] == 'CONSTRAINT':
+            # CONSTRAINT [name] PRIMARY KEY / UNIQUE / FOREIGN KEY / CHECK
+            start = 2 if len(words) > 1 and words[1] not in INDEX_WORDS else 1
+            item, words = item[start:], words[start:]
+        if not words or words[0] in ('FOREIGN', 'CHECK'):
+            return
+        group = next((j for j, token in enumerate(item) if token == ('punct', '(')), None)
+        if group is None:
+            return
+        parts, _ = split_group(item, group)
+        # key parts are `column`, `column`(prefix length) or (expression)
+        key_columns = [unquote(*part[0]) for part in parts if part and part[0][0] in ('ident', 'word')]
+        # a key on a prefix or an expression is not unique on the column values
+        has_prefix = any(('punct', '(') in part[1:] for part in parts if part) or \
+            len(key_columns) < len([part for part in parts if part])
+        if words[0] == 'PRIMARY':
+            primary_key.extend(key_columns)
+        elif words[0] == 'UNIQUE':
+            unique_keys.append((key_columns, has_prefix))
+        else:
+            keys.append(key_columns)
+
+    @staticmethod
+    def parse_column(item, table_charset, table_collation):
+        """Return (information_schema columns row, extra, flags) of a column definition"""
+        name = unquote(*item[0])
+        data_type = item[1][1].lower()
+        column_type, i = data_type, 2
+        if i < len(item) and item[i] == ('punct', '('):
+            _, end = split_group(item, i)
+            column_type += ''.join(text for _, text in item[i:end])
+            i = end
+        while i < len(item) and upper_word(item[i]) in ('UNSIGNED', 'ZEROFILL', 'SIGNED'):
+            if upper_word(item[i]) != 'SIGNED':
+                column_type += ' ' + item[i][1].lower()
+            i += 1
+
+        charset = collation = None
+        comment, extra, flags, depth = '', '', set(), 0
+        for j in range(i, len(item)):
+            token = item[j]
+            if token == ('punct', '('):
+                depth += 1
+            elif token == ('punct', ')'):
+                depth -= 1
+            word = upper_word(token)
+            if depth or word is None:
+                continue
+            following = upper_word(item[j + 1]) if j + 1 < len(item) else None
+            if word == 'CHARSET' or (word == 'CHARACTER' and following == 'SET'):
+                charset = unquote(*item[j + (1 if word == 'CHARSET' else 2)]).lower()
+            elif word == 'COLLATE':
+                collation = unquote(*item[j + 1]).lower()
+            elif word == 'NOT' and following == 'NULL':
+                flags.add('NOT NULL')
+            elif word == 'COMMENT' and j + 1 < len(item) and item[j + 1][0] == 'string':
+                comment = unquote(*item[j + 1])
+            elif word == 'AS' and not extra:
+                extra = 'VIRTUAL GENERATED'
+            elif word in ('STORED', 'PERSISTENT'):
+                extra = 'STORED GENERATED'
+            elif word == 'PRIMARY' and following == 'KEY':
+                flags.add('PRIMARY')
+            elif word == 'UNIQUE':
+                flags.add('UNIQUE')
+
+        if data_type in STRING_TYPES:
+            if charset is None:
+                charset = collation.split('_')[0] if collation else table_charset
+            if collation is None and charset is not None:
+                collation = table_collation if charset == table_charset and table_collation else \
+                    DEFAULT_COLLATIONS.get(charset, charset + '_general_ci')
+        else:
+            charset = collation = None
+
+        column = {'COLUMN_NAME': name, 'COLLATION_NAME': collation, 'CHARACTER_SET_NAME': charset,
+                  'COLUMN_COMMENT': comment, 'COLUMN_TYPE': column_type, 'COLUMN_KEY': ''}
+        return column, extra, flags
+
+    def connect(self, charset='utf8mb4'):
+        return LocalSchemaConnection(self, charset)
+
+
+class LocalSchemaConnection(Connection):
+    """A pymysql connection which never connects to mysql, the ctl connection of the reader with a schema file"""
+
+    def __init__(self, schema_provider, charset='utf8mb4'):
+        super(LocalSchemaConnection, self).__init__(charset=charset, defer_connect=True)
+        self.schema_provider = schema_provider
+
+    def close(self):
+        pass
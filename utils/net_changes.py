@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import sqlite3
+import types
+from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+from .binlog2sql_util import DEFAULT_COMPACT_MEMORY_ROWS, get_where_key
+from .other_utils import create_unique_file, logger
+
+
+class NetChanges(object):
+    """The net change of every row of the parsed range, for --compact.
+
+    A row is identified by its table and the values of its primary key (or unique key, see get_where_key). Its net
+    change goes from the first before image to the last after image, where a missing image means the row did not
+    exist: insert + updates is one insert, insert + delete is nothing, updates are one update, delete + insert is one
+    update. Rows of tables without a key are not merged. An update of the key is a delete and an insert.
+
+    Above max_rows the rows in memory are merged into a sqlite file in tmp_dir, which is removed by pop_all.
+    """
+
+    def __init__(self, tmp_dir='tmp', max_rows=DEFAULT_COMPACT_MEMORY_ROWS):
+        self.tmp_dir = tmp_dir
+        self.max_rows = max_rows
+        self.seq = 0
+        # key -> [seq, table key, before, after, start pos, end pos, timestamp, gtid]
+        self.rows = {}
+        # table key -> what the sql generator needs of the rows event
+        self.tables = {}
+        self.db_file = None
+        self.db = None
+
+    def add(self, binlog_event, row, e_start_pos=None, binlog_gtid=None):
+        table_key = (binlog_event.schema, binlog_event.table, getattr(binlog_event, 'table_id', None))
+        if table_key not in self.tables:
+            self.tables[table_key] = {
+                'schema': binlog_event.schema, 'table': binlog_event.table, 'table_id': table_key[2],
+                'primary_key': binlog_event.primary_key, 'columns': getattr(binlog_event, 'columns', None),
+                '_ctl_connection': getattr(binlog_event, '_ctl_connection', None),
+            }
+        meta = (e_start_pos, binlog_event.packet.log_pos, binlog_event.timestamp, binlog_gtid)
+
+        if isinstance(binlog_event, WriteRowsEvent):
+            self.add_image(binlog_event, table_key, None, row['values'], meta)
+        elif isinstance(binlog_event, DeleteRowsEvent):
+            self.add_image(binlog_event, table_key, row['values'], None, meta)
+        else:
+            before_key = self.get_row_key(binlog_event, row['before_values'])
+            if before_key == self.get_row_key(binlog_event, row['after_values']):
+                self.add_image(binlog_event, table_key, row['before_values'], row['after_values'], meta, before_key)
+            else:
+                self.add_image(binlog_event, table_key, row['before_values'], None, meta, before_key)
+                self.add_image(binlog_event, table_key, None, row['after_values'], meta)
+
+        if len(self.rows) >= self.max_rows:
+            self.spill()
+
+    def get_row_key(self, binlog_event, values):
+        where_key = get_where_key(binlog_event)
+        if not where_key:
+            # rows of tables without a key are kept as they are
+            return repr((binlog_event.schema, binlog_event.table, None, self.seq))
+        return repr((binlog_event.schema, binlog_event.table, tuple(values.get(k) for k in where_key)))
+
+    def add_image(self, binlog_event, table_key, before, after, meta, key=None):
+        if key is None:
+            key = self.get_row_key(binlog_event, before if after is None else after)
+        self.seq += 1
+        state = self.rows.get(key)
+        if state is None:
+            self.rows[key] = [self.seq, table_key, before, after] + list(meta)
+        else:
+            # the first before image and the start position stay, the rest is of the last change
+            state[0], state[1], state[3], state[5:] = self.seq, table_key, after, list(meta[1:])
+
+    def spill(self):
+        """Merge the rows in memory into the sqlite file"""
+        if self.db is None:
+            self.db_file = create_unique_file('compact', self.tmp_dir) + '.db'
+            self.db = sqlite3.connect(self.db_file)
+            self.db.execute('CREATE TABLE net_changes (row_key TEXT PRIMARY KEY, seq INTEGER, state BLOB)')
+            self.db.execute('CREATE INDEX idx_seq ON net_changes (seq)')
+            logger.info(f'Spilling the net changes of more than {self.max_rows} rows into {self.db_file}')
+
+        cursor = self.db.cursor()
+        for key, state in self.rows.items():
+            cursor.execute('SELECT state FROM net_changes WHERE row_key = ?', (key, ))
+            spilled = cursor.fetchone()
+            if spilled is not None:
+                old_state = pickle.loads(spilled[0])
+                state[2], state[4] = old_state[2], old_state[4]
+            cursor.execute('REPLACE INTO net_changes VALUES (?, ?, ?)',
+                           (key, state[0], pickle.dumps(state, pickle.HIGHEST_PROTOCOL)))
+        self.db.commit()
+        self.rows = {}
+
+    def iter_states(self):
+        if self.db is None:
+            yield from sorted(self.rows.values(), key=lambda state: state[0])
+            return
+        self.spill()
+        for spilled in self.db.execute('SELECT state FROM net_changes ORDER BY seq'):
+            yield pickle.loads(spilled[0])
+
+    def pop_all(self):
+        """Yield (rows event, row, start pos, gtid) of the net changes in the order of their last change, then
+        forget them"""
+        try:
+            for _, table_key, before, after, e_start_pos, log_pos, timestamp, binlog_gtid in self.iter_states():
+                if before is None and after is None:
+                    continue
+                elif before is None:
+                    event_class, row = WriteRowsEvent, {'values': after}
+                elif after is None:
+                    event_class, row = DeleteRowsEvent, {'values': before}
+                elif before == after:
+                    continue
+                else:
+                    event_class, row = UpdateRowsEvent, {'before_values': before, 'after_values': after}
+                yield self.make_event(event_class, table_key, log_pos, timestamp), row, e_start_pos, binlog_gtid
+        finally:
+            self.close()
+
+    def make_event(self, event_class, table_key, log_pos, timestamp):
+        """A rows event with what the sql generator reads of it"""
+        binlog_event = event_class.__new__(event_class)
+        binlog_event.__dict__.update(self.tables[table_key])
+        binlog_event.timestamp = timestamp
+        binlog_event.packet = types.SimpleNamespace(log_pos=log_pos)
+        return binlog_event
+
+    def close(self):
+        self.rows = {}
+        self.tables = {}
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            os.remove(self.db_file)
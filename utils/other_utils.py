@@ -60,26 +60,46 @@ def save_executed_result(result_file, result_list):
 
 
 def get_binlog_file_list(args):
+    from .binlog_index import INDEX_SUFFIX
+    from .binlog_archive import MEMBER_SEP, is_tar_archive, list_archive_members, get_inner_name, \
+        split_member_path, get_binlog_mtime
     binlog_file_list = []
     executed_file_list = read_file(args.record_file) if args.stop_never and os.path.exists(args.record_file) else []
     if args.file_dir and not args.file_path:
-        for f in sorted(os.listdir(args.file_dir)):
-            if args.start_file and f < args.start_file:
+        # compressed binlogs and binlogs in tar archives are filtered by the name of the binlog file inside
+        name_file_list = []
+        for f in os.listdir(args.file_dir):
+            binlog_file = os.path.join(args.file_dir, f)
+            if f.endswith(INDEX_SUFFIX):
                 continue
-            if args.stop_file and f > args.stop_file:
+            if os.path.isfile(binlog_file) and is_tar_archive(binlog_file):
+                for member in list_archive_members(binlog_file):
+                    name_file_list.append((get_inner_name(member), binlog_file + MEMBER_SEP + member))
+            else:
+                name_file_list.append((get_inner_name(f), binlog_file))
+
+        for name, binlog_file in sorted(name_file_list):
+            if args.start_file and name < args.start_file:
+                continue
+            if args.stop_file and name > args.stop_file:
                 break
-            if re.search(args.file_regex, f) is not None:
-                binlog_file = os.path.join(args.file_dir, f)
+            if re.search(args.file_regex, name) is not None:
                 if args.stop_never and \
-                        (int(time.time() - os.path.getmtime(binlog_file)) < args.minutes_ago * 60 or
+                        (int(time.time() - get_binlog_mtime(binlog_file)) < args.minutes_ago * 60 or
                          binlog_file in executed_file_list):
                     continue
                 binlog_file_list.append(binlog_file)
     else:
-        binlog_file_list.extend(args.file_path)
+        for binlog_file in args.file_path:
+            if MEMBER_SEP not in binlog_file and os.path.isfile(binlog_file) and is_tar_archive(binlog_file):
+                binlog_file_list.extend(binlog_file + MEMBER_SEP + member
+                                        for member in list_archive_members(binlog_file)
+                                        if re.search(args.file_regex, get_inner_name(member)) is not None)
+            else:
+                binlog_file_list.append(binlog_file)
 
     for f in executed_file_list.copy():
-        if not os.path.exists(f):
+        if not os.path.exists(split_member_path(f)[0]):
             executed_file_list.remove(f)
 
     return binlog_file_list, executed_file_list
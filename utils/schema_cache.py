@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+from .other_utils import logger
+
+# the caches opened in this process, shared by the readers of all binlog files
+_schema_caches = {}
+
+
+def get_schema_cache(cache_file, server, refresh=False):
+    """Return the schema cache of a server saved in cache_file, loaded once per process"""
+    key = (os.path.abspath(cache_file), server)
+    if key not in _schema_caches:
+        _schema_caches[key] = SchemaCache(cache_file, server, refresh)
+    return _schema_caches[key]
+
+
+class SchemaCache(object):
+    """Columns of tables read from information_schema, saved in a json file between runs.
+
+    An entry is only used while its signature, the column types of the table map event plus the query options,
+    is the same as when it was saved. A changed column type of a table is noticed by the signature, other DDL
+    (e.g. rename a column) needs --refresh-schema-cache or removing the cache file.
+    """
+
+    def __init__(self, cache_file, server, refresh=False):
+        self.cache_file = cache_file
+        self.server = server
+        self.tables = {} if refresh else self.__load().get(server, {})
+        self.changed = {}
+
+    def __load(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read schema cache file {self.cache_file}, ignore it: {e}')
+            return {}
+
+    def get(self, schema, table, signature):
+        entry = self.tables.get(schema, {}).get(table)
+        if entry is None or entry['signature'] != signature:
+            return None
+        return entry['columns']
+
+    def put(self, schema, table, signature, columns):
+        entry = {'signature': signature, 'columns': list(columns)}
+        self.tables.setdefault(schema, {})[table] = entry
+        self.changed.setdefault(schema, {})[table] = entry
+
+    def save(self):
+        """Merge the changed entries into the cache file, other processes may have saved theirs meanwhile"""
+        if not self.changed:
+            return
+        cache = self.__load()
+        tables = cache.setdefault(self.server, {})
+        for schema, entries in self.changed.items():
+            tables.setdefault(schema, {}).update(entries)
+
+        tmp_file = '%s.%d.tmp' % (self.cache_file, os.getpid())
+        try:
+            with open(tmp_file, 'w', encoding='utf8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.warning(f'Could not save schema cache file {self.cache_file}: {e}')
+            return
+        self.changed = {}
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from .binlog2sql_util import DEFAULT_EXTENDED_INSERT_SIZE
+
+# room left in max_allowed_packet for the comment and the packet header
+PACKET_RESERVED_SIZE = 1024
+
+# shapes of the sql of a row merged by --extended-insert
+INSERT_SHAPES = frozenset(['INSERT INTO', 'INSERT IGNORE INTO', 'REPLACE INTO'])
+
+
+class SqlBatch(object):
+    """Merge the statements of consecutive rows of the same table into one statement.
+
+    With extended_insert the INSERT rows become one extended INSERT, with batch_delete the DELETE rows of
+    --only-primary-key become one DELETE ... WHERE pk IN (...). Rows are merged while they have the same table and
+    columns, belong to the same transaction (unless merge_transactions) and the statement stays below max_size bytes.
+    Any other statement ends the batch, add returns the finished statements in order. With reverse the rows are
+    written last first, for flashback sql which is reversed line by line afterwards.
+
+    The rows are merged from the pattern concat_sql_from_binlog_event returns with return_pattern: the head of the
+    sql template, the escaped values and the parts of the comment, the sql is never parsed.
+    """
+
+    def __init__(self, max_size=DEFAULT_EXTENDED_INSERT_SIZE, merge_transactions=False, reverse=False,
+                 extended_insert=True, batch_delete=False):
+        self.max_size = max_size
+        self.merge_transactions = merge_transactions
+        self.reverse = reverse
+        self.extended_insert = extended_insert
+        self.batch_delete = batch_delete
+        self.items = []
+        self.key = None
+        self.size = 0
+        self.kind = self.head = self.columns = self.key_columns = self.first_literals = None
+        self.db = self.table = self.start = self.end = self.rest = None
+
+    def fit_packet(self, max_allowed_packet):
+        """Keep the statements below the max_allowed_packet of the server they are executed on"""
+        self.max_size = min(self.max_size, max_allowed_packet - PACKET_RESERVED_SIZE)
+
+    def add(self, sql, db, table, transaction=None, pattern=None):
+        """Add the sql of a row of a rows event and its pattern, return the finished statements as (sql, db, table)"""
+        statement = self.get_item(pattern) if pattern is not None else None
+        if statement is None:
+            return self.flush() + [(sql, db, table)]
+
+        kind, columns, item = statement
+        head = pattern['head']
+        key = (kind, head, columns, None if self.merge_transactions else transaction)
+        item_size = len(item.encode('utf8')) + 2
+        finished = []
+        if self.items and (key != self.key or self.size + item_size > self.max_size):
+            finished = self.flush()
+        if not self.items:
+            self.key, self.kind, self.head, self.columns = key, kind, head, columns
+            self.key_columns, self.first_literals = pattern['key_columns'], pattern['literals']
+            self.db, self.table, self.start, self.rest = db, table, pattern['start'], pattern['rest']
+            self.size = len(head.encode('utf8')) + 1
+            if columns is not None:
+                # IN (...) LIMIT n
+                self.size += len(columns.encode('utf8')) + 24
+        self.items.append(item)
+        self.size += item_size
+        self.end = pattern['end']
+        return finished
+
+    def get_item(self, pattern):
+        """(kind, columns of IN, item) of a row which can be merged, None if it can not"""
+        shape, literals = pattern['shape'], pattern['literals']
+        if self.extended_insert and shape in INSERT_SHAPES:
+            return 'INSERT', None, '(%s)' % ', '.join(literals)
+        key_columns = pattern['key_columns']
+        if not self.batch_delete or shape != 'DELETE' or not key_columns:
+            return None
+        if None in pattern['values']:
+            # the row is deleted with IS NULL, which IN does not match
+            return None
+        if len(key_columns) == 1:
+            return 'DELETE', '`%s`' % key_columns[0], literals[0]
+        return 'DELETE', '(%s)' % ', '.join('`%s`' % k for k in key_columns), '(%s)' % ', '.join(literals)
+
+    def flush(self):
+        """Return the statement of the rows added so far, as a list like add"""
+        if not self.items:
+            return []
+        items = list(reversed(self.items)) if self.reverse else self.items
+        if self.kind == 'INSERT':
+            sql = self.head + ', '.join(items) + ';'
+        elif len(items) == 1:
+            # the DELETE of one row stays the one of its sql
+            sql = self.head + ' AND '.join('`%s`=%s' % (k, literal)
+                                           for k, literal in zip(self.key_columns, self.first_literals)) + ' LIMIT 1;'
+        else:
+            sql = '%s%s IN (%s) LIMIT %d;' % (self.head, self.columns, ', '.join(items), len(items))
+        if self.start is not None:
+            sql += ' #start %s end %s%s' % (self.start, self.end, self.rest)
+        self.items = []
+        return [(sql, self.db, self.table)]
+
+    def discard(self):
+        self.items = []
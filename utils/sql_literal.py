@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Render python values as mysql literals without a connection, the output is the same as cursor.mogrify of pymysql.
+
+With hex_bytes the values of binary columns are rendered as unquoted hex literals (0x...) instead of quoted strings.
+
+Values are escaped as python str before they are encoded, so the result is safe for every connection charset,
+including the multibyte ones (gbk, big5, sjis) whose second byte can be a backslash.
+"""
+import datetime
+import decimal
+from pymysql.converters import escape_item, escape_bytes, escape_timedelta
+
+# the same table as pymysql.converters uses for strings
+_escape_table = [chr(x) for x in range(128)]
+_escape_table[0] = '\\0'
+_escape_table[ord('\\')] = '\\\\'
+_escape_table[ord('\n')] = '\\n'
+_escape_table[ord('\r')] = '\\r'
+_escape_table[ord('\032')] = '\\Z'
+_escape_table[ord('"')] = '\\"'
+_escape_table[ord("'")] = "\\'"
+
+
+def escape_str(value):
+    return "'" + value.translate(_escape_table) + "'"
+
+
+def escape_str_no_backslash(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def escape_bytes_no_backslash(value):
+    return "'" + value.replace(b"'", b"''").decode('ascii', 'surrogateescape') + "'"
+
+
+def escape_bytes_hex(value):
+    return '0x' + value.hex().upper() if value else "''"
+
+
+def escape_datetime(value):
+    if value.tzinfo is not None:
+        return escape_item(value, 'utf8mb4')
+    return "'" + value.isoformat(' ') + "'"
+
+
+def escape_date(value):
+    return "'" + value.isoformat() + "'"
+
+
+def escape_time(value):
+    if value.tzinfo is not None:
+        return escape_item(value, 'utf8mb4')
+    return "'" + value.isoformat() + "'"
+
+
+def escape_float(value):
+    return '%.15g' % value
+
+
+def escape_bool(value):
+    return str(int(value))
+
+
+def escape_none(value):
+    return 'NULL'
+
+
+# fast paths by exact type, everything else (sets, tuples, subclasses ...) goes to pymysql.converters
+ENCODERS = {
+    str: escape_str,
+    int: str,
+    type(None): escape_none,
+    decimal.Decimal: str,
+    datetime.datetime: escape_datetime,
+    datetime.date: escape_date,
+    datetime.time: escape_time,
+    datetime.timedelta: escape_timedelta,
+    float: escape_float,
+    bool: escape_bool,
+    bytes: escape_bytes,
+    bytearray: escape_bytes,
+}
+# sql_mode NO_BACKSLASH_ESCAPES only changes how quotes in strings are escaped
+NO_BACKSLASH_ENCODERS = dict(ENCODERS)
+NO_BACKSLASH_ENCODERS.update({str: escape_str_no_backslash, bytes: escape_bytes_no_backslash,
+                              bytearray: escape_bytes_no_backslash})
+HEX_BYTES = {bytes: escape_bytes_hex, bytearray: escape_bytes_hex}
+# encoders by (no_backslash_escapes, hex_bytes)
+ENCODER_TABLES = {
+    (False, False): ENCODERS,
+    (True, False): NO_BACKSLASH_ENCODERS,
+    (False, True): {**ENCODERS, **HEX_BYTES},
+    (True, True): {**NO_BACKSLASH_ENCODERS, **HEX_BYTES},
+}
+
+
+def escape_literal(value, no_backslash_escapes=False, hex_bytes=False):
+    """Escape one value like pymysql Connection.literal"""
+    encoders = ENCODER_TABLES[no_backslash_escapes, hex_bytes]
+    encoder = encoders.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    if isinstance(value, str):
+        return encoders[str](value)
+    if isinstance(value, (bytes, bytearray)):
+        return encoders[bytes](value)
+    return escape_item(value, 'utf8mb4')
+
+
+def render_literals(values, no_backslash_escapes=False, hex_bytes=False):
+    """The escaped values, like Connection.literal of every value"""
+    get_encoder = ENCODER_TABLES[no_backslash_escapes, hex_bytes].get
+    literals = []
+    for value in values:
+        encoder = get_encoder(type(value))
+        literals.append(encoder(value) if encoder is not None else
+                        escape_literal(value, no_backslash_escapes, hex_bytes))
+    return literals
+
+
+def render_sql(template, values, no_backslash_escapes=False, hex_bytes=False):
+    """Fill the %s placeholders of template with the escaped values, like cursor.mogrify(template, values)"""
+    return template % tuple(render_literals(values, no_backslash_escapes, hex_bytes))
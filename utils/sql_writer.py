@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import queue
+import sys
+import threading
+
+# characters of sql collected before they are handed to the writer thread
+SQL_WRITER_BUFFER_SIZE = 1024 * 1024
+# chunks waiting for the writer thread, more block the parsing until the file (or the pipe of stdout) takes them
+SQL_WRITER_QUEUE_SIZE = 8
+
+
+class SqlWriter(object):
+    """Write the result sql to a file or stdout on a background thread, so parsing goes on while it is written.
+
+    The statements are collected into chunks of about buffer_size characters, which the thread joins with new
+    lines and writes with one write and flush each. An error of the thread is raised by the next write, flush or
+    close. The thread is started by the first chunk, a writer which gets no sql costs nothing.
+    """
+
+    def __init__(self, f=None, buffer_size=SQL_WRITER_BUFFER_SIZE, queue_size=SQL_WRITER_QUEUE_SIZE):
+        self.f = f if f is not None else sys.stdout
+        self.buffer_size = buffer_size
+        self.chunk = []
+        self.size = 0
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+        self.error = None
+
+    def write(self, sql):
+        """Write sql and a new line"""
+        self.chunk.append(sql)
+        self.size += len(sql)
+        if self.size >= self.buffer_size:
+            self.hand_over()
+
+    def hand_over(self):
+        if self.error is not None:
+            raise self.error
+        if not self.chunk:
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='sql-writer', daemon=True)
+            self.thread.start()
+        self.queue.put(self.chunk)
+        self.chunk = []
+        self.size = 0
+
+    def run(self):
+        while True:
+            chunk = self.queue.get()
+            try:
+                if chunk is None:
+                    return
+                if self.error is None:
+                    self.f.write('\n'.join(chunk) + '\n')
+                    self.f.flush()
+            except Exception as e:
+                # the chunks after the error are dropped, parsing stops at the next hand over
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def flush(self, wait=False):
+        """Hand the sql collected so far to the writer thread, with wait until it is written"""
+        self.hand_over()
+        if wait and self.thread is not None:
+            self.queue.join()
+            if self.error is not None:
+                raise self.error
+
+    def close(self):
+        """Write the rest of the sql and stop the thread, the file is left open"""
+        try:
+            self.hand_over()
+        finally:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        # keep the sql parsed before the error, the error raised is the one of the parsing
+        try:
+            self.close()
+        except Exception:
+            pass
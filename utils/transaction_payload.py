@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import struct
+from io import BytesIO
+from pymysqlreplication import BinLogStreamReader
+from pymysqlreplication.constants.BINLOG import TABLE_MAP_EVENT
+from pymysqlreplication.event import BinLogEvent
+from pymysqlreplication.packet import BinLogPacketWrapper
+from pymysqlreplication.row_event import TableMapEvent
+from .binlog2sql_util import query_unique_keys
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# MySQL 8.0.20+ writes a whole transaction as one event when binlog_transaction_compression=ON
+TRANSACTION_PAYLOAD_EVENT = 40
+
+# fields of the payload header
+OTW_PAYLOAD_HEADER_END_MARK = 0
+OTW_PAYLOAD_SIZE_FIELD = 1
+OTW_PAYLOAD_COMPRESSION_TYPE_FIELD = 2
+OTW_PAYLOAD_UNCOMPRESSED_SIZE_FIELD = 3
+
+COMPRESSION_ZSTD = 0
+COMPRESSION_NONE = 255
+
+
+def read_net_field_length(buf, pos):
+    """Return (value, next pos) of a packed integer"""
+    c = buf[pos]
+    if c < 251:
+        return c, pos + 1
+    elif c == 252:
+        return struct.unpack_from('<H', buf, pos + 1)[0], pos + 3
+    elif c == 253:
+        return struct.unpack_from('<I', buf[pos + 1:pos + 4] + b'\x00')[0], pos + 4
+    return struct.unpack_from('<Q', buf, pos + 1)[0], pos + 9
+
+
+def read_payload_header(buf, pos, end):
+    """Return (compression type, payload start, payload end) of the body of a transaction payload event"""
+    compression_type = COMPRESSION_ZSTD
+    payload_size = None
+    while pos < end:
+        field_type, pos = read_net_field_length(buf, pos)
+        if field_type == OTW_PAYLOAD_HEADER_END_MARK:
+            break
+        field_length, pos = read_net_field_length(buf, pos)
+        value, _ = read_net_field_length(buf, pos)
+        pos += field_length
+        if field_type == OTW_PAYLOAD_COMPRESSION_TYPE_FIELD:
+            compression_type = value
+        elif field_type == OTW_PAYLOAD_SIZE_FIELD:
+            payload_size = value
+    payload_end = min(pos + payload_size, end) if payload_size is not None else end
+    return compression_type, pos, payload_end
+
+
+def read_exactly(stream, size):
+    data = stream.read(size)
+    while data and len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def iter_payload_events(payload, compression_type, log_pos):
+    """Decompress the payload as a stream and yield its events one by one.
+
+    Every event is prefixed with a dummy OK byte like a network packet, and gets the log_pos of the payload event,
+    inner events have no log_pos and no checksum of their own.
+    """
+    if compression_type == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ImportError('Could not decompress transaction payload event, please install zstandard: '
+                              'pip install zstandard')
+        stream = zstandard.ZstdDecompressor().stream_reader(BytesIO(payload), read_across_frames=True)
+    elif compression_type == COMPRESSION_NONE:
+        stream = BytesIO(payload)
+    else:
+        raise ValueError(f'Unknown compression type {compression_type} of transaction payload event')
+
+    with stream:
+        while True:
+            header = read_exactly(stream, 19)
+            if len(header) < 19:
+                break
+            event_size = struct.unpack_from('<I', header, 9)[0]
+            event = bytearray(b'\x00') + header + read_exactly(stream, event_size - 19)
+            struct.pack_into('<I', event, 1 + 13, log_pos)
+            yield event
+
+
+class PayloadPacket(BytesIO):
+    def advance(self, length):
+        self.seek(self.tell() + length)
+
+
+class TransactionPayloadEvent(BinLogEvent):
+    """Transaction payload event of the replication stream, self.packets yields the packets of its events while
+    the payload is decompressed, the reader decodes them one at a time"""
+
+    def __init__(self, from_packet, event_size, table_map, ctl_connection, **kwargs):
+        super(TransactionPayloadEvent, self).__init__(from_packet, event_size, table_map, ctl_connection, **kwargs)
+        body = self.packet.read(event_size)
+        compression_type, payload_start, payload_end = read_payload_header(body, 0, len(body))
+        self.packets = iter_payload_events(body[payload_start:payload_end], compression_type, self.packet.log_pos)
+
+
+# let BinLogPacketWrapper build TransactionPayloadEvent instead of NotImplementedEvent
+BinLogPacketWrapper._BinLogPacketWrapper__event_map[TRANSACTION_PAYLOAD_EVENT] = TransactionPayloadEvent
+
+
+class PayloadBinLogStreamReader(BinLogStreamReader):
+    """BinLogStreamReader which returns the events inside transaction payload events.
+
+    preloaded_tables, {(schema, table): columns} read at startup, answers the first lookup of every table,
+    later lookups (after a rotate cleared the table map) query information_schema again to see schema changes.
+    """
+
+    def __init__(self, *args, preloaded_tables=None, **kwargs):
+        # packets of the transaction payload event being read
+        self.__payload_packets = None
+        self.__preloaded_tables = dict(preloaded_tables) if preloaded_tables else {}
+        super(PayloadBinLogStreamReader, self).__init__(*args, **kwargs)
+
+    def _BinLogStreamReader__get_table_information(self, schema, table):
+        columns = self.__preloaded_tables.pop((schema, table), None)
+        if columns is not None:
+            return columns
+        return super(PayloadBinLogStreamReader, self)._BinLogStreamReader__get_table_information(schema, table)
+
+    def _BinLogStreamReader__connect_to_ctl(self):
+        super(PayloadBinLogStreamReader, self)._BinLogStreamReader__connect_to_ctl()
+        self._ctl_connection._get_unique_keys = self.__get_unique_keys
+
+    def __get_unique_keys(self, schema, table):
+        return query_unique_keys(self._ctl_connection, schema, table)
+
+    def _allowed_event_list(self, only_events, ignored_events, filter_non_implemented_events):
+        events = super(PayloadBinLogStreamReader, self)._allowed_event_list(
+            only_events, ignored_events, filter_non_implemented_events)
+        self.__allowed_payload_events = events
+        # the table maps are decoded even when not returned, the rows events after them need them
+        self.__allowed_payload_events_in_packet = frozenset([TableMapEvent]).union(events)
+        return events.union([TransactionPayloadEvent])
+
+    def fetchone(self):
+        while True:
+            if self.__payload_packets is None:
+                binlog_event = super(PayloadBinLogStreamReader, self).fetchone()
+                if not isinstance(binlog_event, TransactionPayloadEvent):
+                    return binlog_event
+                self.__payload_packets = binlog_event.packets
+                continue
+
+            packet = next(self.__payload_packets, None)
+            if packet is None:
+                self.__payload_packets = None
+                continue
+            binlog_event = BinLogPacketWrapper(PayloadPacket(packet), self.table_map, self._ctl_connection, False,
+                                               self.__allowed_payload_events_in_packet,
+                                               self._BinLogStreamReader__only_tables,
+                                               self._BinLogStreamReader__ignored_tables,
+                                               self._BinLogStreamReader__only_schemas,
+                                               self._BinLogStreamReader__ignored_schemas,
+                                               self._BinLogStreamReader__freeze_schema,
+                                               self._BinLogStreamReader__fail_on_table_metadata_unavailable)
+            if binlog_event.event is None:
+                continue
+            if binlog_event.event_type == TABLE_MAP_EVENT:
+                self.table_map[binlog_event.event.table_id] = binlog_event.event.get_table()
+            if binlog_event.event.__class__ in self.__allowed_payload_events:
+                return binlog_event.event